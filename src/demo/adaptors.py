@@ -1,8 +1,14 @@
 from __future__ import unicode_literals
 
+import os
+import threading
+import time
+import uuid
 from os.path import join
-import random
+
 from waves.adaptors.galaxy.tool import GalaxyJobAdaptor as BaseGalaxyJobAdaptor
+from waves.wcore.adaptors.const import JobStatus
+from waves.wcore.adaptors.exceptions import AdaptorException
 from waves.wcore.adaptors.cluster import LocalClusterAdaptor as BaseLocalClusterAdaptor
 from waves.wcore.adaptors.cluster import SshClusterAdaptor as BaseSshClusterAdaptor
 from waves.wcore.adaptors.cluster import SshKeyClusterAdaptor as BaseSshKeyClusterAdaptor
@@ -10,20 +16,107 @@ from waves.wcore.adaptors.mocks import MockJobRunnerAdaptor as BaseMockAdaptor
 from waves.wcore.adaptors.shell import LocalShellAdaptor as BaseLocalShellAdaptor
 from waves.wcore.adaptors.shell import SshKeyShellAdaptor as BaseSshKeyShellAdaptor
 from waves.wcore.adaptors.shell import SshShellAdaptor as BaseSshShellAdaptor
+from waves.wcore.adaptors.utils import check_ready
+from waves.wcore.exceptions.jobs import JobInconsistentStateError
+
+from demo.arrays import array_task_id
+from demo.history import add_job_history
+from demo.loadtest import load_test_profile, schedule_job, simulated_exit, simulated_status
+from demo.pool import connection_pool
+from demo.results import results_stage, write_job_results
+from demo.watcher import EXIT_CODE_FILE, exit_status, read_exit_code, write_exit_code
 
 
 class DemoMockConnector(object):
+    valid = True
 
     def get_job(self, job):
         return job
 
+    def close(self):
+        self.valid = False
+
+
+class PooledConnectionMixin(object):
+    """ Connect through runner keyed connection pool. Jobs actions run by waves-core never disconnect their adaptor:
+    connector is given back to pool when each operation ends, closed as broken if operation raised an adaptor error """
+
+    @property
+    def pool_key(self):
+        return '%s:%s://%s@%s:%s' % (self.__class__.__name__, self.protocol, getattr(self, 'user_id', None),
+                                    self.host, getattr(self, 'port', None))
+
+    def _open_connector(self):
+        super(PooledConnectionMixin, self)._connect()
+        return self.connector
+
+    def _connect(self):
+        self.connector = connection_pool.acquire(self.pool_key, self._open_connector)
+        self._connected = True
+
+    def _disconnect(self):
+        self._release()
+
+    def _release(self, broken=False):
+        if self.connected:
+            connection_pool.release(self.pool_key, self.connector, broken)
+        self.connector = None
+        self._connected = False
+
+    def _pooled(self, operation, *args):
+        """ Run adaptor operation, release connector it acquired once done """
+        if self.connected:
+            # connector acquired by caller, released by it
+            return operation(*args)
+        broken = False
+        try:
+            return operation(*args)
+        except AdaptorException:
+            broken = True
+            raise
+        finally:
+            self._release(broken)
+
+    def prepare_job(self, job):
+        return self._pooled(super(PooledConnectionMixin, self).prepare_job, job)
+
+    def run_job(self, job):
+        return self._pooled(super(PooledConnectionMixin, self).run_job, job)
+
+    def run_jobs(self, jobs):
+        return self._pooled(super(PooledConnectionMixin, self).run_jobs, jobs)
+
+    def cancel_job(self, job):
+        return self._pooled(super(PooledConnectionMixin, self).cancel_job, job)
+
+    def job_status(self, job):
+        return self._pooled(super(PooledConnectionMixin, self).job_status, job)
+
+    def jobs_status(self, jobs):
+        return self._pooled(super(PooledConnectionMixin, self).jobs_status, jobs)
+
+    def job_results(self, job):
+        return self._pooled(super(PooledConnectionMixin, self).job_results, job)
+
+    def job_run_details(self, job):
+        return self._pooled(super(PooledConnectionMixin, self).job_run_details, job)
+
 
 class WavesDemoAdaptor(BaseMockAdaptor):
+    #: Results may be written ahead for a batch of jobs by daemon
+    stage_results = True
+    #: Status for all jobs of a runner may be retrieved with one remote call (see jobs_status)
+    bulk_status = True
+    #: Job end is detected from its working directory (see demo.watcher), its status is not polled
+    watch_completion = False
+    #: Prepared jobs may be submitted together as one array job (see demo.arrays)
+    array_jobs = False
 
     def get_command_line(self, obj):
         """ Retrieve command line normally executed on remote platform """
-        if obj.adaptor:
-            return "%s %s" % (obj.adaptor.command, obj.command_line)
+        adaptor = obj.adaptor
+        if adaptor:
+            return "%s %s" % (adaptor.command, obj.command_line)
         else:
             return "Unavailable %s" % obj.command_line
 
@@ -38,23 +131,93 @@ class WavesDemoAdaptor(BaseMockAdaptor):
         self.job = None
         self.command = 'mock_command' or command
 
+    @staticmethod
+    def _remote_call(profile):
+        """ Simulate remote call latency in load test mode """
+        if profile['POLL_LATENCY'] > 0:
+            time.sleep(profile['POLL_LATENCY'])
+
     def _job_status(self, job):
         """ Mocking job status """
         job.logger.info('Mock job status -- Demo -- ')
-        job.job_history.create(message='[Fake job status -- Demo -- ]'.format(job.slug), status=job.status)
+        add_job_history(job, '[Fake job status -- Demo -- ]')
+        profile = load_test_profile()
+        if profile is not None:
+            self._remote_call(profile)
+            return simulated_status(job)
         return super(WavesDemoAdaptor, self)._job_status(job)
 
+    def _jobs_status(self, jobs):
+        """ Mocking a scheduler listing (qstat -t / squeue like): remote status for several jobs in one call, keyed
+        by remote id (array jobs listed per task), mapped back to jobs
+
+        :return: dict job pk: remote status
+        """
+        profile = load_test_profile()
+        if profile is not None:
+            self._remote_call(profile)
+            listing = {job.remote_job_id: simulated_status(job) for job in jobs}
+        else:
+            # one mocked remote call for all jobs
+            time.sleep(2)
+            listing = {job.remote_job_id: JobStatus.JOB_COMPLETED if job.status == JobStatus.JOB_RUNNING
+                       else job.next_status for job in jobs}
+        return {job.pk: listing.get(job.remote_job_id, JobStatus.JOB_UNDEFINED) for job in jobs}
+
+    def jobs_status(self, jobs):
+        """ Current WAVES status for several jobs run by this adaptor, retrieved with one remote call
+
+        :return: dict job pk: status
+        """
+        self.connect()
+        return {pk: self._states_map.get(status, JobStatus.JOB_UNDEFINED)
+                for pk, status in self._jobs_status(jobs).items()}
+
     def _run_job(self, job):
         """ Mocking job launch """
         job.logger.info("Entering fake run -- Demo -- ")
-        job.job_history.create(message='[Entering fake run -- Demo -- ]'.format(job.slug), status=job.status)
-        super(WavesDemoAdaptor, self)._run_job(job)
+        add_job_history(job, '[Entering fake run -- Demo -- ]')
+        profile = load_test_profile()
+        if profile is not None:
+            self._remote_call(profile)
+            job.remote_job_id = schedule_job(job, profile)
+        else:
+            super(WavesDemoAdaptor, self)._run_job(job)
         return job
 
+    @check_ready
+    def run_jobs(self, jobs):
+        """ Launch several prepared jobs as one array job, each job remote id is then its array task id """
+        for job in jobs:
+            if job.status != JobStatus.JOB_PREPARED:
+                raise JobInconsistentStateError(job=job, expected=[JobStatus.STATUS_LIST[2]])
+        self.connect()
+        self._run_array(jobs)
+        for job in jobs:
+            job.status = JobStatus.JOB_QUEUED
+        return jobs
+
+    def _run_array(self, jobs):
+        """ Mocking an array job submission (qsub -t / sbatch --array like): one remote call, one task per job """
+        array_id = uuid.uuid4().hex[:12]
+        profile = load_test_profile()
+        if profile is not None:
+            self._remote_call(profile)
+        else:
+            time.sleep(2)
+        for task, job in enumerate(jobs, 1):
+            add_job_history(job, '[Entering fake array run -- Demo -- ]')
+            task_id = array_task_id(array_id, task)
+            job.remote_job_id = schedule_job(job, profile, task_id) if profile is not None else task_id
+        return jobs
+
     def _prepare_job(self, job):
         """ Mocking job preparation """
         job.logger.info("Entering fake prepare -- Demo -- ")
-        job.job_history.create(message='[Entering fake prepare -- Demo -- ]'.format(job.slug), status=job.status)
+        add_job_history(job, '[Entering fake prepare -- Demo -- ]')
+        profile = load_test_profile()
+        if profile is not None:
+            self._remote_call(profile)
         return job
 
     def _job_run_details(self, job):
@@ -62,44 +225,89 @@ class WavesDemoAdaptor(BaseMockAdaptor):
         return job.default_run_details()
 
     def _job_results(self, job):
-        """ Mocking job results, add basic command line to standard output,
-         Randomly set stderr output to see warnings happen
-         """
-        for output in job.outputs.all():
-            if output.value != job.stderr or (random.randint(0, 3) > 2):
-                with open(join(output.file_path), 'w') as fp:
-                    fp.write("Should contain expected content for {} ".format(output.name))
-
-        with open(join(job.working_dir, job.stdout), 'w') as fp:
-            fp.write("Executed command on computing infrastructure : {}".format(self.get_command_line(job)))
+        """ Mocking job results, files may have been already written for a batch of jobs (see demo.results) """
+        if not results_stage.consume(job):
+            timing = write_job_results(job, self.get_command_line(job))
+            job.logger.debug("Results written: %i file(s), %i bytes in %.3fs", *timing)
         return True
 
 
-class SshShellAdaptor(WavesDemoAdaptor, BaseSshShellAdaptor):
-    pass
+class LocalProcessMixin(object):
+    """ Local adaptors: job process writes its exit code in job working directory when it ends (simulated here with a
+    timer, at load test schedule end or right after launch) """
+    watch_completion = True
 
+    @staticmethod
+    def _clear_exit_code(job):
+        exit_file = join(job.working_dir, EXIT_CODE_FILE)
+        if os.path.exists(exit_file):
+            # previous run
+            os.remove(exit_file)
 
-class LocalClusterAdaptor(WavesDemoAdaptor, BaseLocalClusterAdaptor):
-    pass
+    @staticmethod
+    def _start_process(job):
+        delay, exit_code = simulated_exit(job) or (0, 0)
+        process = threading.Timer(delay, write_exit_code, (job.working_dir, exit_code))
+        process.daemon = True
+        process.start()
+
+    def _run_job(self, job):
+        self._clear_exit_code(job)
+        job = super(LocalProcessMixin, self)._run_job(job)
+        self._start_process(job)
+        return job
 
+    def _run_array(self, jobs):
+        for job in jobs:
+            self._clear_exit_code(job)
+        jobs = super(LocalProcessMixin, self)._run_array(jobs)
+        for job in jobs:
+            self._start_process(job)
+        return jobs
 
-class SshKeyShellAdaptor(WavesDemoAdaptor, BaseSshKeyShellAdaptor):
-    pass
+    def _job_status(self, job):
+        exit_code = read_exit_code(job.working_dir)
+        if exit_code is not None:
+            return exit_status(exit_code)
+        return super(LocalProcessMixin, self)._job_status(job)
 
+    def _jobs_status(self, jobs):
+        statuses = super(LocalProcessMixin, self)._jobs_status(jobs)
+        for job in jobs:
+            exit_code = read_exit_code(job.working_dir)
+            if exit_code is not None:
+                statuses[job.pk] = exit_status(exit_code)
+        return statuses
 
-class LocalShellAdaptor(WavesDemoAdaptor, BaseLocalShellAdaptor):
+
+class SshShellAdaptor(PooledConnectionMixin, WavesDemoAdaptor, BaseSshShellAdaptor):
     pass
 
 
-class SshClusterAdaptor(WavesDemoAdaptor, BaseSshClusterAdaptor):
+class LocalClusterAdaptor(LocalProcessMixin, WavesDemoAdaptor, BaseLocalClusterAdaptor):
+    array_jobs = True
+
+
+class SshKeyShellAdaptor(PooledConnectionMixin, WavesDemoAdaptor, BaseSshKeyShellAdaptor):
     pass
 
 
-class SshKeyClusterAdaptor(WavesDemoAdaptor, BaseSshKeyClusterAdaptor):
+class LocalShellAdaptor(LocalProcessMixin, WavesDemoAdaptor, BaseLocalShellAdaptor):
     pass
 
 
+class SshClusterAdaptor(PooledConnectionMixin, WavesDemoAdaptor, BaseSshClusterAdaptor):
+    array_jobs = True
+
+
+class SshKeyClusterAdaptor(PooledConnectionMixin, WavesDemoAdaptor, BaseSshKeyClusterAdaptor):
+    array_jobs = True
+
+
 class GalaxyJobAdaptor(BaseGalaxyJobAdaptor, WavesDemoAdaptor):
+    stage_results = False
+    bulk_status = False
+
     def _prepare_job(self, job):
         """ Mocking job remote preparation """
         return WavesDemoAdaptor._prepare_job(self, job)
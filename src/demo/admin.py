@@ -76,8 +76,12 @@ class ServiceCategoryAdmin(admin.ModelAdmin):
         """ Truncate short description in list display """
         return truncatechars(obj.short_description, 100)
 
+    def get_queryset(self, request):
+        """ Annotate categories with their recursive services count in list query """
+        return ServiceCategory.objects.with_services_count(super(ServiceCategoryAdmin, self).get_queryset(request))
+
     def count_serv(self, obj):
-        return obj.category_tools.count()
+        return obj.services_count
 
     short.short_description = "Description"
     count_serv.short_description = "Services"
@@ -11,6 +11,13 @@ from django.core.checks import Warning, register, Error
 class WavesDemoConfig(AppConfig):
     name = 'demo'
 
+    def ready(self):
+        from . import signals  # noqa
+        from .jobdirs import install_resolver
+        from .loader import install_job_adaptor
+        install_resolver()
+        install_job_adaptor()
+
 
 @register()
 def check_waves_config(app_configs=('demo'), **kwargs):
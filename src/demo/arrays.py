@@ -0,0 +1,107 @@
+""" Array jobs submission for cluster adaptors
+
+Cluster adaptors submit each job to their scheduler on its own. When 'ARRAY_JOBS' setting is set, demo daemon holds
+prepared jobs of array capable runners (adaptors with 'array_jobs' set), grouped per service and runner: a group is
+submitted as one array job (one scheduler call, 'qsub -t 1-N' like) once its oldest job waited 'ARRAY_JOBS_WINDOW'
+seconds, or as soon as it reaches 'ARRAY_JOBS_MAX' jobs. Each job remote id is then its array task id
+('<array id>[<task>]'), status and results stay per job: scheduler listings report array tasks, mapped back to jobs.
+"""
+from __future__ import unicode_literals
+
+import logging
+import re
+import time
+from collections import OrderedDict
+
+from waves.wcore.adaptors.const import JobStatus
+from waves.wcore.adaptors.exceptions import AdaptorException
+
+from demo.loader import adaptor_cache
+from demo.settings import demo_settings
+
+logger = logging.getLogger('waves.daemon')
+
+__all__ = ['array_task_id', 'parse_array_task', 'ArrayBatcher', 'launch_array']
+
+_ARRAY_TASK = re.compile(r'^(?P<array>[^\[\]:]+)\[(?P<task>\d+)\]')
+
+
+def array_task_id(array_id, task):
+    """ Remote id for an array task """
+    return '%s[%i]' % (array_id, task)
+
+
+def parse_array_task(remote_job_id):
+    """ Array id and task index from job remote id, None if job was not submitted in an array """
+    match = _ARRAY_TASK.match(remote_job_id or '')
+    if match is None:
+        return None
+    return match.group('array'), int(match.group('task'))
+
+
+class ArrayBatcher(object):
+    """ Hold prepared jobs per service and runner, release them in batches """
+
+    def __init__(self, window=None, max_size=None, clock=time.time):
+        self.window = demo_settings.ARRAY_JOBS_WINDOW if window is None else window
+        self.max_size = max_size or demo_settings.ARRAY_JOBS_MAX
+        self.clock = clock
+        self._waiting = {}
+        self._array_jobs = {}
+        self.stats = dict(arrays=0, jobs=0)
+
+    def is_array_capable(self, job):
+        """ Whether job runner submits array jobs """
+        if job._adaptor not in self._array_jobs:
+            self._array_jobs[job._adaptor] = getattr(adaptor_cache.for_job(job), 'array_jobs', False)
+        return self._array_jobs[job._adaptor]
+
+    def collect(self, jobs):
+        """ Group prepared jobs of array capable runners
+
+        :return: batches to launch now (lists of jobs), ids of held jobs
+        """
+        now = self.clock()
+        groups = OrderedDict()
+        for job in jobs:
+            if job.status == JobStatus.JOB_PREPARED and job._adaptor and self.is_array_capable(job):
+                self._waiting.setdefault(job.pk, now)
+                groups.setdefault((job.service, job._adaptor), []).append(job)
+        pending = set(job.pk for group in groups.values() for job in group)
+        for pk in [pk for pk in self._waiting if pk not in pending]:
+            del self._waiting[pk]
+        batches = []
+        held = set()
+        for group in groups.values():
+            group.sort(key=lambda j: j.pk)
+            while len(group) >= self.max_size:
+                batches.append(group[:self.max_size])
+                group = group[self.max_size:]
+            if group and now - min(self._waiting[job.pk] for job in group) >= self.window:
+                batches.append(group)
+            else:
+                held.update(job.pk for job in group)
+        for batch in batches:
+            for job in batch:
+                del self._waiting[job.pk]
+            self.stats['arrays'] += 1
+            self.stats['jobs'] += len(batch)
+        return batches, held
+
+
+def launch_array(jobs):
+    """ Launch prepared jobs (same service and runner) as one array job, as Job.run_launch does for each job """
+    adaptor = adaptor_cache.for_job(jobs[0])
+    try:
+        adaptor.run_jobs(jobs)
+        for job in jobs:
+            job.nb_retry = 0
+    except AdaptorException as exc:
+        logger.error('Array launch failed for %i job(s) (adapter:%s): %s', len(jobs), adaptor, exc.message)
+        for job in jobs:
+            job.retry(exc.message)
+    finally:
+        adaptor.disconnect()
+        for job in jobs:
+            job.save()
+    return jobs
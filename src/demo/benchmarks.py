@@ -0,0 +1,580 @@
+""" WAVES demo benchmarks, run with './manage.py demo_bench <name>'
+
+Benchmarks run against configured database inside a rolled back transaction, jobs working dirs are created in a
+temporary directory removed afterwards.
+"""
+from __future__ import unicode_literals
+
+import heapq
+import math
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from waves.wcore.adaptors.const import JobStatus
+from waves.wcore.models import Job, JobOutput, get_service_model
+from waves.wcore.models.history import JobHistory
+from waves.wcore.models.runners import Runner
+
+from demo.adaptors import WavesDemoAdaptor
+from demo.daemon import DemoJobQueueRunDaemon
+from demo.fairshare import FairShareScheduler
+from demo.history import history_writer
+from demo.jobdirs import flat_dir, sharded_dir
+from demo.loader import adaptor_cache
+from demo.results import ResultsStage
+from demo.settings import demo_settings
+from demo.workers import WorkerPool
+from profiles.auth import APIKeyAuthBackend, api_key_cache
+
+__all__ = ['BENCHMARKS', 'benchmark', 'bench_environment', 'create_jobs', 'count_statements', 'percentile',
+           'LoadTest', 'run_lease_daemons', 'duplicated_transitions']
+
+#: Registered benchmarks, name: function returning a list of result rows (dict)
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    """ Register a benchmark function """
+
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return decorator
+
+
+@contextmanager
+def bench_environment(rollback=True):
+    """ Run benchmark in a rolled back transaction (unless rollback is False) with a temporary jobs base dir """
+    job_dir = tempfile.mkdtemp(prefix='waves_bench_')
+    waves_core = dict(getattr(settings, 'WAVES_CORE', {}), JOB_BASE_DIR=job_dir)
+    try:
+        with override_settings(WAVES_CORE=waves_core):
+            if rollback:
+                with transaction.atomic():
+                    yield job_dir
+                    transaction.set_rollback(True)
+            else:
+                yield job_dir
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+
+def demo_settings_override(**kwargs):
+    """ Override some WAVES_DEMO settings """
+    return override_settings(WAVES_DEMO=dict(getattr(settings, 'WAVES_DEMO', {}), **kwargs))
+
+
+def create_jobs(count, status=JobStatus.JOB_RUNNING, **kwargs):
+    """ Create 'count' jobs without submission """
+    return [Job.objects.create(service='Benchmark', title='Benchmark job %i' % i, _status=status, **kwargs)
+            for i in range(count)]
+
+
+def count_statements(queries_context, statement, table=None):
+    """ Count captured queries starting with 'statement' (INSERT, UPDATE...), optionally for table """
+    count = 0
+    for query in queries_context.captured_queries:
+        sql = query['sql'].lstrip().upper()
+        if sql.startswith(statement.upper()) and (table is None or table.upper() in sql):
+            count += 1
+    return count
+
+
+def percentile(values, percent):
+    """ Nearest rank percentile for values """
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[max(0, int(math.ceil(percent / 100.0 * len(values))) - 1)]
+
+
+class LoadTest(DemoJobQueueRunDaemon):
+    """ Submit jobs and drive them through their lifecycle with demo daemon cycles, collecting metrics: lifecycle
+    latencies and queries per status transition (bulk polled jobs share their poll queries) """
+
+    def __init__(self, submissions, interval=1, timeout=600):
+        super(LoadTest, self).__init__(pidfile=tempfile.mktemp(prefix='waves_demo_load_'))
+        self.submissions = submissions
+        self.interval = interval
+        self.timeout = timeout
+        self.submitted = {}
+        self.latencies = []
+        self.final_status = {}
+        self.transitions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, transition, queries):
+        with self._lock:
+            count, total = self.transitions.get(transition, (0, 0))
+            self.transitions[transition] = (count + 1, total + queries)
+
+    def record_job(self, job, status, queries, suffix=''):
+        self.record('%s -> %s%s' % (JobStatus.STATUS_MAP.get(status), JobStatus.STATUS_MAP.get(job.status), suffix),
+                    queries)
+        with self._lock:
+            if job.status >= JobStatus.JOB_TERMINATED and job.pk not in self.final_status:
+                self.final_status[job.pk] = job.status
+                self.latencies.append(time.time() - self.submitted[job.pk])
+
+    def submit(self, count):
+        """ Submit count jobs, round robin over submissions """
+        for i in range(count):
+            submission = self.submissions[i % len(self.submissions)]
+            with CaptureQueriesContext(connection) as ctx:
+                job = Job.objects.create_from_submission(submission, submitted_inputs={})
+            self.record('submitted', len(ctx.captured_queries))
+            self.submitted[job.pk] = time.time()
+
+    def run(self, count):
+        """ Submit then process jobs until all are finished (or timeout)
+
+        :return: wall clock seconds
+        """
+        start = time.time()
+        self.submit(count)
+        while len(self.final_status) < len(self.submitted) and time.time() - start < self.timeout:
+            self.run_cycle([job for job in self.get_jobs().filter(pk__gte=min(self.submitted))
+                            if job.pk in self.submitted])
+            self.wait(self.interval)
+        return time.time() - start
+
+    def delete_jobs(self):
+        """ Delete submitted jobs (when not run in a rolled back transaction) """
+        pks = list(self.submitted.keys())
+        for i in range(0, len(pks), 500):
+            Job.objects.filter(pk__in=pks[i:i + 500]).delete()
+
+    def poll_statuses(self, jobs):
+        before = {job.pk: job.status for job in jobs}
+        with CaptureQueriesContext(connection) as ctx:
+            polled = super(LoadTest, self).poll_statuses(jobs)
+        for job in jobs:
+            if job.pk in polled:
+                self.record_job(job, before[job.pk], len(ctx.captured_queries) / float(len(polled)), ' (bulk)')
+        return polled
+
+    def process_job(self, job):
+        status = job.status
+        with CaptureQueriesContext(connection) as ctx:
+            super(LoadTest, self).process_job(job)
+        self.record_job(job, status, len(ctx.captured_queries))
+
+
+@benchmark('history')
+def bench_history(jobs=1000, cycles=3, **kwargs):
+    """ Job history writes for running jobs status polls (job.run_status, load test mode): one INSERT per poll vs
+    buffered writer """
+    rows = []
+    history_table = JobHistory._meta.db_table
+    with bench_environment(), demo_settings_override(LOAD_TEST={'POLL_LATENCY': 0}):
+        runner = Runner.objects.create(name='Benchmark runner', clazz='demo.adaptors.SshShellAdaptor')
+        service = get_service_model().objects.create(name='Benchmark', api_name='benchmark', runner=runner)
+        # jobs keep running during benchmark
+        remote_id = 'load:0:0:%.3f:ok' % (time.time() + 86400)
+        bench_jobs = create_jobs(jobs, _adaptor=service.default_submission.adaptor.serialize(),
+                                 remote_job_id=remote_id)
+        for buffered in (False, True):
+            history_writer.reset()
+            with demo_settings_override(HISTORY_BUFFERED=buffered), CaptureQueriesContext(connection) as ctx:
+                start = time.time()
+                for _ in range(cycles):
+                    for job in bench_jobs:
+                        job.run_status()
+                    history_writer.flush()
+                elapsed = time.time() - start
+            polls = float(jobs * cycles)
+            rows.append(OrderedDict([
+                ('mode', 'buffered' if buffered else 'direct'),
+                ('polls', int(polls)),
+                ('inserts / 1000 polls', round(count_statements(ctx, 'INSERT', history_table) / polls * 1000, 1)),
+                ('seconds / 1000 polls', round(elapsed / polls * 1000, 3)),
+            ]))
+    return rows
+
+
+@benchmark('api_key')
+def bench_api_key(requests=10000, **kwargs):
+    """ API key authentication: uncached lookups vs in process api key cache (warm) """
+    rows = []
+    with bench_environment():
+        user = get_user_model().objects.create_user(email='benchmark@example.com')
+        user.profile.registered_for_api = True
+        user.save()
+        api_key = user.profile.api_key
+        request = RequestFactory().get('/api/', {'api_key': api_key})
+        backend = APIKeyAuthBackend()
+        for ttl in (0, 60):
+            api_key_cache.clear()
+            with override_settings(API_KEY_CACHE_TTL=ttl):
+                backend.authenticate(request)
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.time()
+                    for _ in range(requests):
+                        backend.authenticate(request)
+                    elapsed = time.time() - start
+            rows.append(OrderedDict([
+                ('mode', 'cached' if ttl else 'uncached'),
+                ('requests', requests),
+                ('queries / request', round(len(ctx.captured_queries) / float(requests), 2)),
+                ('seconds / 1000 requests', round(elapsed / requests * 1000, 3)),
+            ]))
+        api_key_cache.clear()
+    return rows
+
+
+@benchmark('results')
+def bench_results(jobs=1000, size=1, **kwargs):
+    """ Job results files writes: one job after the other vs thread pool staging ('size' MB per job output) """
+    rows = []
+    with bench_environment():
+        bench_jobs = create_jobs(jobs)
+        for job in bench_jobs:
+            JobOutput.objects.create(job=job, _name='Result', value='result', extension='txt', api_name='result')
+        bench_jobs = list(Job.objects.filter(pk__in=[job.pk for job in bench_jobs]))
+        with demo_settings_override(RESULTS_OUTPUT_SIZE=size):
+            for workers in (1, demo_settings.RESULTS_WORKERS):
+                start = time.time()
+                timings = list(ResultsStage(workers=workers).write(
+                    [(job, 'benchmark command') for job in bench_jobs]).values())
+                elapsed = time.time() - start
+                written = sum(timing.bytes for timing in timings) / 1048576.0
+                per_job = [timing.seconds for timing in timings]
+                rows.append(OrderedDict([
+                    ('workers', workers),
+                    ('jobs', len(timings)),
+                    ('MB written', round(written, 1)),
+                    ('MB / s', round(written / elapsed, 1) if elapsed else 0),
+                    ('job p50 (s)', round(percentile(per_job, 50), 4)),
+                    ('job p95 (s)', round(percentile(per_job, 95), 4)),
+                ]))
+    return rows
+
+
+@benchmark('workers')
+def bench_workers(jobs=1000, runners=4, latency=0.05, **kwargs):
+    """ Jobs remote operations (prepare, run, status) with injected latency, first runner hangs once: sequential loop
+    vs worker pool ('WORKERS', 'WORKERS_PER_RUNNER' and 'OPERATION_TIMEOUT' settings) """
+    rows = []
+    hang = max(1.0, latency * 20)
+    # history is kept in memory: worker threads can not see jobs created in benchmark transaction
+    with bench_environment(), demo_settings_override(LOAD_TEST={'POLL_LATENCY': latency}, HISTORY_BUFFERED=True,
+                                                     HISTORY_BUFFER_SIZE=jobs * 4):
+        bench_jobs = create_jobs(jobs, status=JobStatus.JOB_CREATED)
+        adaptors = [WavesDemoAdaptor(host='runner%i' % i) for i in range(runners)]
+
+        def operations(job, runner, hung):
+            adaptor = adaptors[runner]
+
+            def run():
+                if runner == 0:
+                    try:
+                        hung.pop()
+                    except IndexError:
+                        pass
+                    else:
+                        time.sleep(hang)
+                adaptor._prepare_job(job)
+                adaptor._run_job(job)
+                adaptor._job_status(job)
+            return run
+
+        for workers in (0, demo_settings.WORKERS or 8):
+            hung = [True]
+            tasks = [('runner%i' % (i % runners), operations(job, i % runners, hung))
+                     for i, job in enumerate(bench_jobs)]
+            start = time.time()
+            if workers:
+                stats = WorkerPool(workers=workers, timeout=hang / 2).run(tasks)
+            else:
+                stats = dict(done=0, timed_out=0, skipped=0)
+                for key, run in tasks:
+                    run()
+                    stats['done'] += 1
+            elapsed = time.time() - start
+            history_writer.reset()
+            rows.append(OrderedDict([
+                ('mode', 'pool (%i workers)' % workers if workers else 'sequential'),
+                ('jobs', jobs),
+                ('done', stats['done']),
+                ('timed out', stats['timed_out']),
+                ('skipped (hung runner)', stats['skipped']),
+                ('seconds', round(elapsed, 2)),
+                ('jobs / s', round(stats['done'] / elapsed, 1) if elapsed else 0),
+            ]))
+    return rows
+
+
+@contextmanager
+def job_adaptors(cached):
+    """ Jobs adaptors resolved from adaptors cache (see demo.loader), or by waves-core property (built on each access) """
+    installed = Job.__dict__['adaptor']
+    Job.adaptor = installed if cached else Job.core_adaptor
+    try:
+        with demo_settings_override(ADAPTOR_CACHE=cached):
+            yield
+    finally:
+        Job.adaptor = installed
+
+
+@contextmanager
+def count_adaptors():
+    """ Count demo adaptors built (copies excluded), yield a one item list """
+    built = [0]
+    init = WavesDemoAdaptor.__dict__['__init__']
+
+    def counting_init(self, *args, **kwargs):
+        built[0] += 1
+        init(self, *args, **kwargs)
+
+    WavesDemoAdaptor.__init__ = counting_init
+    try:
+        yield built
+    finally:
+        WavesDemoAdaptor.__init__ = init
+
+
+@benchmark('adaptors')
+def bench_adaptors(jobs=100, **kwargs):
+    """ Adaptors built per job transition: jobs driven through their lifecycle by daemon 'process_job' (load test mode),
+    refreshed from database on each round as daemon cycles do, adaptors built by waves-core on each access vs resolved
+    from adaptors cache once per job """
+    rows = []
+    with bench_environment(), demo_settings_override(
+            LOAD_TEST={'RUNTIME_MEAN': 0, 'RUNTIME_SD': 0}, HISTORY_BUFFERED=False):
+        runner = Runner.objects.create(name='Benchmark runner', clazz='demo.adaptors.SshClusterAdaptor')
+        service = get_service_model().objects.create(name='Benchmark', api_name='benchmark', runner=runner)
+        submission = service.default_submission
+        daemon = DemoJobQueueRunDaemon(pidfile=tempfile.mktemp(prefix='waves_bench_'))
+        for cached in (False, True):
+            adaptor_cache.clear()
+            pks = [Job.objects.create_from_submission(submission, submitted_inputs={}).pk for _ in range(jobs)]
+            transitions = 0
+            with job_adaptors(cached), count_adaptors() as built:
+                start = time.time()
+                # created, prepared, queued, completed
+                for _ in range(4):
+                    for job in Job.objects.filter(pk__in=pks, _status__lt=JobStatus.JOB_TERMINATED):
+                        status = job.status
+                        daemon.process_job(job)
+                        transitions += job.status != status
+                elapsed = time.time() - start
+            rows.append(OrderedDict([
+                ('mode', 'cached' if cached else 'waves-core'),
+                ('jobs', jobs),
+                ('transitions', transitions),
+                ('adaptors built / transition', round(built[0] / float(transitions), 2) if transitions else 0),
+                ('seconds / 1000 transitions', round(elapsed / transitions * 1000, 3) if transitions else 0),
+            ]))
+        adaptor_cache.clear()
+    return rows
+
+
+class LeaseBenchDaemon(DemoJobQueueRunDaemon):
+    """ Daemon process limited to benchmark jobs (consecutive ids) """
+
+    def __init__(self, pks):
+        super(LeaseBenchDaemon, self).__init__(pidfile=tempfile.mktemp(prefix='waves_demo_lease_'))
+        self.pks = pks
+
+    def pending_jobs(self):
+        return super(LeaseBenchDaemon, self).pending_jobs().filter(pk__gte=self.pks[0], pk__lte=self.pks[-1])
+
+    def run(self, timeout):
+        """ Run cycles on leased jobs until all benchmark jobs are finished """
+        start = time.time()
+        try:
+            while time.time() - start < timeout and self.pending_jobs().exists():
+                jobs = list(self.get_jobs())
+                if jobs:
+                    self.run_cycle(jobs)
+                else:
+                    # remaining jobs leased by other daemons
+                    time.sleep(0.05)
+        finally:
+            self.lease_manager.stop()
+            connection.close()
+
+
+def _lease_daemon(pks, timeout):
+    LeaseBenchDaemon(pks).run(timeout)
+
+
+def run_lease_daemons(pks, processes, timeout=600):
+    """ Run jobs (committed, consecutive ids) with 'processes' daemon processes until they are finished, return wall
+    clock seconds """
+    connection.close()
+    daemons = [multiprocessing.Process(target=_lease_daemon, args=(pks, timeout)) for _ in range(processes)]
+    start = time.time()
+    for daemon in daemons:
+        daemon.start()
+    for daemon in daemons:
+        daemon.join()
+    return time.time() - start
+
+
+def duplicated_transitions(pks):
+    """ Prepare and launch transitions done more than once for jobs (consecutive ids), retries excluded """
+    transitions = JobHistory.objects.filter(
+        job_id__gte=pks[0], job_id__lte=pks[-1], status__in=(JobStatus.JOB_PREPARED, JobStatus.JOB_QUEUED)).exclude(
+        message__startswith='[Retry]').values('job_id', 'status').annotate(count=Count('pk'))
+    return sum(row['count'] - 1 for row in transitions if row['count'] > 1)
+
+
+@benchmark('leases')
+def bench_leases(jobs=1000, processes=4, latency=0.01, **kwargs):
+    """ Daemon processes sharing one database with job leases ('LEASES'): jobs lifecycle in load test mode ('latency'
+    per remote call) run by 1 then 'processes' daemons, each job transition must be done once. Jobs are committed
+    (database must be shared between processes, not an in memory one), then deleted """
+    rows = []
+    with bench_environment(rollback=False), demo_settings_override(
+            LOAD_TEST={'POLL_LATENCY': latency, 'RUNTIME_MEAN': 0, 'RUNTIME_SD': 0}, LEASES=True, LEASE_BATCH=50,
+            HISTORY_BUFFERED=False, ADAPTIVE_POLLING=False, WATCH_JOB_DIRS=False, WORKERS=0):
+        runner = Runner.objects.create(name='Benchmark runner', clazz='demo.adaptors.SshClusterAdaptor')
+        service = get_service_model().objects.create(name='Benchmark', api_name='benchmark', runner=runner)
+        submission = service.default_submission
+        try:
+            for count in sorted({1, processes}):
+                pks = [Job.objects.create_from_submission(submission, submitted_inputs={}).pk for _ in range(jobs)]
+                elapsed = run_lease_daemons(pks, count)
+                bench_jobs = Job.objects.filter(pk__gte=pks[0], pk__lte=pks[-1])
+                finished = bench_jobs.filter(_status__gte=JobStatus.JOB_TERMINATED).count()
+                rows.append(OrderedDict([
+                    ('daemons', count),
+                    ('jobs', jobs),
+                    ('finished', finished),
+                    ('duplicated transitions', duplicated_transitions(pks)),
+                    ('seconds', round(elapsed, 2)),
+                    ('jobs / s', round(finished / elapsed, 1) if elapsed else 0),
+                ]))
+                bench_jobs.delete()
+        finally:
+            service.delete()
+            runner.delete()
+    base = rows[0]['jobs / s']
+    for row in rows:
+        row['speedup'] = round(row['jobs / s'] / base, 2) if base else 0
+    return rows
+
+
+@benchmark('fairshare')
+def bench_fairshare(jobs=100000, runners=4, **kwargs):
+    """ Jobs dispatch simulation (no database): one owner submits half of pending jobs first, 200 other owners the
+    rest, runners have 8 slots and jobs run 1 to 3 ticks. FIFO vs weighted fair share: wait (ticks) for the heavy owner and
+    others, others / heavy owner mean wait ratio, dispatch overhead """
+    rng = random.Random(0)
+    pending = [(pk, 'user:1' if pk < jobs // 2 else 'user:%i' % rng.randint(2, 201), 'service%i' % (pk % 3),
+                'runner%i' % (pk % runners), rng.randint(1, 3)) for pk in range(jobs)]
+    runtimes = {pk: runtime for pk, owner, service, runner, runtime in pending}
+    rows = []
+    for fair in (False, True):
+        scheduler = FairShareScheduler(slots=8, runner_slots={}, weights={})
+        queues = {}
+        start = time.time()
+        for pk, owner, service, runner, runtime in pending:
+            if fair:
+                scheduler.enqueue(pk, owner, service, runner)
+            else:
+                queues.setdefault(runner, deque()).append(pk)
+        overhead = time.time() - start
+        running = {runner: [] for runner in set(job[3] for job in pending)}
+        dispatched_at = {}
+        tick = done = 0
+        while done < jobs:
+            for runner, ends in running.items():
+                while ends and ends[0] <= tick:
+                    heapq.heappop(ends)
+                    done += 1
+                free = 8 - len(ends)
+                start = time.time()
+                if fair:
+                    pks = scheduler.dispatch(runner, free)
+                else:
+                    queue = queues.get(runner, deque())
+                    pks = [queue.popleft() for _ in range(min(free, len(queue)))]
+                overhead += time.time() - start
+                for pk in pks:
+                    dispatched_at[pk] = tick
+                    heapq.heappush(ends, tick + runtimes[pk])
+            tick += 1
+        waits = {}
+        for pk, owner, service, runner, runtime in pending:
+            waits.setdefault(owner, []).append(dispatched_at[pk])
+        others = [wait for owner, owner_waits in waits.items() if owner != 'user:1' for wait in owner_waits]
+        heavy_wait = sum(waits['user:1']) / float(len(waits['user:1']))
+        others_wait = sum(others) / float(len(others))
+        rows.append(OrderedDict([
+            ('mode', 'fair share' if fair else 'fifo'),
+            ('jobs', jobs),
+            ('ticks', tick),
+            ('heavy owner mean wait', round(heavy_wait, 1)),
+            ('other owners mean wait', round(others_wait, 1)),
+            ('other owners p95 wait', percentile(others, 95)),
+            ('others / heavy wait ratio', round(others_wait / heavy_wait, 2) if heavy_wait else 0),
+            ('dispatch us / job', round(overhead / jobs * 1e6, 2)),
+        ]))
+    return rows
+
+
+@benchmark('jobdirs')
+def bench_jobdirs(dirs=1000000, **kwargs):
+    """ Jobs working dirs layouts (filesystem only, in a temporary directory): flat vs sharded (2 levels of 2 hex digits)
+    create time, lookup of 10000 random dirs, base dir listing, purge (removal) of 10% random dirs """
+    rng = random.Random(0)
+    slugs = [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(dirs)]
+    sample = rng.sample(slugs, min(10000, dirs))
+    purged = rng.sample(slugs, dirs // 10)
+    rows = []
+    for depth in (0, 2):
+        base_dir = tempfile.mkdtemp(prefix='waves_bench_jobdirs_')
+        try:
+            paths = {slug: sharded_dir(base_dir, slug, depth, 2) if depth else flat_dir(base_dir, slug)
+                     for slug in slugs}
+            start = time.time()
+            parents = set()
+            for slug in slugs:
+                parent = os.path.dirname(paths[slug])
+                if parent not in parents:
+                    if not os.path.isdir(parent):
+                        os.makedirs(parent)
+                    parents.add(parent)
+                os.mkdir(paths[slug])
+            created = time.time() - start
+            start = time.time()
+            for slug in sample:
+                os.path.isdir(paths[slug])
+            lookup = time.time() - start
+            start = time.time()
+            listed = len(os.listdir(base_dir))
+            listing = time.time() - start
+            start = time.time()
+            for slug in purged:
+                shutil.rmtree(paths[slug])
+            purge = time.time() - start
+        finally:
+            shutil.rmtree(base_dir, ignore_errors=True)
+        rows.append(OrderedDict([
+            ('layout', 'sharded (depth %i)' % depth if depth else 'flat'),
+            ('dirs', dirs),
+            ('create (s)', round(created, 2)),
+            ('create us / dir', round(created / dirs * 1e6, 1) if dirs else 0),
+            ('lookup us', round(lookup / len(sample) * 1e6, 1) if sample else 0),
+            ('base dir entries', listed),
+            ('base dir listing (s)', round(listing, 3)),
+            ('purge us / dir', round(purge / len(purged) * 1e6, 1) if purged else 0),
+        ]))
+    return rows
@@ -0,0 +1,124 @@
+""" Services catalogue: category -> services tree, built in a constant number of queries and cached
+
+Tree is cached per permission class (anonymous, registered, staff, superuser), using Django's cache framework.
+Services granted to a specific user (restricted services, staff own drafts) are not cached, they are added on top of
+cached tree with dedicated queries. Cache is invalidated from models signals (see demo.signals).
+"""
+from __future__ import unicode_literals
+
+from django.core.cache import cache
+from django.utils.encoding import smart_text
+from waves.wcore.models import get_service_model, get_submission_model
+
+from demo.models import ServiceCategory
+from demo.settings import demo_settings
+
+__all__ = ['get_categories', 'invalidate_catalogue', 'permission_class']
+
+Service = get_service_model()
+Submission = get_submission_model()
+
+ANONYMOUS = 'anonymous'
+REGISTERED = 'registered'
+STAFF = 'staff'
+SUPERUSER = 'superuser'
+
+#: Services status visible to each permission class
+VISIBLE_STATUS = {
+    ANONYMOUS: (Service.SRV_PUBLIC,),
+    REGISTERED: (Service.SRV_PUBLIC, Service.SRV_REGISTERED),
+    STAFF: (Service.SRV_PUBLIC, Service.SRV_REGISTERED, Service.SRV_RESTRICTED, Service.SRV_TEST),
+    SUPERUSER: (Service.SRV_PUBLIC, Service.SRV_REGISTERED, Service.SRV_RESTRICTED, Service.SRV_TEST,
+                Service.SRV_DRAFT),
+}
+
+CACHE_KEY = 'demo.catalogue.%s'
+
+
+def permission_class(user):
+    """ Permission class for user """
+    if user is None or user.is_anonymous():
+        return ANONYMOUS
+    if user.is_superuser:
+        return SUPERUSER
+    if user.is_staff:
+        return STAFF
+    return REGISTERED
+
+
+def _service_entry(service, submission):
+    """ Plain (cacheable) representation for a service """
+    from waves.wcore.settings import waves_settings
+    runner_id = (submission['runner_id'] or service.runner_id) if submission else None
+    return dict(id=service.id,
+                api_name=service.api_name,
+                name=service.name,
+                version=service.version,
+                created_by=smart_text(service.created_by) if service.created_by else None,
+                status_display=service.get_status_display(),
+                short_description=service.short_description,
+                description=service.description,
+                created=service.created,
+                updated=service.updated,
+                admin_url=service.get_admin_url(),
+                available_for_submission=bool(waves_settings.ALLOW_JOB_SUBMISSION and runner_id))
+
+
+def _services_by_category(services):
+    """ Group services by category id, with their default submission (2 queries) """
+    services = list(services.filter(category__isnull=False).select_related('created_by'))
+    submissions = {}
+    for submission in Submission.objects.filter(service__in=[s.id for s in services]).order_by(
+            'service', 'order', 'pk').values('service_id', 'runner_id'):
+        # Keep only first one, i.e 'default_submission'
+        submissions.setdefault(submission['service_id'], submission)
+    grouped = {}
+    for service in services:
+        grouped.setdefault(service.category_id, []).append(_service_entry(service, submissions.get(service.id)))
+    return grouped
+
+
+def build_catalogue(perm_class):
+    """ Build catalogue tree for a permission class (3 queries)
+
+    :return: list of categories (dict) with their 'services' list
+    """
+    categories = ServiceCategory.objects.filter(
+        pk__in=Service.objects.filter(category__isnull=False).values('category_id'))
+    grouped = _services_by_category(Service.objects.filter(status__in=VISIBLE_STATUS[perm_class]))
+    return [dict(id=category.id,
+                 name=category.name,
+                 short_description=category.short_description,
+                 services=grouped.get(category.id, [])) for category in categories]
+
+
+def _user_services(user, perm_class):
+    """ Services granted specifically to user, not in cached tree """
+    if perm_class == REGISTERED:
+        return Service.objects.filter(status=Service.SRV_RESTRICTED, restricted_client=user)
+    if perm_class == STAFF:
+        return Service.objects.filter(status=Service.SRV_DRAFT, created_by=user)
+    return None
+
+
+def get_categories(user):
+    """ Retrieve catalogue for user, anonymous users catalogue is served from cache without any SQL """
+    perm_class = permission_class(user)
+    key = CACHE_KEY % perm_class
+    categories = cache.get(key)
+    if categories is None:
+        categories = build_catalogue(perm_class)
+        cache.set(key, categories, demo_settings.CATALOGUE_CACHE_TIMEOUT)
+    user_services = _user_services(user, perm_class)
+    if user_services is not None:
+        extra = _services_by_category(user_services)
+        if extra:
+            categories = [dict(category, services=sorted(category['services'] + extra.get(category['id'], []),
+                                                         key=lambda s: s['name']))
+                          for category in categories]
+    return categories
+
+
+def invalidate_catalogue():
+    """ Drop all cached catalogues """
+    cache.delete_many([CACHE_KEY % perm_class for perm_class in VISIBLE_STATUS.keys()])
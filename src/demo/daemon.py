@@ -0,0 +1,303 @@
+""" WAVES demo job queue daemon """
+from __future__ import unicode_literals
+
+import datetime
+import logging
+import time
+from functools import partial
+
+import waves.wcore.exceptions
+from waves.wcore.adaptors.const import JobStatus
+from waves.wcore.adaptors.exceptions import AdaptorException
+from django.db import DatabaseError
+from waves.wcore.management.runner import JobQueueRunDaemon
+from waves.wcore.models import Job
+
+from demo.arrays import ArrayBatcher, launch_array
+from demo.fairshare import FairShareScheduler
+from demo.history import history_writer
+from demo.leases import LeaseManager
+from demo.loader import adaptor_cache
+from demo.polling import POLLED_STATUS, poll_jobs
+from demo.pool import connection_pool
+from demo.results import results_stage
+from demo.scheduling import PollScheduler
+from demo.settings import demo_settings
+from demo.watcher import job_watcher
+from demo.workers import WorkerPool
+
+logger = logging.getLogger('waves.daemon')
+
+__all__ = ['DemoJobQueueRunDaemon']
+
+
+class DemoJobQueueRunDaemon(JobQueueRunDaemon):
+    """
+    Job queue daemon, same workflow than waves-core one, split into overridable steps. Each loop is a 'cycle':
+    running jobs due for a status check ('ADAPTIVE_POLLING' setting) are polled in bulk, completed jobs results are
+    staged in a thread pool, then jobs are processed one by one, or in a worker pool ('WORKERS' setting). Buffered job
+    history entries are flushed when a cycle ends. Local jobs working directories may be watched ('WATCH_JOB_DIRS'
+    setting): they are processed as soon as they end, and polled only every 'POLL_MAX_INTERVAL' seconds. When several
+    daemons share a database ('LEASES' setting), each one processes only jobs it holds a lease on. Created jobs are
+    prepared in fair share order, when their runner has a free slot ('FAIR_SHARE' setting). Prepared jobs of cluster
+    runners may be launched as array jobs ('ARRAY_JOBS' setting).
+    """
+
+    @property
+    def lease_manager(self):
+        """ This daemon jobs leases """
+        if getattr(self, '_lease_manager', None) is None:
+            self._lease_manager = LeaseManager()
+        return self._lease_manager
+
+    def claim_jobs(self, jobs):
+        """ Claim jobs leases, return owned jobs ids """
+        try:
+            owned = self.lease_manager.claim(jobs)
+        except DatabaseError as exc:
+            # concurrent claims may hit database locks, jobs are claimed again next cycle
+            logger.error('Jobs claim failed for %s: %s', self.lease_manager.owner, exc)
+            owned = self.lease_manager.owned()
+        self.lease_manager.start()
+        return owned
+
+    def pending_jobs(self):
+        """ Non terminated jobs """
+        return Job.objects.filter(_status__lt=JobStatus.JOB_TERMINATED)
+
+    def get_jobs(self):
+        """ Retrieve all current non terminated jobs (only leased ones when 'LEASES' is set) """
+        jobs = self.pending_jobs()
+        if demo_settings.LEASES:
+            jobs = jobs.filter(pk__in=self.claim_jobs(jobs))
+        return jobs.prefetch_related('job_inputs').prefetch_related('outputs')
+
+    def process_job(self, job):
+        """ Process one job according to its current status, job actions share its adaptor (see demo.loader) """
+        runner = job.adaptor
+        if runner and logger.isEnabledFor(logging.DEBUG):
+            logger.debug('[Runner]-------\n%s\n----------------', runner.dump_config())
+        try:
+            job.check_send_mail()
+            logger.debug("Launching Job %s (adapter:%s)", job, runner)
+            if job.status == JobStatus.JOB_CREATED:
+                job.run_prepare()
+                logger.debug("[PrepareJob] %s (adapter:%s)", job, runner)
+            elif job.status == JobStatus.JOB_PREPARED:
+                logger.debug("[LaunchJob] %s (adapter:%s)", job, runner)
+                job.run_launch()
+            elif job.status == JobStatus.JOB_COMPLETED:
+                job.run_results()
+                logger.debug("[JobExecutionEnded] %s (adapter:%s)", job.get_status_display(), runner)
+            else:
+                job.run_status()
+        except (waves.wcore.exceptions.WavesException, AdaptorException) as e:
+            logger.error("Error Job %s (adapter:%s-state:%s): %s", job, runner, job.get_status_display(),
+                         e.message)
+        except IOError as exc:
+            logger.error('IO error on job %s [%s]', job.slug, exc)
+            job.status = JobStatus.JOB_ERROR
+            job.save()
+        except Exception as exc:
+            logger.exception('Current job raised unrecoverable exception %s', exc)
+            job.fatal_error(exc)
+        finally:
+            logger.info("Queue job terminated at: %s", datetime.datetime.now().strftime('%A, %d %B %Y %H:%M:%I'))
+            self.job_processed(job)
+            if runner is not None:
+                runner.disconnect()
+
+    def job_processed(self, job):
+        """ Called once job has been processed (or polled in bulk) """
+        job.check_send_mail()
+        if job.status >= JobStatus.JOB_TERMINATED:
+            history_writer.forget(job)
+            results_stage.consume(job)
+            job_watcher.unwatch(job)
+            self.watch_checks.pop(job.pk, None)
+            if demo_settings.LEASES:
+                self.lease_manager.release(job)
+
+    def poll_statuses(self, jobs):
+        """ Poll jobs status in bulk, one remote call per runner ('BULK_STATUS' setting)
+
+        :return: polled jobs ids
+        """
+        if not demo_settings.BULK_STATUS:
+            return set()
+        try:
+            return {job.pk for job in poll_jobs(jobs)}
+        except Exception as exc:
+            # jobs are then polled one by one
+            logger.exception('Bulk status polling failed %s', exc)
+            return set()
+
+    def stage_results(self, jobs):
+        """ Write results for completed jobs in a thread pool before processing them one by one """
+        completed = [job for job in jobs if job.status == JobStatus.JOB_COMPLETED]
+        if not completed:
+            return
+        try:
+            timings = results_stage.stage(completed)
+        except Exception as exc:
+            # jobs results are then written by their adaptor
+            logger.exception('Results staging failed %s', exc)
+        else:
+            logger.info("Staged results for %i/%i completed job(s), %.3fs cumulated I/O", len(timings), len(completed),
+                        sum(timing.seconds for timing in timings.values()))
+
+    def end_cycle(self):
+        """ Called after each cycle, even if it failed """
+        history_writer.flush()
+        connection_pool.evict_idle()
+        logger.debug('Connection pool: %s', connection_pool.statistics())
+        if demo_settings.ADAPTIVE_POLLING:
+            logger.debug('Poll scheduler: %s', self.poll_scheduler.statistics())
+
+    @property
+    def poll_scheduler(self):
+        """ Jobs status checks schedule, kept between cycles """
+        if getattr(self, '_poll_scheduler', None) is None:
+            self._poll_scheduler = PollScheduler()
+        return self._poll_scheduler
+
+    @property
+    def fair_share(self):
+        """ Pending jobs fair share queues, rebuilt from jobs when daemon starts """
+        if getattr(self, '_fair_share', None) is None:
+            self._fair_share = FairShareScheduler()
+        return self._fair_share
+
+    def schedule_jobs(self, jobs):
+        """ Hold created jobs not yet dispatched by fair share scheduler """
+        if not demo_settings.FAIR_SHARE:
+            return jobs
+        dispatched = self.fair_share.schedule(jobs)
+        return [job for job in jobs if job.status != JobStatus.JOB_CREATED or job.pk in dispatched]
+
+    @property
+    def array_batcher(self):
+        """ Prepared jobs held for array submission """
+        if getattr(self, '_array_batcher', None) is None:
+            self._array_batcher = ArrayBatcher()
+        return self._array_batcher
+
+    def launch_arrays(self, jobs):
+        """ Launch prepared jobs of array capable runners as array jobs ('ARRAY_JOBS' setting)
+
+        :return: other jobs, to be processed one by one
+        """
+        if not demo_settings.ARRAY_JOBS:
+            return jobs
+        batches, held = self.array_batcher.collect(jobs)
+        launched = set()
+        for batch in batches:
+            try:
+                launch_array(batch)
+            except Exception as exc:
+                # jobs are then launched one by one
+                logger.exception('Array launch failed %s', exc)
+                continue
+            for job in batch:
+                launched.add(job.pk)
+                self.job_processed(job)
+            logger.info("Launched %i job(s) as one array job", len(batch))
+        return [job for job in jobs if job.pk not in launched and job.pk not in held]
+
+    @property
+    def watch_checks(self):
+        """ Watched jobs last status check time """
+        if getattr(self, '_watch_checks', None) is None:
+            self._watch_checks = {}
+        return self._watch_checks
+
+    def watched_due(self, job):
+        """ Whether watched job is due for a status check: its exit code file may never be written (process lost on
+        daemon restart or lease takeover), watched jobs are still polled every 'POLL_MAX_INTERVAL' seconds """
+        now = time.time()
+        if now - self.watch_checks.setdefault(job.pk, now) < demo_settings.POLL_MAX_INTERVAL:
+            return False
+        self.watch_checks[job.pk] = now
+        return True
+
+    def select_jobs(self, jobs):
+        """ Jobs to process in cycle: watched jobs once ended (or due for a safety status check), other running jobs
+        when due for a status check """
+        finished = job_watcher.pop_finished() if demo_settings.WATCH_JOB_DIRS else set()
+        selected = []
+        others = []
+        watching = {}
+        for job in jobs:
+            if job.pk in finished:
+                selected.append(job)
+            elif demo_settings.WATCH_JOB_DIRS and job.status in POLLED_STATUS and job._adaptor:
+                if job._adaptor not in watching:
+                    watching[job._adaptor] = getattr(adaptor_cache.for_job(job), 'watch_completion', False)
+                if not (watching[job._adaptor] and job_watcher.watch(job)):
+                    others.append(job)
+                elif self.watched_due(job):
+                    selected.append(job)
+            else:
+                others.append(job)
+        if demo_settings.ADAPTIVE_POLLING:
+            others = self.poll_scheduler.due(others)
+        return selected + others
+
+    def wait(self, timeout):
+        """ Sleep between cycles, wake up as soon as a watched job ends """
+        if demo_settings.WATCH_JOB_DIRS and len(job_watcher):
+            job_watcher.wait(timeout)
+        else:
+            time.sleep(timeout)
+
+    def run_cycle(self, jobs):
+        """ Process jobs: status polled in bulk, completed jobs results staged, then jobs processed one by one """
+        jobs = self.select_jobs(self.schedule_jobs(jobs))
+        try:
+            jobs = self.launch_arrays(jobs)
+            polled = self.poll_statuses(jobs)
+            self.stage_results(jobs)
+            remaining = []
+            for job in jobs:
+                if job.pk in polled and job.status != JobStatus.JOB_COMPLETED:
+                    self.job_processed(job)
+                else:
+                    remaining.append(job)
+            self.process_jobs(remaining)
+        finally:
+            if demo_settings.ADAPTIVE_POLLING:
+                self.poll_scheduler.update(jobs)
+            self.end_cycle()
+
+    @property
+    def worker_pool(self):
+        """ Worker pool kept between cycles, in order to keep track of hung runners """
+        if getattr(self, '_worker_pool', None) is None:
+            self._worker_pool = WorkerPool()
+        return self._worker_pool
+
+    def process_jobs(self, jobs):
+        """ Process jobs one after the other, or in worker pool if 'WORKERS' is set (jobs grouped by runner) """
+        if demo_settings.WORKERS > 0:
+            stats = self.worker_pool.run((job._adaptor, partial(self.process_job, job)) for job in jobs)
+            logger.debug('Worker pool: %s, hung runners: %s', stats, self.worker_pool.hung_runners)
+        else:
+            for job in jobs:
+                self.process_job(job)
+
+    def loop_callback(self):
+        """ Process all unfinished jobs, then sleep """
+        jobs = list(self.get_jobs())
+        if jobs:
+            logger.info("Starting queue process with %i(s) unfinished jobs", len(jobs))
+        self.run_cycle(jobs)
+        logger.debug('Go to sleep for %i seconds' % self.SLEEP_TIME)
+        self.wait(self.SLEEP_TIME)
+
+    def exit_callback(self):
+        history_writer.flush()
+        connection_pool.close_all()
+        job_watcher.stop()
+        if demo_settings.LEASES:
+            self.lease_manager.stop()
+        super(DemoJobQueueRunDaemon, self).exit_callback()
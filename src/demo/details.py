@@ -0,0 +1,68 @@
+""" Job detail page: relations loaded in a fixed number of queries, finished jobs parts cached
+
+Job inputs, outputs and public history are prefetched once (job properties filter them with a new query on each
+access). Finished jobs (terminated, cancelled or in error) do not change anymore until saved again: their run details
+and rendered detail fragment (inputs, params, outputs, run information) are cached per job and last update time for
+'JOB_DETAIL_CACHE_TIMEOUT' seconds, so that refreshing a finished job page only loads the job and its history.
+"""
+from __future__ import unicode_literals
+
+from django.core.cache import cache
+from django.db.models import Prefetch, prefetch_related_objects
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from waves.wcore.adaptors.const import JobStatus
+from waves.wcore.models import Job, JobHistory
+from waves.wcore.models.const import ParamType
+
+from demo.settings import demo_settings
+
+__all__ = ['job_detail_queryset', 'get_job_run_details', 'render_job_detail']
+
+RUN_DETAILS_KEY = 'demo.job_run_details.%s.%s'
+DETAIL_FRAGMENT_KEY = 'demo.job_detail.%s.%s'
+
+
+def job_detail_queryset():
+    """ Jobs with submission, service, runners and public history """
+    return Job.objects.select_related('client', 'submission__service__runner', 'submission__runner').prefetch_related(
+        Prefetch('job_history', queryset=JobHistory.objects.filter(is_admin=False), to_attr='demo_public_history'))
+
+
+def _is_finished(job):
+    return job.status >= JobStatus.JOB_TERMINATED
+
+
+def _job_key(key, job):
+    return key % (job.pk, job.updated.strftime('%Y%m%d%H%M%S%f') if job.updated else '')
+
+
+def get_job_run_details(job):
+    """ Job run details as a dict, memoized for finished jobs """
+    key = _job_key(RUN_DETAILS_KEY, job)
+    details = cache.get(key) if _is_finished(job) else None
+    if details is None:
+        details = (job.run_details or job.default_run_details())._asdict()
+        if _is_finished(job):
+            cache.set(key, details, demo_settings.JOB_DETAIL_CACHE_TIMEOUT)
+    return details
+
+
+def render_job_detail(job):
+    """ Job inputs, params, outputs and run information fragment, cached for finished jobs """
+    key = _job_key(DETAIL_FRAGMENT_KEY, job)
+    if _is_finished(job):
+        fragment = cache.get(key)
+        if fragment is not None:
+            return mark_safe(fragment)
+    prefetch_related_objects([job], Prefetch('job_inputs', to_attr='demo_inputs'),
+                             Prefetch('outputs', to_attr='demo_outputs'))
+    fragment = render_to_string('waves/jobs/parts/job_detail.html', {
+        'job': job,
+        'job_input_files': [job_input for job_input in job.demo_inputs if job_input.param_type == ParamType.TYPE_FILE],
+        'job_input_params': [job_input for job_input in job.demo_inputs if job_input.param_type != ParamType.TYPE_FILE],
+        'job_outputs': job.demo_outputs,
+    })
+    if _is_finished(job):
+        cache.set(key, fragment, demo_settings.JOB_DETAIL_CACHE_TIMEOUT)
+    return fragment
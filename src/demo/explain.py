@@ -0,0 +1,100 @@
+""" Query plans of hot queries, for index coverage checks
+
+Each hot query (daemon, jobs listings, service page, categories) is explained with the database backend EXPLAIN
+statement, plans are parsed for tables read without an index (full scans) and for rows sorted after being read (sort
+not provided by an index). SQLite, PostgreSQL and MySQL are supported. On PostgreSQL, sequential scans and sorts are
+disabled while explaining, so that a plan chosen for tiny test tables only contains them when no index can be used.
+"""
+from __future__ import unicode_literals
+
+import re
+from collections import OrderedDict
+
+from django.db import connections
+from django.utils import timezone
+from waves.wcore.adaptors.const import JobStatus
+from waves.wcore.models import Job
+
+from demo.models import ServiceCategory, ServiceMeta
+from demo.pagination import older_than
+
+__all__ = ['SUPPORTED_VENDORS', 'UnsupportedBackend', 'explain', 'full_scans', 'sorts', 'hot_queries']
+
+_SQLITE_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+_SQLITE_SORT = re.compile(r'USE TEMP B-TREE FOR (?:\w+ )*ORDER BY')
+_POSTGRESQL_FULL_SCAN = re.compile(r'Seq Scan on (\w+)')
+_POSTGRESQL_SORT = re.compile(r'(?:^|->)\s*Sort\b')
+
+#: Database vendors query plans can be read for
+SUPPORTED_VENDORS = ('sqlite', 'postgresql', 'mysql')
+
+
+class UnsupportedBackend(ValueError):
+    """ Query plans are not supported for the database backend """
+
+
+def explain(queryset):
+    """ Query plan for queryset, one line per plan node (MySQL: 'table type key extra') """
+    connection = connections[queryset.db]
+    sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET enable_seqscan = off')
+            cursor.execute('SET enable_sort = off')
+            try:
+                cursor.execute('EXPLAIN ' + sql, params)
+                return [row[0] for row in cursor.fetchall()]
+            finally:
+                cursor.execute('RESET enable_seqscan')
+                cursor.execute('RESET enable_sort')
+        if connection.vendor == 'mysql':
+            cursor.execute('EXPLAIN ' + sql, params)
+            columns = [column[0].lower() for column in cursor.description]
+            return ['%(table)s %(type)s %(key)s %(extra)s' % dict(zip(columns, row)) for row in cursor.fetchall()]
+        raise UnsupportedBackend('Query plans are not supported for %s' % connection.vendor)
+
+
+def full_scans(queryset):
+    """ Tables read without an index by queryset query """
+    vendor = connections[queryset.db].vendor
+    tables = []
+    for line in explain(queryset):
+        if vendor == 'sqlite':
+            match = _SQLITE_FULL_SCAN.match(line.strip())
+            if match:
+                tables.append(match.group(1))
+        elif vendor == 'postgresql':
+            tables.extend(_POSTGRESQL_FULL_SCAN.findall(line))
+        elif line.split(' ')[1] == 'ALL':
+            tables.append(line.split(' ')[0])
+    return tables
+
+
+def sorts(queryset):
+    """ Whether queryset rows are sorted after being read (ordering not provided by an index) """
+    vendor = connections[queryset.db].vendor
+    for line in explain(queryset):
+        if vendor == 'sqlite' and _SQLITE_SORT.search(line):
+            return True
+        if vendor == 'postgresql' and _POSTGRESQL_SORT.search(line):
+            return True
+        if vendor == 'mysql' and 'filesort' in line:
+            return True
+    return False
+
+
+def hot_queries():
+    """ Hot queries, name: (queryset, whether its ordering must come from an index) """
+    cursor = (timezone.now(), 1)
+    return OrderedDict([
+        ('daemon pending jobs', (Job.objects.filter(_status__lt=JobStatus.JOB_TERMINATED), False)),
+        ('user jobs', (Job.objects.filter(client_id=1).order_by('-updated', '-created'), True)),
+        ('email jobs', (Job.objects.filter(email_to='demo@example.com').order_by('-updated', '-created'), True)),
+        ('jobs list first page', (Job.objects.order_by('-created', '-pk')[:10], True)),
+        ('jobs list next page', (Job.objects.filter(older_than(cursor)).order_by('-created', '-pk')[:10], False)),
+        ('service metas', (ServiceMeta.objects.filter(service_id=1).order_by('type', 'order', 'pk'), True)),
+        ('sub categories', (ServiceCategory.objects.filter(parent_id=1).order_by('order'), True)),
+    ])
@@ -0,0 +1,130 @@
+""" Fair share scheduling of created jobs over runners
+
+Daemon prepares a created job only once scheduler dispatches it ('FAIR_SHARE' setting). Each runner has a number of
+slots ('FAIR_SHARE_SLOTS', or per runner 'FAIR_SHARE_RUNNER_SLOTS' keyed '<adaptor class>:<connexion string>'): jobs
+prepared, queued or running on it. Free slots are given to pending jobs with weighted fair queuing: each job gets a
+virtual finish tag, max(runner virtual time, owner last tag) + 1 / weight, jobs are dispatched by increasing tag, so
+that an owner (user, or email for anonymous jobs) submitting thousands of jobs does not delay others. Weight is the
+product of owner and service weights ('FAIR_SHARE_WEIGHTS', keys 'user:<id>', 'email:<address>' and
+'service:<name>', default 1).
+
+Scheduler state is kept in memory (one heap per runner), rebuilt from pending jobs when daemon restarts.
+"""
+from __future__ import unicode_literals
+
+import heapq
+
+from waves.wcore.adaptors.const import JobStatus
+
+from demo.loader import adaptor_cache
+from demo.settings import demo_settings
+
+__all__ = ['ACTIVE_STATUS', 'FairShareScheduler', 'job_owner']
+
+#: Status of jobs using a runner slot
+ACTIVE_STATUS = (JobStatus.JOB_PREPARED, JobStatus.JOB_QUEUED, JobStatus.JOB_RUNNING, JobStatus.JOB_SUSPENDED)
+
+
+def job_owner(job):
+    """ Fair share flow for job: its user, or notification email for anonymous jobs """
+    if job.client_id:
+        return 'user:%s' % job.client_id
+    if job.email_to:
+        return 'email:%s' % job.email_to.lower()
+    return 'anonymous'
+
+
+class FairShareScheduler(object):
+    """ Weighted fair queues of pending jobs, one per runner """
+
+    def __init__(self, slots=None, runner_slots=None, weights=None):
+        self.slots = slots or demo_settings.FAIR_SHARE_SLOTS
+        self.runner_slots = demo_settings.FAIR_SHARE_RUNNER_SLOTS if runner_slots is None else runner_slots
+        self.weights = demo_settings.FAIR_SHARE_WEIGHTS if weights is None else weights
+        self._queues = {}
+        self._virtual_time = {}
+        self._last_tag = {}
+        self._queued = {}
+        self._dispatched = set()
+        self._runners = {}
+
+    def weight(self, owner, service):
+        return self.weights.get(owner, 1) * self.weights.get('service:%s' % service, 1)
+
+    def enqueue(self, pk, owner, service, runner):
+        """ Add pending job to its runner queue """
+        if pk in self._queued:
+            return
+        start = max(self._virtual_time.get(runner, 0), self._last_tag.get((runner, owner), 0))
+        tag = start + 1.0 / self.weight(owner, service)
+        self._last_tag[(runner, owner)] = tag
+        self._queued[pk] = runner
+        heapq.heappush(self._queues.setdefault(runner, []), (tag, pk))
+
+    def discard(self, pk):
+        """ Forget job (lazily removed from its queue) """
+        self._queued.pop(pk, None)
+        self._dispatched.discard(pk)
+
+    def dispatch(self, runner, count):
+        """ Pop up to count jobs from runner queue, by increasing virtual finish tag """
+        queue = self._queues.get(runner, [])
+        dispatched = []
+        while queue and len(dispatched) < count:
+            tag, pk = heapq.heappop(queue)
+            if self._queued.pop(pk, None) is None:
+                continue
+            self._virtual_time[runner] = tag
+            dispatched.append(pk)
+        if not queue:
+            # idle runner: owners tags are reset
+            self._queues.pop(runner, None)
+            for key in [key for key in self._last_tag if key[0] == runner]:
+                del self._last_tag[key]
+        return dispatched
+
+    def runner_key(self, job):
+        """ Runner slots key: adaptor class and connexion string """
+        if job._adaptor not in self._runners:
+            adaptor = adaptor_cache.for_job(job)
+            self._runners[job._adaptor] = '%s:%s' % (adaptor.__class__.__name__, adaptor.connexion_string()) \
+                if adaptor is not None else None
+        return self._runners[job._adaptor]
+
+    def runner_capacity(self, runner):
+        return self.runner_slots.get(runner, self.slots)
+
+    def schedule(self, jobs):
+        """ Update queues with jobs (all non terminated jobs), dispatch pending jobs to runners free slots
+
+        :return: ids of created jobs allowed to be prepared, dispatched now or in a previous cycle
+        """
+        active = {}
+        pending = []
+        created = set()
+        for job in jobs:
+            if job.status == JobStatus.JOB_CREATED:
+                created.add(job.pk)
+                if job.pk in self._dispatched:
+                    # dispatched but not prepared yet, keeps its slot
+                    runner = self.runner_key(job)
+                    active[runner] = active.get(runner, 0) + 1
+                elif job.pk not in self._queued:
+                    pending.append(job)
+            elif job.status in ACTIVE_STATUS:
+                runner = self.runner_key(job)
+                active[runner] = active.get(runner, 0) + 1
+        for pk in [pk for pk in list(self._queued.keys()) + list(self._dispatched) if pk not in created]:
+            self.discard(pk)
+        # creation order, so that rebuilt queues match previous ones
+        for job in sorted(pending, key=lambda j: (j.created, j.pk)):
+            self.enqueue(job.pk, job_owner(job), job.service, self.runner_key(job))
+        for runner in list(self._queues.keys()):
+            free = self.runner_capacity(runner) - active.get(runner, 0)
+            if free > 0:
+                self._dispatched.update(self.dispatch(runner, free))
+        return set(self._dispatched)
+
+    def statistics(self):
+        return dict(queued=len(self._queued), dispatched=len(self._dispatched),
+                    runners={runner: len(queue) for runner, queue in self._queues.items()})
@@ -0,0 +1,139 @@
+""" Buffered job history writer, used by demo adaptors when 'HISTORY_BUFFERED' is set """
+from __future__ import unicode_literals
+
+import logging
+import threading
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from waves.wcore.models.history import JobHistory
+
+from demo.settings import demo_settings
+
+logger = logging.getLogger('waves.daemon')
+
+__all__ = ['BufferedHistoryWriter', 'history_writer', 'add_job_history']
+
+
+class BufferedHistoryWriter(object):
+    """
+    Collect JobHistory entries in memory and write them with bulk inserts.
+
+    Consecutive entries with same status and message for a job are skipped (i.e. status polls where nothing
+    changed). Entries are timestamped when added, so that they keep their order with entries written directly (job
+    status changes), although they are written at most one daemon cycle later.
+    """
+
+    #: Max entries timestamps restored per UPDATE statement
+    batch_size = 100
+
+    def __init__(self, max_size=None):
+        self._max_size = max_size
+        self._entries = []
+        self._last = {}
+        self._lock = threading.RLock()
+        self.added = 0
+        self.skipped = 0
+        self.flushed = 0
+
+    @property
+    def max_size(self):
+        return self._max_size or demo_settings.HISTORY_BUFFER_SIZE
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, job, message, status=None, is_admin=False):
+        """ Add an history entry for job, flush if buffer is full
+
+        :return: True if entry has been buffered, False if skipped as a duplicate
+        """
+        status = job.status if status is None else status
+        with self._lock:
+            if self._last.get(job.pk) == (status, message, is_admin):
+                self.skipped += 1
+                return False
+            self._last[job.pk] = (status, message, is_admin)
+            self._entries.append(JobHistory(job=job, message=message, status=status, is_admin=is_admin,
+                                            timestamp=timezone.now()))
+            self.added += 1
+            if len(self._entries) >= self.max_size:
+                self.flush()
+        return True
+
+    def flush(self):
+        """ Write all buffered entries
+
+        :return: number of written entries
+        """
+        with self._lock:
+            entries, self._entries = self._entries, []
+            if not entries:
+                return 0
+            try:
+                with transaction.atomic():
+                    self._insert(entries)
+                written = len(entries)
+            except IntegrityError:
+                # Same (job, timestamp, status) already exists, fallback to single inserts ignoring them as
+                # JobHistory.save does
+                logger.warning('Bulk history insert failed, falling back to %i single inserts', len(entries))
+                written = 0
+                for entry in entries:
+                    try:
+                        with transaction.atomic():
+                            self._insert([entry])
+                        written += 1
+                    except IntegrityError:
+                        logger.warning('Duplicated history entry dropped: %s', entry)
+            self.flushed += written
+            logger.debug('Flushed %i job history entries', written)
+            return written
+
+    def _insert(self, entries):
+        """ Bulk insert entries. 'bulk_create' sets 'auto_now_add' timestamps to insert time, rows are then given back
+        their own timestamp with one UPDATE per batch, matched on their unique (job, timestamp, status, is_admin) """
+        timestamps = [entry.timestamp for entry in entries]
+        try:
+            JobHistory.objects.bulk_create(entries)
+            field = JobHistory._meta.get_field('timestamp')
+            for i in range(0, len(entries), self.batch_size):
+                batch = list(zip(entries[i:i + self.batch_size], timestamps[i:i + self.batch_size]))
+                JobHistory.objects.filter(job_id__in={entry.job_id for entry, _ in batch},
+                                          timestamp__in={entry.timestamp for entry, _ in batch}).update(
+                    timestamp=Case(*[When(job_id=entry.job_id, timestamp=entry.timestamp, status=entry.status,
+                                          is_admin=entry.is_admin, then=Value(timestamp, output_field=field))
+                                     for entry, timestamp in batch], default=F('timestamp'), output_field=field))
+        except IntegrityError:
+            # rolled back, entries may be inserted again
+            for entry in entries:
+                entry.pk = None
+            raise
+        finally:
+            for entry, timestamp in zip(entries, timestamps):
+                entry.timestamp = timestamp
+
+    def forget(self, job):
+        """ Forget last entry recorded for job (i.e when job is terminated) """
+        with self._lock:
+            self._last.pop(job.pk, None)
+
+    def reset(self):
+        """ Drop buffered entries and counters """
+        with self._lock:
+            self._entries = []
+            self._last = {}
+            self.added = self.skipped = self.flushed = 0
+
+
+#: Process wide history writer, demo adaptors are instantiated each time a job adaptor is accessed
+history_writer = BufferedHistoryWriter()
+
+
+def add_job_history(job, message, status=None, is_admin=False):
+    """ Record an history entry for job, either buffered or directly saved according to demo settings """
+    if demo_settings.HISTORY_BUFFERED:
+        return history_writer.add(job, message, status=status, is_admin=is_admin)
+    job.job_history.create(message=message, status=job.status if status is None else status, is_admin=is_admin)
+    return True
@@ -0,0 +1,164 @@
+""" Jobs working directories layout
+
+waves-core puts every job working directory right under 'JOB_BASE_DIR' (<base>/<slug>), a flat directory which becomes
+slow to look up, list and back up with hundreds of thousands of jobs. When 'JOB_DIR_SHARD_DEPTH' is set, directories
+are spread over prefix hashed sub directories: <base>/<h[0:w]>/<h[w:2w]>/<slug> for depth 2, h being job slug md5 hex
+digest and w 'JOB_DIR_SHARD_WIDTH' (2 levels of 2 digits: 65536 leaves, about 15 jobs each for 1M jobs).
+
+Job 'working_dir' property is replaced when demo application is ready by a resolver which falls back to the flat
+directory of jobs created before layout change, until they are moved with './manage.py demo_jobdirs'. Moves are
+resumable: progress is checkpointed in base directory after each batch of jobs.
+"""
+from __future__ import unicode_literals
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+from os.path import dirname, isdir, join
+
+from waves.wcore.adaptors.const import JobStatus
+
+from demo.settings import demo_settings
+
+__all__ = ['job_base_dir', 'flat_dir', 'sharded_dir', 'resolve_working_dir', 'install_resolver', 'move_job_dir',
+           'read_checkpoint', 'write_checkpoint', 'migrate_job_dirs']
+
+#: Move progress file, in jobs base directory
+CHECKPOINT_FILE = '.demo_jobdirs.json'
+
+
+def job_base_dir():
+    """ waves-core jobs base dir, read when called (settings may be overridden) """
+    from waves.wcore.settings import waves_settings
+    return waves_settings.JOB_BASE_DIR
+
+
+def flat_dir(base_dir, slug):
+    """ waves-core layout working dir """
+    return join(base_dir, str(slug))
+
+
+def sharded_dir(base_dir, slug, depth=None, width=None):
+    """ Sharded layout working dir (flat when depth is 0) """
+    depth = demo_settings.JOB_DIR_SHARD_DEPTH if depth is None else depth
+    width = width or demo_settings.JOB_DIR_SHARD_WIDTH
+    slug = str(slug)
+    digest = hashlib.md5(slug.encode('utf-8')).hexdigest()
+    return join(base_dir, *([digest[i * width:(i + 1) * width] for i in range(depth)] + [slug]))
+
+
+def resolve_working_dir(job):
+    """ Job working dir in configured layout, or its flat directory if it has not been moved yet """
+    base_dir = job_base_dir()
+    depth = demo_settings.JOB_DIR_SHARD_DEPTH
+    if depth <= 0:
+        return flat_dir(base_dir, job.slug)
+    layout = (base_dir, depth, demo_settings.JOB_DIR_SHARD_WIDTH)
+    resolved = job.__dict__.get('_demo_working_dir')
+    if resolved is not None and resolved[0] == layout:
+        return resolved[1]
+    path = sharded_dir(base_dir, job.slug, depth)
+    if isdir(path):
+        job.__dict__['_demo_working_dir'] = (layout, path)
+    elif isdir(flat_dir(base_dir, job.slug)):
+        # created before layout change
+        return flat_dir(base_dir, job.slug)
+    return path
+
+
+def install_resolver():
+    """ Resolve jobs working dirs with configured layout """
+    from waves.wcore.models import Job
+    Job.working_dir = property(resolve_working_dir, doc=resolve_working_dir.__doc__)
+
+
+def move_job_dir(source, target, shard_depth=0):
+    """ Move a job working dir, remove emptied shard directories (source shard depth)
+
+    :return: True if moved, False if already moved or missing
+    """
+    if isdir(target) or not isdir(source):
+        return False
+    parent = dirname(target)
+    if not isdir(parent):
+        try:
+            os.makedirs(parent)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+    try:
+        os.rename(source, target)
+    except OSError as exc:
+        if exc.errno != errno.EXDEV:
+            raise
+        shutil.move(source, target)
+    parent = dirname(source)
+    for _ in range(shard_depth):
+        try:
+            os.rmdir(parent)
+        except OSError:
+            break
+        parent = dirname(parent)
+    return True
+
+
+def read_checkpoint(path, target):
+    """ Last processed primary key saved in checkpoint file at path for target, 0 when missing or for another target """
+    try:
+        with open(path) as fp:
+            checkpoint = json.load(fp)
+    except (IOError, OSError, ValueError):
+        return 0
+    return checkpoint['last_pk'] if checkpoint.get('target') == target else 0
+
+
+def write_checkpoint(path, target, last_pk):
+    """ Save last processed primary key for target in checkpoint file at path (atomic rename) """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fp:
+        json.dump(dict(target=target, last_pk=last_pk), fp)
+    os.rename(tmp_path, path)
+
+
+def migrate_job_dirs(flat=False, include_running=False, batch=1000, restart=False, dry_run=False):
+    """ Move jobs working dirs to configured sharded layout (or back to flat layout), by batches of jobs in primary key
+    order, resuming after last checkpointed job unless restart is set. Unfinished jobs are skipped unless
+    include_running is set (their files may be written meanwhile).
+
+    :return: generator of progress dicts, one per batch
+    """
+    from waves.wcore.models import Job
+    base_dir = job_base_dir()
+    depth = demo_settings.JOB_DIR_SHARD_DEPTH
+    width = demo_settings.JOB_DIR_SHARD_WIDTH
+    if depth <= 0:
+        # moving back to flat layout also needs current sharded layout
+        raise ValueError("Sharded layout is not configured ('JOB_DIR_SHARD_DEPTH')")
+    target = 'flat' if flat else 'sharded:%i:%i' % (depth, width)
+    checkpoint = join(base_dir, CHECKPOINT_FILE)
+    last_pk = 0 if restart else read_checkpoint(checkpoint, target)
+    queryset = Job.objects.all()
+    if not include_running:
+        queryset = queryset.filter(_status__gte=JobStatus.JOB_TERMINATED)
+    progress = dict(target=target, resumed_after=last_pk, jobs=0, moved=0, skipped=0)
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'slug')[:batch])
+        if not rows:
+            break
+        for pk, slug in rows:
+            sharded = sharded_dir(base_dir, slug, depth, width)
+            source, target_dir = (sharded, flat_dir(base_dir, slug)) if flat else (flat_dir(base_dir, slug), sharded)
+            if dry_run:
+                moved = isdir(source) and not isdir(target_dir)
+            else:
+                moved = move_job_dir(source, target_dir, depth if flat else 0)
+            progress['moved' if moved else 'skipped'] += 1
+        progress['jobs'] += len(rows)
+        last_pk = rows[-1][0]
+        if not dry_run:
+            write_checkpoint(checkpoint, target, last_pk)
+        yield dict(progress, last_pk=last_pk)
+    if not dry_run and os.path.exists(checkpoint):
+        os.remove(checkpoint)
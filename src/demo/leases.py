@@ -0,0 +1,151 @@
+""" Job leases, for several daemon processes sharing a database
+
+A daemon only processes jobs it holds a lease on ('LEASES' setting). Each cycle it claims unleased jobs (or jobs with an
+expired lease, left by a crashed daemon) up to 'LEASE_BATCH' owned jobs, leases are kept until job ends, renewed by a
+heartbeat thread and expire after 'LEASE_TTL' seconds without renewal. Lease rows primary key (job id) ensures a job
+is claimed by one daemon only, databases supporting it also lock claimed jobs rows with SELECT ... FOR UPDATE SKIP
+LOCKED so that concurrent claims do not collide. Jobs may be sharded by runner over daemons ('LEASE_SHARDS').
+"""
+from __future__ import unicode_literals
+
+import datetime
+import logging
+import os
+import socket
+import threading
+import uuid
+import zlib
+
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from waves.wcore.models import Job
+
+from demo.models import JobLease
+from demo.settings import demo_settings
+
+logger = logging.getLogger('waves.daemon')
+
+__all__ = ['LeaseManager', 'runner_shard']
+
+
+def default_owner():
+    """ Daemon process unique name """
+    return '%s:%i:%s' % (socket.gethostname()[:60], os.getpid(), uuid.uuid4().hex[:8])
+
+
+def runner_shard(serialized_adaptor, shards):
+    """ Shard for job runner (serialized adaptor), stable across processes """
+    return (zlib.crc32((serialized_adaptor or '').encode('utf-8')) & 0xffffffff) % shards
+
+
+class LeaseManager(object):
+    """ Claim, renew and release jobs leases for a daemon (owner) """
+
+    def __init__(self, owner=None, ttl=None, batch=None, shards=None, shard=None):
+        self.owner = owner or default_owner()
+        self.ttl = ttl or demo_settings.LEASE_TTL
+        self.batch = batch or demo_settings.LEASE_BATCH
+        self.shards = demo_settings.LEASE_SHARDS if shards is None else shards
+        self.shard = demo_settings.LEASE_SHARD if shard is None else shard
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = dict(claimed=0, reclaimed=0, conflicts=0, renewed=0, released=0)
+
+    def _expires(self):
+        return timezone.now() + datetime.timedelta(seconds=self.ttl)
+
+    def owned(self):
+        """ Ids of jobs with a valid lease for this daemon """
+        return set(JobLease.objects.filter(owner=self.owner, expires__gt=timezone.now()).values_list(
+            'job_id', flat=True))
+
+    def candidates(self, queryset, limit):
+        """ Ids of jobs from queryset without a valid lease, in this daemon shard """
+        queryset = queryset.exclude(demo_lease__expires__gt=timezone.now()).order_by('pk')
+        if self.shards <= 1:
+            return list(queryset.values_list('pk', flat=True)[:limit])
+        pks = []
+        for pk, adaptor in queryset.values_list('pk', '_adaptor').iterator():
+            if runner_shard(adaptor, self.shards) == self.shard:
+                pks.append(pk)
+                if len(pks) >= limit:
+                    break
+        return pks
+
+    def claim(self, queryset):
+        """ Claim jobs from queryset, up to 'batch' owned jobs
+
+        :return: ids of owned jobs (claimed in previous cycles included)
+        """
+        owned = self.owned()
+        limit = self.batch - len(owned)
+        if limit > 0:
+            owned.update(self._claim(self.candidates(queryset, limit)))
+        return owned
+
+    def _claim(self, pks):
+        if not pks:
+            return []
+        now = timezone.now()
+        expires = self._expires()
+        with transaction.atomic():
+            if connection.features.has_select_for_update_skip_locked:
+                # jobs being claimed by another daemon are skipped
+                pks = list(Job.objects.select_for_update(skip_locked=True).filter(pk__in=pks).values_list(
+                    'pk', flat=True))
+            # expired leases: only ones still expired are deleted, a concurrent reclaim wins
+            reclaimed, _ = JobLease.objects.filter(job_id__in=pks, expires__lte=now).delete()
+            leases = [JobLease(job_id=pk, owner=self.owner, expires=expires) for pk in pks]
+            try:
+                with transaction.atomic():
+                    JobLease.objects.bulk_create(leases)
+            except IntegrityError:
+                # some jobs were claimed meanwhile, claim remaining ones one by one
+                for lease in leases:
+                    try:
+                        with transaction.atomic():
+                            lease.save(force_insert=True)
+                    except IntegrityError:
+                        self.stats['conflicts'] += 1
+        claimed = list(JobLease.objects.filter(owner=self.owner, job_id__in=pks).values_list('job_id', flat=True))
+        self.stats['claimed'] += len(claimed)
+        self.stats['reclaimed'] += reclaimed
+        if reclaimed:
+            logger.warning('%s reclaimed %i expired job lease(s)', self.owner, reclaimed)
+        return claimed
+
+    def renew(self):
+        """ Extend all leases held by this daemon, return renewed count """
+        renewed = JobLease.objects.filter(owner=self.owner).update(expires=self._expires())
+        self.stats['renewed'] += renewed
+        return renewed
+
+    def release(self, job):
+        """ Release job lease (job ended) """
+        self.stats['released'] += JobLease.objects.filter(job_id=job.pk, owner=self.owner).delete()[0]
+
+    def release_all(self):
+        self.stats['released'] += JobLease.objects.filter(owner=self.owner).delete()[0]
+
+    def start(self):
+        """ Start heartbeat thread (renew leases every third of their ttl) if not running """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='job-leases-heartbeat')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """ Stop heartbeat thread, release leases """
+        self._stop.set()
+        self.release_all()
+
+    def _run(self):
+        while not self._stop.wait(self.ttl / 3.0):
+            try:
+                self.renew()
+            except Exception as exc:
+                logger.exception('Job leases renewal failed for %s: %s', self.owner, exc)
+            finally:
+                connection.close()
@@ -0,0 +1,148 @@
+""" Adaptors instances cache
+
+Resolving an adaptor builds a new adaptor object each time: from job serialized configuration for jobs, from
+AdaptorInitParam rows (runner, service and submission ones) for runners, services and submissions. Cache keeps one
+built adaptor per configuration and returns shallow copies of it, so that each caller (daemon worker threads included)
+gets its own connection state.
+
+Job adaptors are keyed by job serialized adaptor (class and init params, any runner change gives a new key). Runner,
+service and submission adaptors are keyed by object and versions of the objects their params are read from, a version
+is bumped when the object or one of its init params is saved (see demo.signals), entries also expire after
+'ADAPTOR_CACHE_TIMEOUT' seconds for changes made by other processes.
+
+Jobs 'adaptor' property is resolved from cache, and kept on job object: waves-core reads it several times for each job
+action (and never disconnects it), each job transition now uses one adaptor, disconnected by daemon once done.
+"""
+from __future__ import unicode_literals
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from demo.settings import demo_settings
+
+__all__ = ['AdaptorCache', 'adaptor_cache', 'job_adaptor', 'install_job_adaptor']
+
+
+def _object_key(obj):
+    return obj._meta.label_lower, obj.pk
+
+
+class AdaptorCache(object):
+    """ Thread safe adaptors cache, counts built adaptors and cache hits """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._jobs = OrderedDict()
+        self._objects = {}
+        self._versions = {}
+        self._lock = threading.RLock()
+        self.stats = dict(built=0, hits=0, invalidated=0)
+
+    @staticmethod
+    def _dependencies(obj):
+        """ Objects keys run params are read from: object, its service (submissions) and its runner """
+        dependencies = [_object_key(obj)]
+        service = getattr(obj, 'service', None)
+        if service is not None and hasattr(service, 'run_params'):
+            dependencies.append(_object_key(service))
+        runner = obj.get_runner() if hasattr(obj, 'get_runner') else None
+        if runner is not None:
+            dependencies.append(_object_key(runner))
+        return dependencies
+
+    def _copy(self, adaptor):
+        self.stats['hits'] += 1
+        return copy.copy(adaptor)
+
+    @staticmethod
+    def _build(job):
+        """ Build job adaptor, as waves-core Job 'adaptor' property does """
+        if job._adaptor:
+            from waves.wcore.adaptors.loader import AdaptorLoader
+            try:
+                return AdaptorLoader.unserialize(job._adaptor)
+            except Exception as exc:
+                job.logger.exception("Unable to load %s adapter %s", job._adaptor, exc)
+                return None
+        return job.submission.adaptor if job.submission else None
+
+    def for_job(self, job):
+        """ Adaptor for job, None if job has no adaptor (or it can not be loaded) """
+        if not demo_settings.ADAPTOR_CACHE or not job._adaptor:
+            return self._build(job)
+        with self._lock:
+            adaptor = self._jobs.get(job._adaptor)
+            if adaptor is not None:
+                self._jobs[job._adaptor] = self._jobs.pop(job._adaptor)
+                return self._copy(adaptor)
+        adaptor = self._build(job)
+        if adaptor is None:
+            return None
+        with self._lock:
+            self.stats['built'] += 1
+            self._jobs[job._adaptor] = adaptor
+            while len(self._jobs) > demo_settings.ADAPTOR_CACHE_SIZE:
+                self._jobs.popitem(last=False)
+        return copy.copy(adaptor)
+
+    def get(self, obj):
+        """ Adaptor for a runner, service or submission, set as object adaptor so that later accesses to its
+        'adaptor' attribute do not load init params again """
+        if not demo_settings.ADAPTOR_CACHE or obj.pk is None:
+            return obj.adaptor
+        dependencies = self._dependencies(obj)
+        key = _object_key(obj)
+        now = self.clock()
+        with self._lock:
+            versions = tuple(self._versions.get(dependency, 0) for dependency in dependencies)
+            entry = self._objects.get(key)
+            if entry is not None and entry[0] == versions and entry[2] > now:
+                adaptor = self._copy(entry[1])
+                obj.adaptor = adaptor
+                return adaptor
+        adaptor = obj.adaptor
+        if adaptor is None:
+            return None
+        with self._lock:
+            self.stats['built'] += 1
+            self._objects[key] = (versions, copy.copy(adaptor), now + demo_settings.ADAPTOR_CACHE_TIMEOUT,
+                                  dependencies)
+        return adaptor
+
+    def invalidate(self, obj=None, label=None, pk=None):
+        """ Bump object (or label and pk) version, drop adaptors depending on it """
+        key = _object_key(obj) if obj is not None else (label, pk)
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            for object_key, entry in list(self._objects.items()):
+                if key in entry[3]:
+                    del self._objects[object_key]
+                    self.stats['invalidated'] += 1
+
+    def clear(self):
+        """ Drop all adaptors, reset counters """
+        with self._lock:
+            self._jobs.clear()
+            self._objects.clear()
+            self.stats = dict(built=0, hits=0, invalidated=0)
+
+
+adaptor_cache = AdaptorCache()
+
+
+def job_adaptor(job):
+    """ Job adaptor from adaptors cache, resolved once per job object (and adaptor configuration) """
+    resolved = job.__dict__.get('_demo_adaptor')
+    if resolved is None or resolved[0] != job._adaptor:
+        resolved = job.__dict__['_demo_adaptor'] = (job._adaptor, adaptor_cache.for_job(job))
+    return resolved[1]
+
+
+def install_job_adaptor():
+    """ Resolve jobs adaptors from adaptors cache, waves-core property is kept as 'core_adaptor' """
+    from waves.wcore.models import Job
+    if 'core_adaptor' not in Job.__dict__:
+        Job.core_adaptor = Job.__dict__['adaptor']
+        Job.adaptor = property(job_adaptor, Job.core_adaptor.fset, doc=job_adaptor.__doc__)
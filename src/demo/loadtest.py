@@ -0,0 +1,91 @@
+""" Demo adaptors load test mode, used for capacity testing ('./manage.py demo_load')
+
+When WAVES_DEMO 'LOAD_TEST' setting is set (a dict, see LOAD_TEST_DEFAULTS), demo adaptors do not sleep as the mock
+adaptor does: jobs wait in queue, run for a random time, then randomly complete, fail or are cancelled. Simulated
+schedule is encoded in job remote id, so that any process (or adaptor instance) polling job agrees on its state.
+"""
+from __future__ import unicode_literals
+
+import random
+import time
+
+from waves.wcore.adaptors.const import JobStatus
+
+from demo.settings import demo_settings
+
+__all__ = ['LOAD_TEST_DEFAULTS', 'load_test_profile', 'schedule_job', 'simulated_status', 'simulated_exit']
+
+LOAD_TEST_DEFAULTS = {
+    #: Seconds a job stays queued before running
+    'QUEUE_WAIT': 0,
+    #: Run time distribution (seconds): normal distribution mean and standard deviation (clipped to 0)
+    'RUNTIME_MEAN': 5,
+    'RUNTIME_SD': 2,
+    #: Part of jobs ending in error
+    'FAILURE_RATE': 0.0,
+    #: Part of jobs cancelled while running
+    'CANCEL_RATE': 0.0,
+    #: Number of output files written for each job (in addition to standard ones), size is 'RESULTS_OUTPUT_SIZE'
+    'OUTPUTS': 1,
+    #: Latency (seconds) for each remote call (status poll, run, prepare)
+    'POLL_LATENCY': 0,
+}
+
+
+_OUTCOMES = {
+    'ok': JobStatus.JOB_COMPLETED,
+    'fail': JobStatus.JOB_ERROR,
+    'cancel': JobStatus.JOB_CANCELLED,
+}
+
+#: Simulated local process exit code
+_EXIT_CODES = {
+    'ok': 0,
+    'fail': 1,
+    'cancel': 143,
+}
+
+
+def load_test_profile():
+    """ Current load test profile (dict) or None if load test mode is off """
+    profile = demo_settings.LOAD_TEST
+    if profile is None:
+        return None
+    return dict(LOAD_TEST_DEFAULTS, **profile)
+
+
+def schedule_job(job, profile, prefix='load'):
+    """ Draw simulated schedule for job, return its remote job id (prefix is array task id for array jobs) """
+    queued_until = time.time() + profile['QUEUE_WAIT']
+    finished_at = queued_until + max(0, random.gauss(profile['RUNTIME_MEAN'], profile['RUNTIME_SD']))
+    draw = random.random()
+    if draw < profile['FAILURE_RATE']:
+        outcome = 'fail'
+    elif draw < profile['FAILURE_RATE'] + profile['CANCEL_RATE']:
+        outcome = 'cancel'
+    else:
+        outcome = 'ok'
+    return '%s:%s:%.3f:%.3f:%s' % (prefix, job.pk, queued_until, finished_at, outcome)
+
+
+def simulated_status(job):
+    """ Simulated remote status for job, according to schedule in its remote id """
+    try:
+        prefix, pk, queued_until, finished_at, outcome = job.remote_job_id.rsplit(':', 4)
+    except (AttributeError, ValueError):
+        return JobStatus.JOB_UNDEFINED
+    now = time.time()
+    if now < float(queued_until):
+        return JobStatus.JOB_QUEUED
+    if now < float(finished_at):
+        return JobStatus.JOB_RUNNING
+    return _OUTCOMES.get(outcome, JobStatus.JOB_UNDEFINED)
+
+
+def simulated_exit(job):
+    """ Seconds before simulated job process ends and its exit code, None if job has no simulated schedule """
+    try:
+        prefix, pk, queued_until, finished_at, outcome = job.remote_job_id.rsplit(':', 4)
+    except (AttributeError, ValueError):
+        return None
+    return max(0, float(finished_at) - time.time()), _EXIT_CODES.get(outcome, 1)
@@ -0,0 +1,37 @@
+from __future__ import unicode_literals, absolute_import
+
+from django.core.management import BaseCommand
+
+from demo.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    """
+    Run WAVES demo benchmarks and print results
+    """
+    help = 'Run WAVES demo benchmarks against configured database (nothing is kept)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=list(BENCHMARKS.keys()), action='store', help="Benchmark name")
+        parser.add_argument('--jobs', action='store', dest='jobs', type=int, default=1000,
+                            help='Number of jobs used in benchmark')
+        parser.add_argument('--cycles', action='store', dest='cycles', type=int, default=3,
+                            help='Number of daemon cycles simulated')
+        parser.add_argument('--requests', action='store', dest='requests', type=int, default=10000,
+                            help='Number of simulated HTTP requests')
+        parser.add_argument('--size', action='store', dest='size', type=float, default=1,
+                            help='Size (MB) of generated job outputs')
+        parser.add_argument('--runners', action='store', dest='runners', type=int, default=4,
+                            help='Number of simulated runners')
+        parser.add_argument('--latency', action='store', dest='latency', type=float, default=0.05,
+                            help='Injected remote calls latency (seconds)')
+        parser.add_argument('--processes', action='store', dest='processes', type=int, default=4,
+                            help='Number of daemon processes')
+        parser.add_argument('--dirs', action='store', dest='dirs', type=int, default=1000000,
+                            help='Number of jobs working dirs created')
+
+    def handle(self, *args, **options):
+        bench = BENCHMARKS[options.pop('name')]
+        self.stdout.write(bench.__doc__.strip())
+        for row in bench(**options):
+            self.stdout.write(' | '.join('%s: %s' % (key, value) for key, value in row.items()))
@@ -0,0 +1,40 @@
+from __future__ import unicode_literals, absolute_import
+
+from django.core.management import BaseCommand, CommandError
+
+from demo.jobdirs import migrate_job_dirs
+
+
+class Command(BaseCommand):
+    """
+    Move existing jobs working dirs to sharded layout ('JOB_DIR_SHARD_DEPTH' demo setting), see demo.jobdirs
+    """
+    help = 'Move jobs working dirs to configured sharded layout, or back to flat layout (--flat, to be run before ' \
+           'resetting JOB_DIR_SHARD_DEPTH). Interrupted moves resume after last checkpointed job'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flat', action='store_true', dest='flat', default=False,
+                            help='Move jobs working dirs back to waves-core flat layout')
+        parser.add_argument('--all', action='store_true', dest='include_running', default=False,
+                            help='Also move unfinished jobs working dirs (daemon should be stopped)')
+        parser.add_argument('--batch', action='store', dest='batch', type=int, default=1000,
+                            help='Jobs moved between two checkpoints')
+        parser.add_argument('--restart', action='store_true', dest='restart', default=False,
+                            help='Ignore checkpoint, check all jobs again')
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run', default=False,
+                            help='Only report directories to be moved')
+
+    def handle(self, *args, **options):
+        progress = None
+        try:
+            for progress in migrate_job_dirs(flat=options['flat'], include_running=options['include_running'],
+                                             batch=options['batch'], restart=options['restart'],
+                                             dry_run=options['dry_run']):
+                self.stdout.write('%(target)s: %(jobs)i job(s) checked, %(moved)i moved, %(skipped)i skipped '
+                                  '(last job id %(last_pk)i)' % progress)
+        except ValueError as exc:
+            raise CommandError(exc)
+        if progress is None:
+            self.stdout.write('No job to move')
+        elif progress['resumed_after']:
+            self.stdout.write('Resumed after job id %(resumed_after)i' % progress)
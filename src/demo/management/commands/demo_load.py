@@ -0,0 +1,99 @@
+from __future__ import unicode_literals, absolute_import
+
+from django.core.management import BaseCommand, CommandError
+from waves.wcore.adaptors.const import JobStatus
+from waves.wcore.models import get_submission_model
+
+from demo.adaptors import WavesDemoAdaptor
+from demo.benchmarks import LoadTest, bench_environment, demo_settings_override, percentile
+from demo.loader import adaptor_cache
+
+
+class Command(BaseCommand):
+    """
+    Capacity test: submit jobs to demo services, run them with demo adaptors load test mode and report metrics
+    """
+    help = 'Submit N jobs across configured demo services, drive them through their lifecycle (load test mode) ' \
+           'and report throughput, latencies and queries per status transition (nothing is kept)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', action='store', dest='jobs', type=int, default=100,
+                            help='Number of jobs submitted')
+        parser.add_argument('--services', action='store', dest='services', nargs='*',
+                            help='Services api names (default: all services run by a demo adaptor)')
+        parser.add_argument('--queue-wait', action='store', dest='QUEUE_WAIT', type=float, default=0,
+                            help='Simulated time in queue (seconds)')
+        parser.add_argument('--runtime', action='store', dest='RUNTIME_MEAN', type=float, default=5,
+                            help='Mean run time (seconds)')
+        parser.add_argument('--runtime-sd', action='store', dest='RUNTIME_SD', type=float, default=2,
+                            help='Run time standard deviation (seconds)')
+        parser.add_argument('--failure-rate', action='store', dest='FAILURE_RATE', type=float, default=0,
+                            help='Part of jobs ending in error (0-1)')
+        parser.add_argument('--cancel-rate', action='store', dest='CANCEL_RATE', type=float, default=0,
+                            help='Part of jobs cancelled (0-1)')
+        parser.add_argument('--outputs', action='store', dest='OUTPUTS', type=int, default=1,
+                            help='Output files per job')
+        parser.add_argument('--output-size', action='store', dest='output_size', type=float, default=0,
+                            help='Output files size (MB)')
+        parser.add_argument('--poll-latency', action='store', dest='POLL_LATENCY', type=float, default=0,
+                            help='Simulated latency for each remote call (seconds)')
+        parser.add_argument('--workers', action='store', dest='workers', type=int, default=0,
+                            help='Daemon worker threads (0: sequential loop), jobs are then committed and deleted '
+                                 'afterwards')
+        parser.add_argument('--poll-interval', action='store', dest='poll_interval', type=float, default=1,
+                            help='Min status check interval (seconds), 0 to poll running jobs on each cycle')
+        parser.add_argument('--interval', action='store', dest='interval', type=float, default=1,
+                            help='Sleep time between two daemon cycles (seconds)')
+        parser.add_argument('--timeout', action='store', dest='timeout', type=float, default=600,
+                            help='Stop after this time (seconds)')
+
+    def get_submissions(self, services):
+        """ Default submissions run with a demo adaptor supporting load test mode """
+        queryset = get_submission_model().objects.select_related('service', 'runner', 'service__runner')
+        if services:
+            queryset = queryset.filter(service__api_name__in=services)
+        submissions = {}
+        for submission in queryset.order_by('service', 'order', 'pk'):
+            adaptor = adaptor_cache.get(submission)
+            if isinstance(adaptor, WavesDemoAdaptor) and adaptor.stage_results:
+                submissions.setdefault(submission.service_id, submission)
+        return list(submissions.values())
+
+    def handle(self, *args, **options):
+        profile = {key: options[key] for key in ('QUEUE_WAIT', 'RUNTIME_MEAN', 'RUNTIME_SD', 'FAILURE_RATE',
+                                                 'CANCEL_RATE', 'OUTPUTS', 'POLL_LATENCY')}
+        submissions = self.get_submissions(options['services'])
+        if not submissions:
+            raise CommandError('No service run with a demo adaptor')
+        self.stdout.write('Load test on %i service(s): %s' % (
+            len(submissions), ', '.join(submission.service.api_name for submission in submissions)))
+        # worker threads use their own database connection, they can not see jobs created in a transaction
+        workers = options['workers']
+        with bench_environment(rollback=not workers), demo_settings_override(
+                LOAD_TEST=profile, RESULTS_OUTPUT_SIZE=options['output_size'], WORKERS=workers,
+                POLL_MIN_INTERVAL=options['poll_interval']):
+            load_test = LoadTest(submissions, interval=options['interval'], timeout=options['timeout'])
+            try:
+                elapsed = load_test.run(options['jobs'])
+            finally:
+                if workers:
+                    load_test.delete_jobs()
+        self.report(load_test, elapsed)
+
+    def report(self, load_test, elapsed):
+        finished = len(load_test.final_status)
+        self.stdout.write('jobs: %i | finished: %i | seconds: %.1f | jobs / s: %.2f' % (
+            len(load_test.submitted), finished, elapsed, finished / elapsed if elapsed else 0))
+        statuses = {}
+        for status in load_test.final_status.values():
+            statuses[status] = statuses.get(status, 0) + 1
+        self.stdout.write('final status: ' + ' | '.join(
+            '%s: %i' % (JobStatus.STATUS_MAP.get(status), count) for status, count in sorted(statuses.items())))
+        self.stdout.write('lifecycle latency (s): p50: %.2f | p95: %.2f | p99: %.2f' % tuple(
+            percentile(load_test.latencies, percent) for percent in (50, 95, 99)))
+        polls = load_test.poll_scheduler.statistics()
+        self.stdout.write('status polls: %i | saved: %i | saved / hour: %.1f' % (
+            polls['polls'], polls['saved'], polls['saved_per_hour']))
+        self.stdout.write('queries per transition:')
+        for transition, (count, queries) in load_test.transitions.items():
+            self.stdout.write('  %s: %i time(s) | %.1f queries' % (transition, count, queries / float(count)))
@@ -0,0 +1,39 @@
+from __future__ import unicode_literals, absolute_import
+
+from django.core.management import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from demo.purge import purge_jobs
+
+
+class Command(BaseCommand):
+    """
+    Purge expired jobs by batches, to be scheduled (cron) instead of 'wpurge' daemon, see demo.purge
+    """
+    help = 'Purge jobs expired for KEEP_ANONYMOUS_JOBS / KEEP_REGISTERED_JOBS days, except jobs of services or ' \
+           'submissions not set for automatic deletion. Interrupted purges resume after last checkpointed job'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', action='store', dest='batch', type=int, default=None,
+                            help='Jobs deleted between two checkpoints (default PURGE_BATCH setting)')
+        parser.add_argument('--workers', action='store', dest='workers', type=int, default=None,
+                            help='Threads removing jobs dirs (default PURGE_WORKERS setting)')
+        parser.add_argument('--io-rate', action='store', dest='io_rate', type=int, default=None,
+                            help='Max files removed per second, 0 for no limit (default PURGE_IO_RATE setting)')
+        parser.add_argument('--restart', action='store_true', dest='restart', default=False,
+                            help='Ignore checkpoint, check all jobs again')
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run', default=False,
+                            help='Only report rows and bytes to be reclaimed')
+
+    def handle(self, *args, **options):
+        verb = 'to purge' if options['dry_run'] else 'purged'
+        for progress in purge_jobs(batch=options['batch'], dry_run=options['dry_run'], restart=options['restart'],
+                                   workers=options['workers'], io_rate=options['io_rate']):
+            progress = dict(progress, verb=verb, size=filesizeformat(progress['bytes']))
+            if not progress['done']:
+                self.stdout.write('%(jobs)i job(s) %(verb)s, %(rows)i rows, %(dirs)i dirs (last job id %(last_pk)i)'
+                                  % progress)
+            else:
+                if progress['resumed_after']:
+                    self.stdout.write('Resumed after job id %(resumed_after)i' % progress)
+                self.stdout.write('Done: %(jobs)i job(s) %(verb)s, %(rows)i rows, %(dirs)i dirs, %(size)s' % progress)
@@ -0,0 +1,19 @@
+from __future__ import unicode_literals, absolute_import
+
+import os
+import tempfile
+
+from waves.wcore.management.daemoncommand import DaemonCommand
+
+from demo.daemon import DemoJobQueueRunDaemon
+
+
+class Command(DaemonCommand):
+    """
+    WAVES demo job queue daemon, to be used instead of 'wqueue' when demo adaptors optimizations are enabled
+    """
+    help = 'Managing WAVES demo job queue states'
+    SLEEP_TIME = 2
+    pidfile = os.path.join(tempfile.gettempdir(), 'waves_demo_queue.pid')
+    pidfile_timeout = 5
+    _class = DemoJobQueueRunDaemon
@@ -0,0 +1,46 @@
+""" Service metas grouped by type, loaded in one query and cached per service until one of its metas changes """
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+from demo.models import ServiceMeta
+from demo.settings import demo_settings
+
+__all__ = ['get_service_metas', 'invalidate_service_metas']
+
+CACHE_KEY = 'demo.service_metas.%s'
+
+
+def _load_service_metas(service_id):
+    """ Load all metas for service, grouped by type (one query) """
+    grouped = OrderedDict()
+    for meta in ServiceMeta.objects.filter(service_id=service_id).order_by('type', 'order', 'pk'):
+        grouped.setdefault(meta.type, []).append(dict(type=meta.type,
+                                                      title=meta.title,
+                                                      value=meta.value,
+                                                      is_url=meta.is_url,
+                                                      description=meta.description,
+                                                      order=meta.order))
+    return grouped
+
+
+def get_service_metas(service):
+    """ Retrieve service metas as a mapping type: list of metas (ordered by type, then order)
+
+    :param service: a service instance or its id
+    :rtype: OrderedDict
+    """
+    service_id = getattr(service, 'pk', service)
+    key = CACHE_KEY % service_id
+    grouped = cache.get(key)
+    if grouped is None:
+        grouped = _load_service_metas(service_id)
+        cache.set(key, grouped, demo_settings.SERVICE_METAS_CACHE_TIMEOUT)
+    return grouped
+
+
+def invalidate_service_metas(service_id):
+    """ Drop cached metas for service """
+    cache.delete(CACHE_KEY % service_id)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import mptt.fields
+
+
+def build_tree(apps, schema_editor):
+    """ Compute nested set values for existing categories (historical models have no mptt manager) """
+    ServiceCategory = apps.get_model('demo', 'ServiceCategory')
+    children = {}
+    for category in ServiceCategory.objects.order_by('name', 'pk'):
+        children.setdefault(category.parent_id, []).append(category)
+
+    def walk(category, tree_id, level, left):
+        right = left + 1
+        for child in children.get(category.pk, []):
+            right = walk(child, tree_id, level + 1, right) + 1
+        ServiceCategory.objects.filter(pk=category.pk).update(tree_id=tree_id, level=level, lft=left, rght=right)
+        return right
+
+    for tree_id, root in enumerate(children.get(None, []), 1):
+        walk(root, tree_id, 0, 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('demo', '0002_auto_20180608_0125'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicecategory',
+            name='level',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='servicecategory',
+            name='lft',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='servicecategory',
+            name='rght',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='servicecategory',
+            name='tree_id',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='servicecategory',
+            name='parent',
+            field=mptt.fields.TreeForeignKey(blank=True, help_text='Parent category', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children_category', to='demo.ServiceCategory'),
+        ),
+        migrations.AlterIndexTogether(
+            name='servicecategory',
+            index_together=set([('tree_id', 'lft')]),
+        ),
+        migrations.RunPython(build_tree, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wcore', '0001_initial'),
+        ('demo', '0003_servicecategory_tree'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobLease',
+            fields=[
+                ('job', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True,
+                                             related_name='demo_lease', serialize=False, to='wcore.Job')),
+                ('owner', models.CharField(db_index=True, max_length=100, verbose_name='Daemon')),
+                ('expires', models.DateTimeField(db_index=True, verbose_name='Lease expiration')),
+            ],
+            options={
+                'verbose_name': 'Job lease',
+            },
+        ),
+    ]
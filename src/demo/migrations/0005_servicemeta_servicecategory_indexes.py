@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('demo', '0004_joblease'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='servicecategory',
+            index_together=set([('tree_id', 'lft'), ('parent', 'order')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='servicemeta',
+            index_together=set([('service', 'type', 'order')]),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+#: Indexes on waves-core jobs table (name, columns), for daemon pending jobs, users / emails jobs listings and jobs
+#: list keyset pagination
+JOB_INDEXES = [
+    ('demo_job_status_updated', ('_status', 'updated')),
+    ('demo_job_client_updated', ('client_id', 'updated', 'created')),
+    ('demo_job_email_updated', ('email_to', 'updated', 'created')),
+    ('demo_job_created_id', ('created', 'id')),
+]
+
+
+def create_job_indexes(apps, schema_editor):
+    """ Jobs table may be large: indexes are built without locking writes on PostgreSQL """
+    table = apps.get_model('wcore', 'Job')._meta.db_table
+    quote = schema_editor.quote_name
+    concurrently = ' CONCURRENTLY' if schema_editor.connection.vendor == 'postgresql' else ''
+    for name, columns in JOB_INDEXES:
+        schema_editor.execute('CREATE INDEX%s %s ON %s (%s)' % (concurrently, quote(name), quote(table),
+                                                                ', '.join(quote(column) for column in columns)))
+
+
+def drop_job_indexes(apps, schema_editor):
+    table = apps.get_model('wcore', 'Job')._meta.db_table
+    for name, _ in JOB_INDEXES:
+        schema_editor.execute(schema_editor.sql_delete_index % {'name': schema_editor.quote_name(name),
+                                                                'table': schema_editor.quote_name(table)})
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can not run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('wcore', '0001_initial'),
+        ('demo', '0005_servicemeta_servicecategory_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_job_indexes, drop_job_indexes),
+    ]
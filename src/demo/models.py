@@ -2,25 +2,61 @@
 from __future__ import unicode_literals
 
 from django.db import models
+from mptt.fields import TreeForeignKey
+from mptt.managers import TreeManager
+from mptt.models import MPTTModel
 import swapper
 from waves.wcore.models.base import Ordered, Described
 from waves.wcore.models.services import BaseService, BaseSubmission
 
-__all__ = ['ServiceMeta', 'ServiceCategory', 'DemoWavesService', 'DemoWavesSubmission']
+__all__ = ['ServiceMeta', 'ServiceCategory', 'DemoWavesService', 'DemoWavesSubmission', 'JobLease']
 
 
-class ServiceCategory(Ordered, Described):
-    """ Service category """
+class ServiceCategoryManager(TreeManager):
+    """ Service categories tree manager """
+
+    def with_services_count(self, queryset=None, cumulative=True):
+        """ Annotate categories with 'services_count', including services from sub categories if cumulative
+
+        :param queryset: categories to annotate, all by default
+        :param cumulative: count services in whole sub tree (one query, whatever the tree depth)
+        :return: QuerySet
+        """
+        if queryset is None:
+            queryset = self.all()
+        return self.add_related_count(queryset, DemoWavesService, 'category', 'services_count', cumulative=cumulative)
+
+
+class ServiceCategory(MPTTModel, Ordered, Described):
+    """ Service category, stored as a nested set tree (mptt): whole sub tree, ancestors or recursive services count
+    are each retrieved with one query """
 
     class Meta:
         ordering = ['name']
         verbose_name_plural = "Categories"
         verbose_name = "Category"
+        index_together = [('tree_id', 'lft'), ('parent', 'order')]
 
+    class MPTTMeta:
+        order_insertion_by = ['name']
+
+    objects = ServiceCategoryManager()
     name = models.CharField('Category Name', null=False, blank=False, max_length=255, help_text='Category name')
     ref = models.URLField('Reference', null=True, blank=True, help_text='Category online reference')
-    parent = models.ForeignKey('self', null=True, blank=True, help_text='Parent category',
-                               related_name='children_category', db_index=True)
+    parent = TreeForeignKey('self', null=True, blank=True, help_text='Parent category',
+                            related_name='children_category', db_index=True, on_delete=models.CASCADE)
+
+    def get_tree_services(self, queryset=None):
+        """ Filter services to those in this category sub tree (including itself)
+
+        :param queryset: services queryset to filter, all services by default
+        :return: QuerySet
+        """
+        if queryset is None:
+            queryset = DemoWavesService.objects.all()
+        return queryset.filter(category__tree_id=self.tree_id,
+                               category__lft__gte=self.lft,
+                               category__rght__lte=self.rght)
 
     def __str__(self):
         return self.name
@@ -87,6 +123,7 @@ class ServiceMeta(Ordered, Described):
         verbose_name = 'Service links'
         verbose_name_plural = "Service links"
         app_label = "demo"
+        index_together = [('service', 'type', 'order')]
 
     type = models.CharField('Meta type', max_length=100, choices=SERVICE_META)
     title = models.CharField('Title', max_length=255, blank=True, null=True)
@@ -107,3 +144,20 @@ class ServiceMeta(Ordered, Described):
 
     def __unicode__(self):
         return '%s [%s]' % (self.title, self.type)
+
+
+class JobLease(models.Model):
+    """ Job claimed by a daemon process until lease expires (see demo.leases) """
+
+    class Meta:
+        verbose_name = "Job lease"
+
+    job = models.OneToOneField('wcore.Job', primary_key=True, on_delete=models.CASCADE, related_name='demo_lease')
+    owner = models.CharField('Daemon', max_length=100, db_index=True)
+    expires = models.DateTimeField('Lease expiration', db_index=True)
+
+    def __str__(self):
+        return '%s:%s' % (self.owner, self.job_id)
+
+    def __unicode__(self):
+        return self.__str__()
@@ -0,0 +1,151 @@
+""" Keyset (cursor) pagination, for large tables lists
+
+OFFSET pagination counts all rows and scans every skipped row. Pages are here read from a cursor instead, the
+(created, id) key of the row the page starts after (or ends before), newest rows first: each page costs a bounded
+index range scan whatever its depth. Links to nearby pages ('JOB_LIST_PAGE_LINKS' on each side) are computed from the
+keys of the rows surrounding the page, page numbers are relative to the first page and only displayed.
+"""
+from __future__ import unicode_literals
+
+import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import Http404
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from demo.settings import demo_settings
+
+__all__ = ['encode_cursor', 'decode_cursor', 'older_than', 'newer_than', 'KeysetPaginator', 'KeysetPage']
+
+_CURSOR_FORMAT = '%Y%m%d%H%M%S%f'
+
+
+def encode_cursor(created, pk):
+    """ Cursor for row key """
+    if timezone.is_aware(created):
+        created = timezone.make_naive(created, timezone.utc)
+    return '%s-%i' % (created.strftime(_CURSOR_FORMAT), pk)
+
+
+def decode_cursor(cursor):
+    """ Row key (created, id) for cursor, raise ValueError if cursor is invalid """
+    created, pk = cursor.split('-')
+    created = datetime.datetime.strptime(created, _CURSOR_FORMAT)
+    if settings.USE_TZ:
+        created = timezone.make_aware(created, timezone.utc)
+    return created, int(pk)
+
+
+def older_than(key):
+    """ Filter rows before (created, id) key in newest first order """
+    return Q(created__lt=key[0]) | Q(created=key[0], pk__lt=key[1])
+
+
+def newer_than(key):
+    """ Filter rows after (created, id) key in newest first order """
+    return Q(created__gt=key[0]) | Q(created=key[0], pk__gt=key[1])
+
+
+class KeysetPage(object):
+    """ One page of rows, with links to surrounding pages (number, query string) """
+
+    def __init__(self, object_list, number, previous_links, next_links):
+        self.object_list = object_list
+        self.number = number
+        self.previous_links = previous_links
+        self.next_links = next_links
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_previous(self):
+        return bool(self.previous_links)
+
+    def has_next(self):
+        return bool(self.next_links)
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    @property
+    def previous_query(self):
+        return self.previous_links[-1][1] if self.previous_links else None
+
+    @property
+    def next_query(self):
+        return self.next_links[0][1] if self.next_links else None
+
+    @property
+    def page_links(self):
+        """ Links window around current page, current page query is None """
+        return self.previous_links + [(self.number, None)] + self.next_links
+
+
+class KeysetPaginator(object):
+    """ Paginate queryset on (created, id), newest first """
+
+    def __init__(self, queryset, per_page, window=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.window = demo_settings.JOB_LIST_PAGE_LINKS if window is None else window
+
+    def _keys(self, condition, ordering):
+        """ Keys of up to 'window' pages of rows matching condition """
+        return list(self.queryset.filter(condition).order_by(*ordering).values_list('created', 'pk')[
+                    :self.per_page * max(self.window, 1)])
+
+    @staticmethod
+    def _query(cursor_name, key, number):
+        if number <= 1:
+            return ''
+        return urlencode([(cursor_name, encode_cursor(*key)), ('page', number)])
+
+    def page(self, after=None, before=None, number=1):
+        """ Page of rows after (older) or before (newer) a cursor, first page if none is given
+
+        :raise: Http404 if cursor is invalid
+        """
+        try:
+            after = decode_cursor(after) if after else None
+            before = decode_cursor(before) if before else None
+        except ValueError:
+            raise Http404('Invalid page cursor')
+        if before is not None:
+            rows = list(self.queryset.filter(newer_than(before)).order_by('created', 'pk')[:self.per_page])
+            if len(rows) < self.per_page:
+                # reached newest rows
+                return self.page()
+            rows.reverse()
+        elif after is not None:
+            rows = list(self.queryset.filter(older_than(after)).order_by('-created', '-pk')[:self.per_page])
+        else:
+            rows = list(self.queryset.order_by('-created', '-pk')[:self.per_page])
+        number = max(number, 2) if after is not None or before is not None else 1
+        if not rows:
+            return KeysetPage(rows, number, [], [])
+        first, last = (rows[0].created, rows[0].pk), (rows[-1].created, rows[-1].pk)
+        previous_links = []
+        if number > 1:
+            preceding = self._keys(newer_than(first), ('created', 'pk'))
+            if not preceding:
+                number = 1
+            for index in range(0, len(preceding), self.per_page):
+                page_number = number - len(previous_links) - 1
+                if page_number < 1 or len(previous_links) >= self.window:
+                    break
+                key = first if index == 0 else preceding[index - 1]
+                previous_links.insert(0, (page_number, self._query('before', key, page_number)))
+        next_links = []
+        following = self._keys(older_than(last), ('-created', '-pk'))
+        for index in range(0, len(following), self.per_page):
+            if len(next_links) >= self.window:
+                break
+            page_number = number + len(next_links) + 1
+            key = last if index == 0 else following[index - 1]
+            next_links.append((page_number, self._query('after', key, page_number)))
+        return KeysetPage(rows, number, previous_links, next_links)
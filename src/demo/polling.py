@@ -0,0 +1,83 @@
+""" Bulk job status polling: one remote call per runner, status transitions and history written in bulk """
+from __future__ import unicode_literals
+
+import logging
+from collections import OrderedDict
+
+from django.utils import timezone
+from django.utils.encoding import smart_text
+from waves.wcore.adaptors.const import JobStatus
+from waves.wcore.adaptors.exceptions import AdaptorException
+from waves.wcore.models import Job
+
+from demo.history import BufferedHistoryWriter, history_writer
+from demo.loader import adaptor_cache
+from demo.settings import demo_settings
+
+logger = logging.getLogger('waves.daemon')
+
+__all__ = ['POLLED_STATUS', 'poll_jobs']
+
+#: Jobs status polled in bulk, undefined jobs are left to per job processing (retries)
+POLLED_STATUS = (JobStatus.JOB_QUEUED, JobStatus.JOB_RUNNING, JobStatus.JOB_SUSPENDED)
+
+#: Max jobs updated per UPDATE statement
+BATCH_SIZE = 500
+
+
+def _group_by_runner(jobs):
+    """ Group jobs to poll by adaptor (serialized adaptor is the same for all jobs run on a runner) """
+    groups = OrderedDict()
+    for job in jobs:
+        if job.status in POLLED_STATUS and job._adaptor:
+            groups.setdefault(job._adaptor, []).append(job)
+    return groups.values()
+
+
+def _transition_message(job, status):
+    """ History message for status change, as set by Job.status setter """
+    if job.message:
+        return "[{}] {}".format(status, smart_text(job.message))
+    return "New job status {}".format(status)
+
+
+def poll_jobs(jobs):
+    """ Poll status for jobs with adaptors supporting it ('bulk_status'), with one call per runner. Changed status
+    are saved with one UPDATE per status, history entries with one INSERT (or buffered, see 'HISTORY_BUFFERED').
+
+    :return: list of polled jobs, their status updated
+    """
+    writer = history_writer if demo_settings.HISTORY_BUFFERED else BufferedHistoryWriter()
+    polled = []
+    changed = OrderedDict()
+    for group in _group_by_runner(jobs):
+        adaptor = adaptor_cache.for_job(group[0])
+        if adaptor is None or not getattr(adaptor, 'bulk_status', False):
+            continue
+        try:
+            statuses = adaptor.jobs_status(group)
+        except AdaptorException as exc:
+            # left to per job processing
+            logger.error('Bulk status failed for %i job(s) (adaptor:%s): %s', len(group), adaptor, exc)
+            continue
+        finally:
+            adaptor.disconnect()
+        for job in group:
+            status = statuses.get(job.pk, JobStatus.JOB_UNDEFINED)
+            if status == JobStatus.JOB_UNDEFINED:
+                continue
+            if status != job.status:
+                writer.add(job, _transition_message(job, status), status=status)
+                changed.setdefault(status, []).append(job)
+                job._status = status
+            job.nb_retry = 0
+            polled.append(job)
+    now = timezone.now()
+    for status, status_jobs in changed.items():
+        for i in range(0, len(status_jobs), BATCH_SIZE):
+            Job.objects.filter(pk__in=[job.pk for job in status_jobs[i:i + BATCH_SIZE]]).update(
+                _status=status, nb_retry=0, updated=now)
+    if writer is not history_writer:
+        writer.flush()
+    logger.debug('Bulk polled %i job(s), %i status change(s)', len(polled), sum(len(j) for j in changed.values()))
+    return polled
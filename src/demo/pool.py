@@ -0,0 +1,198 @@
+""" Remote connections pool shared by jobs of a same runner
+
+Ssh adaptors open a session (SSH handshake, SAGA service) each time they connect, that is for each job step. Pool
+keeps a bounded number of long lived sessions per runner key ('SSH_POOL_SIZE'), operations from many jobs are
+multiplexed over them, up to 'SSH_POOL_MAX_SHARED' operations per session, others wait for a free one. Idle sessions
+are health checked before reuse when they have been idle for a while, evicted when idle for too long. Sessions
+reported broken while shared are not handed out anymore, and closed once their last operation ends. Failing
+connections are retried with an exponential backoff.
+"""
+from __future__ import unicode_literals
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from waves.wcore.adaptors.exceptions import AdaptorConnectException
+
+from demo.settings import demo_settings
+
+logger = logging.getLogger('waves.daemon')
+
+__all__ = ['ConnectionPool', 'connection_pool']
+
+
+class PooledSession(object):
+    """ A pooled connector with its usage data """
+
+    def __init__(self, connector, now):
+        self.connector = connector
+        self.created = now
+        self.last_used = now
+        self.last_checked = now
+        self.users = 0
+        #: Reported broken while in use, closed once released by all its users
+        self.broken = False
+
+
+class ConnectionPool(object):
+    """ Runner keyed pool of connectors (SAGA job services, or any object with an optional 'close' method)
+
+    Connectors are created with the factory given to acquire, health checked with 'health_check' callable (default
+    to connector 'valid' attribute if any).
+    """
+
+    def __init__(self, health_check=None, clock=time.time):
+        self.health_check = health_check or (lambda connector: getattr(connector, 'valid', True))
+        self.clock = clock
+        self._sessions = OrderedDict()
+        self._failures = {}
+        self._connecting = {}
+        self._lock = threading.RLock()
+        self._available = threading.Condition(self._lock)
+        self.stats = dict(created=0, reused=0, shared=0, evicted=0, unhealthy=0, failures=0, refused=0, exhausted=0)
+
+    def _check(self, key, session, now):
+        """ Health check idle session if it has not been checked recently, close it if broken """
+        if now - session.last_checked < demo_settings.SSH_POOL_HEALTH_INTERVAL:
+            return True
+        session.last_checked = now
+        try:
+            healthy = self.health_check(session.connector)
+        except Exception as exc:
+            logger.warning('Connection health check failed for %s: %s', key, exc)
+            healthy = False
+        if not healthy:
+            self.stats['unhealthy'] += 1
+            self._close(key, session)
+        return healthy
+
+    def acquire(self, key, factory):
+        """ Get a connector for key: an idle one, a new one if pool is not full, or the least used one shared by less
+        than 'SSH_POOL_MAX_SHARED' operations, waiting up to 'SSH_POOL_WAIT' seconds for one. New connections are opened
+        outside pool lock: a hung host only blocks its own callers.
+
+        :param key: runner key
+        :param factory: callable returning a new connector, may raise
+        :raise: :class:`waves.wcore.adaptors.exceptions.AdaptorConnectException` while reconnection is delayed, or when
+            no connector is available in time
+        """
+        deadline = time.time() + demo_settings.SSH_POOL_WAIT
+        with self._available:
+            while True:
+                now = self.clock()
+                sessions = self._sessions.setdefault(key, [])
+                for session in sorted(sessions, key=lambda s: s.users):
+                    if session.users == 0 and self._check(key, session, now):
+                        self.stats['reused'] += 1
+                        return self._use(session, now)
+                usable = [session for session in sessions if not session.broken]
+                if len(usable) + self._connecting.get(key, 0) < demo_settings.SSH_POOL_SIZE:
+                    break
+                for session in sorted(usable, key=lambda s: s.users):
+                    # not health checked: closing it would break operations in progress
+                    if session.users < demo_settings.SSH_POOL_MAX_SHARED:
+                        self.stats['shared'] += 1
+                        return self._use(session, now)
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.stats['exhausted'] += 1
+                    raise AdaptorConnectException('No connection available to %s' % key)
+                self._available.wait(remaining)
+            failures, retry_at = self._failures.get(key, (0, 0))
+            if now < retry_at:
+                self.stats['refused'] += 1
+                raise AdaptorConnectException('Connection to %s delayed for %.1fs after %i failure(s)' % (
+                    key, retry_at - now, failures))
+            # slot held while connecting
+            self._connecting[key] = self._connecting.get(key, 0) + 1
+        try:
+            connector = factory()
+        except Exception as exc:
+            with self._available:
+                self._connected(key)
+                failures, retry_at = self._failures.get(key, (0, 0))
+                failures += 1
+                delay = min(demo_settings.SSH_POOL_BACKOFF * 2 ** (failures - 1), demo_settings.SSH_POOL_BACKOFF_MAX)
+                self._failures[key] = (failures, now + delay)
+                self.stats['failures'] += 1
+            logger.error('Connection to %s failed (%i), next try in %.1fs: %s', key, failures, delay, exc)
+            raise AdaptorConnectException('Connection to %s failed: %s' % (key, exc))
+        with self._available:
+            self._connected(key)
+            self._failures.pop(key, None)
+            self.stats['created'] += 1
+            session = PooledSession(connector, now)
+            self._sessions.setdefault(key, []).append(session)
+            return self._use(session, now)
+
+    def _connected(self, key):
+        """ Free connection slot held while connecting """
+        self._connecting[key] -= 1
+        if not self._connecting[key]:
+            del self._connecting[key]
+        self._available.notify_all()
+
+    @staticmethod
+    def _use(session, now):
+        session.users += 1
+        session.last_used = now
+        return session.connector
+
+    def release(self, key, connector, broken=False):
+        """ Give connector back to pool, broken connectors are closed once not used anymore """
+        with self._available:
+            for session in self._sessions.get(key, []):
+                if session.connector is connector:
+                    session.users = max(0, session.users - 1)
+                    session.last_used = self.clock()
+                    session.broken = session.broken or broken
+                    if session.broken and session.users == 0:
+                        self._close(key, session)
+                    self._available.notify_all()
+                    return
+
+    def _close(self, key, session):
+        sessions = self._sessions.get(key, [])
+        if session in sessions:
+            sessions.remove(session)
+        close = getattr(session.connector, 'close', None)
+        if close is not None:
+            try:
+                close()
+            except Exception as exc:
+                logger.warning('Error closing connection to %s: %s', key, exc)
+
+    def evict_idle(self):
+        """ Close sessions unused for 'SSH_POOL_IDLE_TIMEOUT' seconds, return evicted count """
+        evicted = 0
+        with self._lock:
+            limit = self.clock() - demo_settings.SSH_POOL_IDLE_TIMEOUT
+            for key, sessions in list(self._sessions.items()):
+                for session in list(sessions):
+                    if session.users == 0 and session.last_used < limit:
+                        self._close(key, session)
+                        evicted += 1
+            self.stats['evicted'] += evicted
+        return evicted
+
+    def close_all(self):
+        """ Close all sessions """
+        with self._lock:
+            for key, sessions in list(self._sessions.items()):
+                for session in list(sessions):
+                    self._close(key, session)
+            self._failures.clear()
+
+    def statistics(self):
+        """ Pool counters, with open sessions and operations in progress per key """
+        with self._lock:
+            stats = dict(self.stats)
+            stats['sessions'] = {key: len(sessions) for key, sessions in self._sessions.items() if sessions}
+            stats['in_use'] = {key: sum(session.users for session in sessions)
+                               for key, sessions in self._sessions.items() if sessions}
+        return stats
+
+
+connection_pool = ConnectionPool()
@@ -0,0 +1,265 @@
+""" Expired jobs purge
+
+waves-core purge daemon deletes expired jobs one by one: each deletion cascades row by row to inputs, outputs and
+history, then removes job working dir in daemon thread. Here jobs not updated for 'KEEP_ANONYMOUS_JOBS' /
+'KEEP_REGISTERED_JOBS' days (waves-core settings), except jobs of services or submissions not set for automatic
+deletion ('to_delete'), are purged by batches of 'PURGE_BATCH' jobs in primary key order:
+
+- jobs working dirs are renamed into a trash directory in jobs base dir (cheap, same file system),
+- jobs rows and their related rows are deleted with one statement per table,
+- trash is emptied by 'PURGE_WORKERS' background threads, files removal throttled to 'PURGE_IO_RATE' files per second.
+
+Last purged job id is checkpointed after each batch: an interrupted purge resumes after it, and directories left in
+trash are removed on next run. Dry run reports rows and bytes to be reclaimed without changing anything.
+"""
+from __future__ import unicode_literals
+
+import datetime
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+from os.path import isdir, islink, join
+
+from django.db import transaction
+from django.db.models import CASCADE, SET_NULL, Q
+from django.db.models.signals import post_delete
+from django.utils import timezone
+from waves.wcore.models import Job
+
+from demo.jobdirs import flat_dir, job_base_dir, read_checkpoint, sharded_dir, write_checkpoint
+from demo.settings import demo_settings
+
+logger = logging.getLogger('waves.daemon')
+
+__all__ = ['expired_jobs', 'TrashRemover', 'delete_jobs', 'job_trash', 'purge_jobs']
+
+#: Purged jobs working dirs waiting for removal, and purge progress file, in jobs base directory
+TRASH_DIR = '.demo_purge'
+CHECKPOINT_FILE = '.demo_purge.json'
+
+
+def expired_jobs(now=None):
+    """ Jobs to be purged at 'now' """
+    from waves.wcore.settings import waves_settings
+    now = now or timezone.now()
+    anonymous = Q(client__isnull=True, updated__lt=now - datetime.timedelta(waves_settings.KEEP_ANONYMOUS_JOBS))
+    registered = Q(client__isnull=False, updated__lt=now - datetime.timedelta(waves_settings.KEEP_REGISTERED_JOBS))
+    return Job.objects.filter(anonymous | registered).exclude(submission__to_delete=False).exclude(
+        submission__service__to_delete=False)
+
+
+def _job_dir(base_dir, slug):
+    """ Existing job working dir, in configured layout or flat (not moved yet) """
+    for path in (sharded_dir(base_dir, slug), flat_dir(base_dir, slug)):
+        if isdir(path):
+            return path
+    return None
+
+
+def _dir_size(path):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(join(root, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+def _related(pks):
+    """ Rows referencing jobs: (relation, queryset) """
+    for relation in Job._meta.related_objects:
+        yield relation, relation.related_model._base_manager.filter(**{'%s__in' % relation.field.name: pks})
+
+
+def _count_rows(pks):
+    """ Rows deleted with jobs """
+    return len(pks) + sum(queryset.count() for relation, queryset in _related(pks) if relation.on_delete is CASCADE)
+
+
+@contextmanager
+def _job_dirs_kept():
+    """ Disconnect waves-core Job 'post_delete' handler, which removes deleted jobs working dirs: purged jobs dirs are
+    already in trash, and must be moved back if deletion is rolled back. Process wide: jobs deleted meanwhile by other
+    threads keep their dirs, to be removed by next purge """
+    from waves.wcore.signals import job_post_delete_handler
+    post_delete.disconnect(job_post_delete_handler, sender=Job)
+    try:
+        yield
+    finally:
+        post_delete.connect(job_post_delete_handler, sender=Job)
+
+
+def _delete_rows(pks):
+    """ Delete jobs and related rows in one transaction, return deleted rows count. Related rows are deleted with one
+    statement per table first, so that jobs deletion has nothing left to cascade to """
+    deleted = 0
+    with transaction.atomic():
+        for relation, queryset in _related(pks):
+            if relation.on_delete is CASCADE:
+                deleted += queryset.delete()[0]
+            elif relation.on_delete is SET_NULL:
+                queryset.update(**{relation.field.name: None})
+        with _job_dirs_kept():
+            deleted += Job.objects.filter(pk__in=pks).delete()[0]
+    return deleted
+
+
+class TrashRemover(object):
+    """ Remove trashed directories in background threads, files removals throttled """
+
+    def __init__(self, trash_dir, workers=None, io_rate=None, clock=time.time, sleep=time.sleep):
+        self.trash_dir = trash_dir
+        self.io_rate = demo_settings.PURGE_IO_RATE if io_rate is None else io_rate
+        self.clock = clock
+        self.sleep = sleep
+        self._pool = ThreadPool(workers or demo_settings.PURGE_WORKERS)
+        self._lock = threading.Lock()
+        self._next_slot = 0
+        self.stats = dict(dirs=0, files=0, bytes=0, errors=0)
+
+    def throttle(self):
+        """ Wait for next file removal slot """
+        if not self.io_rate:
+            return
+        with self._lock:
+            now = self.clock()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1. / self.io_rate
+        if slot > now:
+            self.sleep(slot - now)
+
+    def trash(self, path, name):
+        """ Move directory to trash, return trashed path """
+        if not isdir(self.trash_dir):
+            os.makedirs(self.trash_dir)
+        trashed = join(self.trash_dir, name)
+        os.rename(path, trashed)
+        return trashed
+
+    def resume(self):
+        """ Remove directories left in trash by an interrupted purge, return their count """
+        names = os.listdir(self.trash_dir) if isdir(self.trash_dir) else []
+        for name in names:
+            self.remove(join(self.trash_dir, name))
+        return len(names)
+
+    def remove(self, path):
+        """ Remove a trashed directory in background """
+        self._pool.apply_async(self._remove, (path,))
+
+    def _remove(self, path):
+        files = size = 0
+        try:
+            for root, dirs, names in os.walk(path, topdown=False):
+                for name in names:
+                    self.throttle()
+                    file_path = join(root, name)
+                    size += os.lstat(file_path).st_size
+                    os.remove(file_path)
+                    files += 1
+                for name in dirs:
+                    dir_path = join(root, name)
+                    if islink(dir_path):
+                        os.remove(dir_path)
+                    else:
+                        os.rmdir(dir_path)
+            os.rmdir(path)
+        except OSError as exc:
+            logger.error('Purged job dir %s removal failed: %s', path, exc)
+            with self._lock:
+                self.stats['errors'] += 1
+        with self._lock:
+            self.stats['dirs'] += 1
+            self.stats['files'] += files
+            self.stats['bytes'] += size
+
+    def close(self):
+        """ Wait for all removals """
+        self._pool.close()
+        self._pool.join()
+
+
+def delete_jobs(rows, remover):
+    """ Move jobs working dirs to remover trash, delete jobs rows, then remove dirs in background. Dirs are moved back
+    if rows deletion fails (they would be removed by next purge otherwise)
+
+    :param rows: jobs (pk, slug)
+    :return: deleted rows, trashed dirs counts
+    """
+    base_dir = job_base_dir()
+    trashed = []
+    for pk, slug in rows:
+        path = _job_dir(base_dir, slug)
+        if path is None:
+            continue
+        try:
+            trashed.append((remover.trash(path, str(slug)), path))
+        except OSError as exc:
+            logger.error('Job dir %s could not be moved to trash: %s', path, exc)
+    try:
+        deleted = _delete_rows([pk for pk, slug in rows])
+    except Exception:
+        for trashed_path, path in trashed:
+            try:
+                os.rename(trashed_path, path)
+            except OSError as exc:
+                logger.error('Job dir %s could not be moved back from trash: %s', path, exc)
+        raise
+    for trashed_path, path in trashed:
+        remover.remove(trashed_path)
+    return deleted, len(trashed)
+
+
+def job_trash(workers=None, io_rate=None):
+    """ Trash remover for jobs dirs """
+    return TrashRemover(join(job_base_dir(), TRASH_DIR), workers, io_rate)
+
+
+def purge_jobs(batch=None, dry_run=False, restart=False, workers=None, io_rate=None, now=None):
+    """ Purge expired jobs by batches, resuming after last checkpointed job unless restart is set
+
+    :return: generator of progress dicts, one per batch then a last one once trash is emptied ('done' set)
+    """
+    batch = batch or demo_settings.PURGE_BATCH
+    base_dir = job_base_dir()
+    checkpoint = join(base_dir, CHECKPOINT_FILE)
+    last_pk = 0 if restart else read_checkpoint(checkpoint, 'purge')
+    progress = dict(resumed_after=last_pk, last_pk=last_pk, jobs=0, rows=0, dirs=0, bytes=0, done=False)
+    remover = None if dry_run else job_trash(workers, io_rate)
+    queryset = expired_jobs(now)
+    try:
+        if remover is not None:
+            progress['dirs'] += remover.resume()
+        while True:
+            rows = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'slug')[:batch])
+            if not rows:
+                break
+            pks = [pk for pk, slug in rows]
+            if dry_run:
+                dirs = [path for path in (_job_dir(base_dir, slug) for pk, slug in rows) if path is not None]
+                progress['rows'] += _count_rows(pks)
+                progress['bytes'] += sum(_dir_size(path) for path in dirs)
+                progress['dirs'] += len(dirs)
+            else:
+                deleted, trashed = delete_jobs(rows, remover)
+                progress['rows'] += deleted
+                progress['dirs'] += trashed
+                write_checkpoint(checkpoint, 'purge', pks[-1])
+                progress['bytes'] = remover.stats['bytes']
+            progress['jobs'] += len(rows)
+            progress['last_pk'] = last_pk = pks[-1]
+            yield dict(progress)
+    finally:
+        if remover is not None:
+            remover.close()
+    if remover is not None:
+        progress['bytes'] = remover.stats['bytes']
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+    progress['done'] = True
+    yield progress
@@ -0,0 +1,142 @@
+""" Demo jobs results files
+
+Results for a batch of jobs are staged in a bounded thread pool before daemon processes jobs one by one, demo adaptors
+then skip files already written (see WavesDemoAdaptor._job_results). Outputs are written in chunks, with an optional
+size ('RESULTS_OUTPUT_SIZE' MB per output) in order to benchmark storage throughput.
+"""
+from __future__ import unicode_literals
+
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from multiprocessing.pool import ThreadPool
+from os.path import join
+
+from django.db.models import prefetch_related_objects
+
+from demo.loader import adaptor_cache
+from demo.loadtest import load_test_profile
+from demo.settings import demo_settings
+
+logger = logging.getLogger('waves.daemon')
+
+__all__ = ['ResultsTiming', 'ResultsStage', 'results_stage', 'write_job_results']
+
+#: Results written for a job: files count, bytes written, elapsed seconds
+ResultsTiming = namedtuple('ResultsTiming', ['files', 'bytes', 'seconds'])
+
+_FILL_LINE = b'ACGT' * 15 + b'\n'
+
+
+def _write_file(path, header, size, chunk_size):
+    """ Write header then fill file up to size bytes, in chunk_size chunks, return written bytes """
+    header = header.encode('utf-8')
+    written = len(header)
+    with open(path, 'wb') as fp:
+        fp.write(header)
+        if size > written:
+            chunk = (_FILL_LINE * (chunk_size // len(_FILL_LINE) + 1))[:chunk_size]
+            while written < size:
+                block = chunk[:size - written]
+                fp.write(block)
+                written += len(block)
+    return written
+
+
+def write_job_results(job, command_line, output_size=None, chunk_size=None):
+    """ Mocking job results, add basic command line to standard output, randomly set stderr output to see warnings
+    happen. Job outputs must be loaded (or prefetched) before calling this from a thread.
+
+    :param output_size: bytes per job output (stdout and stderr excluded), default from 'RESULTS_OUTPUT_SIZE' setting
+    :rtype: ResultsTiming
+    """
+    if output_size is None:
+        output_size = int(demo_settings.RESULTS_OUTPUT_SIZE * 1024 * 1024)
+    chunk_size = chunk_size or demo_settings.RESULTS_CHUNK_SIZE
+    start = time.time()
+    files = written = 0
+    for output in job.outputs.all():
+        if output.value == job.stdout:
+            # written below
+            continue
+        if output.value != job.stderr or (random.randint(0, 3) > 2):
+            size = output_size if output.value != job.stderr else 0
+            written += _write_file(output.file_path, "Should contain expected content for {} ".format(output.name),
+                                   size, chunk_size)
+            files += 1
+    profile = load_test_profile()
+    for i in range(profile['OUTPUTS'] if profile else 0):
+        written += _write_file(join(job.working_dir, 'load_output_%i.dat' % i), "Load test output {} ".format(i),
+                               output_size, chunk_size)
+        files += 1
+    written += _write_file(join(job.working_dir, job.stdout),
+                           "Executed command on computing infrastructure : {}".format(command_line), 0, chunk_size)
+    return ResultsTiming(files + 1, written, time.time() - start)
+
+
+class ResultsStage(object):
+    """ Write results for a batch of jobs in a bounded thread pool ('RESULTS_WORKERS' threads) """
+
+    def __init__(self, workers=None):
+        self.workers = workers
+        self._staged = set()
+        self._lock = threading.Lock()
+
+    def stage(self, jobs):
+        """ Stage results for jobs run by an adaptor supporting it ('stage_results' attribute)
+
+        :return: per job timings, see write
+        """
+        batch = []
+        for job in jobs:
+            adaptor = adaptor_cache.for_job(job)
+            if adaptor is not None and getattr(adaptor, 'stage_results', False):
+                batch.append((job, adaptor.get_command_line(job)))
+        return self.write(batch)
+
+    def write(self, batch):
+        """ Write results for (job, command line) list, outputs are prefetched in one query
+
+        :return: OrderedDict job pk: ResultsTiming, failed jobs are left out (results written again by adaptor)
+        """
+        if not batch:
+            return OrderedDict()
+        jobs = [job for job, command_line in batch]
+        prefetch_related_objects([job for job in jobs if 'outputs' not in getattr(job, '_prefetched_objects_cache', {})],
+                                 'outputs')
+        workers = min(self.workers or demo_settings.RESULTS_WORKERS, len(batch))
+        pool = ThreadPool(processes=workers)
+        try:
+            timings = pool.map(self._write_job, batch)
+        finally:
+            pool.close()
+            pool.join()
+        staged = OrderedDict((job.pk, timing) for job, timing in zip(jobs, timings) if timing is not None)
+        with self._lock:
+            self._staged.update(staged.keys())
+        for pk, timing in staged.items():
+            logger.info("Results staged for job %s: %i file(s), %.2f MB in %.3fs", pk, timing.files,
+                        timing.bytes / 1048576.0, timing.seconds)
+        return staged
+
+    @staticmethod
+    def _write_job(item):
+        job, command_line = item
+        try:
+            return write_job_results(job, command_line)
+        except (IOError, OSError) as exc:
+            logger.error('Unable to stage results for job %s: %s', job.slug, exc)
+            return None
+
+    def consume(self, job):
+        """ Whether job results were staged, job is removed from staged ones """
+        with self._lock:
+            if job.pk in self._staged:
+                self._staged.discard(job.pk)
+                return True
+        return False
+
+
+results_stage = ResultsStage()
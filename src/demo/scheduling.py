@@ -0,0 +1,110 @@
+""" Adaptive job status polling
+
+Daemon polls a running job only when its next check time is reached. Next checks are kept in a heap, interval starts
+at 'POLL_MIN_INTERVAL' and is multiplied by 'POLL_BACKOFF' after each poll where nothing changed, up to
+'POLL_MAX_INTERVAL'. It is reset when job status changes. While a job runs for less than its service expected run
+time (median duration of last finished jobs), next check is delayed up to the expected end.
+"""
+from __future__ import unicode_literals
+
+import heapq
+import time
+
+from waves.wcore.adaptors.const import JobStatus
+from waves.wcore.models import Job
+
+from demo.polling import POLLED_STATUS
+from demo.settings import demo_settings
+
+__all__ = ['PollScheduler']
+
+#: Finished jobs used to learn service run time
+RUNTIME_SAMPLE = 50
+#: Learned run times are refreshed after this time (seconds)
+RUNTIME_TTL = 3600
+
+
+class PollScheduler(object):
+    """ Per job next status check, kept in a heap keyed on next check time """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._heap = []
+        self._state = {}
+        self._runtimes = {}
+        self.started = clock()
+        self.polls = 0
+        self.saved = 0
+
+    def expected_runtime(self, service):
+        """ Median duration (seconds) for last finished jobs of service, None if unknown """
+        now = self.clock()
+        cached = self._runtimes.get(service)
+        if cached is None or cached[1] < now:
+            durations = sorted((updated - created).total_seconds() for created, updated in Job.objects.filter(
+                service=service, _status=JobStatus.JOB_TERMINATED).order_by('-updated').values_list(
+                'created', 'updated')[:RUNTIME_SAMPLE])
+            cached = (durations[len(durations) // 2] if durations else None, now + RUNTIME_TTL)
+            self._runtimes[service] = cached
+        return cached[0]
+
+    def _schedule(self, pk, state, next_check):
+        state['next_check'] = next_check
+        heapq.heappush(self._heap, (next_check, pk))
+
+    def due(self, jobs):
+        """ Filter out jobs with polled status not due for a check, other jobs are kept """
+        now = self.clock()
+        due = set()
+        while self._heap and self._heap[0][0] <= now:
+            next_check, pk = heapq.heappop(self._heap)
+            state = self._state.get(pk)
+            # skip stale entries (job rescheduled or forgotten)
+            if state is not None and state['next_check'] == next_check:
+                due.add(pk)
+        selected = []
+        for job in jobs:
+            if job.status not in POLLED_STATUS:
+                selected.append(job)
+            elif job.pk not in self._state or job.pk in due:
+                self.polls += 1
+                selected.append(job)
+            else:
+                self.saved += 1
+        for pk in due:
+            # polled during this cycle: scheduled again in 'update'
+            self._state[pk]['next_check'] = None
+        return selected
+
+    def update(self, jobs):
+        """ Schedule next check for processed jobs still to poll, forget other ones """
+        now = self.clock()
+        for job in jobs:
+            if job.status not in POLLED_STATUS:
+                self.forget(job)
+                continue
+            state = self._state.get(job.pk)
+            if state is None or state['status'] != job.status:
+                state = dict(status=job.status, since=now, interval=demo_settings.POLL_MIN_INTERVAL, next_check=None)
+                self._state[job.pk] = state
+            elif state['next_check'] is not None:
+                # not polled in this cycle
+                continue
+            else:
+                state['interval'] = min(state['interval'] * demo_settings.POLL_BACKOFF, demo_settings.POLL_MAX_INTERVAL)
+            next_check = now + state['interval']
+            if job.status == JobStatus.JOB_RUNNING:
+                expected = self.expected_runtime(job.service)
+                if expected is not None and now - state['since'] < expected:
+                    next_check = max(next_check, min(state['since'] + expected,
+                                                     now + demo_settings.POLL_MAX_INTERVAL))
+            self._schedule(job.pk, state, next_check)
+
+    def forget(self, job):
+        self._state.pop(job.pk, None)
+
+    def statistics(self):
+        """ Polls made and saved, saved polls per hour """
+        hours = max(self.clock() - self.started, 1) / 3600.0
+        return dict(polls=self.polls, saved=self.saved, scheduled=len(self._state),
+                    saved_per_hour=round(self.saved / hours, 1))
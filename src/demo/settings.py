@@ -0,0 +1,122 @@
+""" WAVES demo application settings
+
+Demo specific settings are read from the ``WAVES_DEMO`` dictionary in Django settings, missing keys fall back to
+defaults declared here. WAVES_CORE settings can not be used as waves-core rejects unknown keys.
+"""
+from __future__ import unicode_literals
+
+from django.conf import settings
+
+__all__ = ['demo_settings', 'DEFAULTS']
+
+DEFAULTS = {
+    #: Buffer job history entries written by demo adaptors, flushed at each daemon cycle end
+    'HISTORY_BUFFERED': False,
+    #: Max buffered history entries before an intermediate flush
+    'HISTORY_BUFFER_SIZE': 500,
+    #: Services catalogue cache timeout (seconds), catalogue is invalidated on any related model change
+    'CATALOGUE_CACHE_TIMEOUT': 3600,
+    #: Service metas cache timeout (seconds), metas are invalidated when one of them changes
+    'SERVICE_METAS_CACHE_TIMEOUT': 86400,
+    #: Demo api user email, its token is set as 'waves_token' cookie on submission pages
+    'API_USER_EMAIL': 'demoapiuser@atgc-montpellier.fr',
+    #: Demo api user token in process cache timeout (seconds)
+    'API_TOKEN_TIMEOUT': 300,
+    #: Threads used to write results for a batch of completed jobs
+    'RESULTS_WORKERS': 4,
+    #: Size (MB) of each mocked job output file (0: only a header line)
+    'RESULTS_OUTPUT_SIZE': 0,
+    #: Chunk size (bytes) used when writing mocked outputs
+    'RESULTS_CHUNK_SIZE': 1024 * 1024,
+    #: Demo adaptors load test mode profile (dict, see demo.loadtest), None to disable
+    'LOAD_TEST': None,
+    #: Poll running jobs status with one remote call per runner (demo daemon)
+    'BULK_STATUS': True,
+    #: Demo daemon worker threads processing jobs (0: jobs processed one after the other)
+    'WORKERS': 0,
+    #: Max jobs operations running at the same time for a runner
+    'WORKERS_PER_RUNNER': 2,
+    #: Jobs operations timeout (seconds), runner is isolated while a timed out operation is running
+    'OPERATION_TIMEOUT': 300,
+    #: Max remote sessions per runner for ssh adaptors, operations are multiplexed over them
+    'SSH_POOL_SIZE': 4,
+    #: Max operations sharing a ssh session, and max time (seconds) waiting for a session when all are busy
+    'SSH_POOL_MAX_SHARED': 4,
+    'SSH_POOL_WAIT': 30,
+    #: Idle ssh sessions are closed after this time (seconds)
+    'SSH_POOL_IDLE_TIMEOUT': 300,
+    #: Ssh sessions idle for this time (seconds) are checked before reuse
+    'SSH_POOL_HEALTH_INTERVAL': 60,
+    #: Reconnection delay (seconds) after a failure, doubled on each new failure up to 'SSH_POOL_BACKOFF_MAX'
+    'SSH_POOL_BACKOFF': 1,
+    'SSH_POOL_BACKOFF_MAX': 60,
+    #: Schedule each job status check (demo daemon), interval grows while job status does not change
+    'ADAPTIVE_POLLING': True,
+    #: Status check interval (seconds) after a status change, multiplied by 'POLL_BACKOFF' up to 'POLL_MAX_INTERVAL'
+    'POLL_MIN_INTERVAL': 10,
+    'POLL_BACKOFF': 2,
+    'POLL_MAX_INTERVAL': 600,
+    #: Watch local jobs working directories for their end, their status is then polled every 'POLL_MAX_INTERVAL' seconds
+    #: only (demo daemon)
+    'WATCH_JOB_DIRS': False,
+    #: Watched directories check interval (seconds) when inotify is not available
+    'WATCH_POLL_INTERVAL': 1,
+    #: Cache built adaptors (see demo.loader), per job configuration and per runner / service / submission
+    'ADAPTOR_CACHE': True,
+    #: Max cached jobs configurations adaptors
+    'ADAPTOR_CACHE_SIZE': 256,
+    #: Runner, service and submission cached adaptors timeout (seconds), for changes made in other processes
+    'ADAPTOR_CACHE_TIMEOUT': 300,
+    #: Demo daemon processes only jobs it holds a lease on, for several daemons sharing a database
+    'LEASES': False,
+    #: Lease expiration (seconds) without renewal, leases of a crashed daemon are reclaimed by others after that time
+    'LEASE_TTL': 60,
+    #: Max jobs leased by a daemon
+    'LEASE_BATCH': 100,
+    #: Jobs sharded by runner over daemons: shards count (0: no sharding) and this daemon shard (0 to shards - 1)
+    'LEASE_SHARDS': 0,
+    'LEASE_SHARD': 0,
+    #: Created jobs are prepared in weighted fair share order when runners have free slots (demo daemon)
+    'FAIR_SHARE': True,
+    #: Jobs prepared, queued or running at the same time on a runner, and per runner values ('<class>:<connexion>')
+    'FAIR_SHARE_SLOTS': 20,
+    'FAIR_SHARE_RUNNER_SLOTS': {},
+    #: Fair share weights, keys 'user:<id>', 'email:<address>' or 'service:<name>' (default 1)
+    'FAIR_SHARE_WEIGHTS': {},
+    #: Prepared jobs of cluster runners are submitted as array jobs, grouped per service and runner (demo daemon)
+    'ARRAY_JOBS': False,
+    #: Seconds a prepared job may wait for others before its array is submitted, max jobs per array
+    'ARRAY_JOBS_WINDOW': 5,
+    'ARRAY_JOBS_MAX': 100,
+    #: Links to previous and next pages displayed around current one in jobs list
+    'JOB_LIST_PAGE_LINKS': 5,
+    #: Finished jobs run details and detail page fragment cache timeout (seconds)
+    'JOB_DETAIL_CACHE_TIMEOUT': 3600,
+    #: Jobs working dirs spread in prefix hashed sub directories levels (0: waves-core flat layout, see demo.jobdirs),
+    #: hex digits per level
+    'JOB_DIR_SHARD_DEPTH': 0,
+    'JOB_DIR_SHARD_WIDTH': 2,
+    #: Expired jobs purged per batch (see demo.purge), threads removing purged jobs dirs
+    'PURGE_BATCH': 500,
+    'PURGE_WORKERS': 2,
+    #: Max files removed per second by purge (0: no limit)
+    'PURGE_IO_RATE': 1000,
+}
+
+
+class DemoSettings(object):
+    """
+    WAVES demo settings object, allow demo settings access from properties. Values are not cached in order to
+    follow Django 'override_settings' in tests.
+    """
+
+    def __init__(self, defaults=None):
+        self.defaults = defaults or DEFAULTS
+
+    def __getattr__(self, attr):
+        if attr not in self.defaults:
+            raise AttributeError("Invalid WAVES demo setting: '%s'" % attr)
+        return getattr(settings, 'WAVES_DEMO', {}).get(attr, self.defaults[attr])
+
+
+demo_settings = DemoSettings(DEFAULTS)
@@ -0,0 +1,83 @@
+""" WAVES demo models signals handlers """
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from waves.authentication.models import WavesApiUser
+from waves.wcore.models import get_service_model, get_submission_model
+from waves.wcore.models.adaptors import AdaptorInitParam
+from waves.wcore.models.runners import Runner
+
+from demo.catalogue import invalidate_catalogue
+from demo.loader import adaptor_cache
+from demo.metas import invalidate_service_metas
+from demo.models import ServiceCategory, ServiceMeta
+from demo.tokens import demo_api_token
+
+Service = get_service_model()
+Submission = get_submission_model()
+
+
+@receiver(post_save, sender=ServiceCategory)
+@receiver(post_delete, sender=ServiceCategory)
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(post_save, sender=Submission)
+@receiver(post_delete, sender=Submission)
+@receiver(post_save, sender=ServiceMeta)
+@receiver(post_delete, sender=ServiceMeta)
+@receiver(post_save, sender=Runner)
+@receiver(post_delete, sender=Runner)
+def catalogue_changed_handler(sender, instance, **kwargs):
+    """ Services catalogue depends on these models, drop cached catalogues """
+    invalidate_catalogue()
+
+
+@receiver(post_save, sender=ServiceMeta)
+@receiver(post_delete, sender=ServiceMeta)
+def service_meta_changed_handler(sender, instance, **kwargs):
+    """ Drop cached metas for related service """
+    invalidate_service_metas(instance.service_id)
+
+
+@receiver(post_delete, sender=Service)
+def service_deleted_handler(sender, instance, **kwargs):
+    """ Drop cached metas for deleted service """
+    invalidate_service_metas(instance.pk)
+
+
+@receiver(post_save, sender=WavesApiUser)
+@receiver(post_delete, sender=WavesApiUser)
+def api_token_changed_handler(sender, instance, **kwargs):
+    """ Drop cached demo api user token """
+    demo_api_token.invalidate()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def api_user_changed_handler(sender, instance, **kwargs):
+    """ Drop cached demo api user token when a user gets (or loses) demo api user email """
+    update_fields = kwargs.get('update_fields')
+    if not update_fields or not set(update_fields) <= {'last_login'}:
+        demo_api_token.invalidate()
+
+
+@receiver(post_save, sender=Runner)
+@receiver(post_delete, sender=Runner)
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(post_save, sender=Submission)
+@receiver(post_delete, sender=Submission)
+def adaptor_config_changed_handler(sender, instance, **kwargs):
+    """ Drop cached adaptors built from runner, service or submission """
+    adaptor_cache.invalidate(instance)
+
+
+@receiver(post_save, sender=AdaptorInitParam)
+@receiver(post_delete, sender=AdaptorInitParam)
+def adaptor_param_changed_handler(sender, instance, **kwargs):
+    """ Drop cached adaptors built with init param """
+    model = instance.content_type.model_class()
+    if model is not None:
+        adaptor_cache.invalidate(label=model._meta.label_lower, pk=instance.object_id)
@@ -2,6 +2,8 @@ from __future__ import unicode_literals
 
 from django import template
 from demo import __version_detail__
+from demo.details import get_job_run_details
+from demo.metas import get_service_metas
 
 register = template.Library()
 
@@ -18,4 +20,11 @@ def get_demo_version():
 
 @register.inclusion_tag('demo/run_details.html', takes_context=False)
 def job_run_details(job=None):
-    return {'run_details': job.run_details._asdict()}
\ No newline at end of file
+    """ Job run details (memoized for finished jobs) """
+    return {'run_details': get_job_run_details(job)}
+
+
+@register.simple_tag
+def service_metas(service):
+    """ Service metas grouped by type (cached) """
+    return get_service_metas(service)
@@ -1,3 +1,944 @@
-from django.test import TestCase
+""" Tests demo """
+from __future__ import unicode_literals
 
-# Create your tests here.
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import skipIf
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import DatabaseError, connection
+from django.db.models.signals import post_delete
+from django.urls import reverse
+from django.utils import timezone
+from waves.authentication.models import WavesApiUser
+from waves.wcore.adaptors.const import JobStatus
+from waves.wcore.adaptors.exceptions import AdaptorConnectException
+from waves.wcore.models import Job, JobOutput, Runner, get_service_model
+from waves.wcore.models.adaptors import AdaptorInitParam
+
+from demo.adaptors import SshShellAdaptor
+from demo.arrays import ArrayBatcher, launch_array, parse_array_task
+from demo.benchmarks import LoadTest, duplicated_transitions, run_lease_daemons
+from demo.catalogue import get_categories
+from demo.daemon import DemoJobQueueRunDaemon
+from demo.explain import SUPPORTED_VENDORS, explain, full_scans, hot_queries, sorts
+from demo.fairshare import FairShareScheduler
+from demo.history import BufferedHistoryWriter
+from demo.jobdirs import flat_dir, migrate_job_dirs
+from demo.leases import LeaseManager, runner_shard
+from demo.loader import adaptor_cache
+from demo.metas import get_service_metas
+from demo.models import JobLease, ServiceCategory, ServiceMeta
+from demo.polling import poll_jobs
+from demo.pool import ConnectionPool, connection_pool
+from demo import purge as demo_purge
+from demo.purge import TrashRemover, delete_jobs, expired_jobs, job_trash, purge_jobs
+from demo.results import ResultsStage
+from demo.scheduling import PollScheduler
+from demo.settings import demo_settings
+from demo.tokens import demo_api_token
+from demo.watcher import JobDirWatcher, PollingBackend, job_watcher, write_exit_code
+from demo.workers import WorkerPool
+
+Service = get_service_model()
+User = get_user_model()
+
+
+class JobDirTestMixin(object):
+    """ Create jobs working dirs in a temporary directory """
+
+    @staticmethod
+    def create_service(clazz='demo.adaptors.LocalShellAdaptor'):
+        """ Public service run by a new runner of adaptor class 'clazz' """
+        runner = Runner.objects.create(name='Demo runner', clazz=clazz)
+        return Service.objects.create(name='Service', api_name='service', status=Service.SRV_PUBLIC, runner=runner)
+
+    @classmethod
+    def setUpClass(cls):
+        cls._job_dir = tempfile.mkdtemp(prefix='waves_demo_test_')
+        cls._job_dir_settings = override_settings(
+            WAVES_CORE=dict(getattr(settings, 'WAVES_CORE', {}), JOB_BASE_DIR=cls._job_dir))
+        cls._job_dir_settings.enable()
+        super(JobDirTestMixin, cls).setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super(JobDirTestMixin, cls).tearDownClass()
+        cls._job_dir_settings.disable()
+        shutil.rmtree(cls._job_dir, ignore_errors=True)
+
+
+class BufferedHistoryWriterTestCase(JobDirTestMixin, TestCase):
+
+    def test_buffered_history(self):
+        job = Job.objects.create(service='Test', title='Test job')
+        initial = job.job_history.count()
+        writer = BufferedHistoryWriter(max_size=10)
+        self.assertTrue(writer.add(job, 'Status poll'))
+        self.assertFalse(writer.add(job, 'Status poll'))
+        self.assertTrue(writer.add(job, 'Another message'))
+        self.assertEqual(job.job_history.count(), initial)
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(job.job_history.count(), initial + 2)
+        self.assertEqual(writer.skipped, 1)
+
+    def test_entries_keep_event_order(self):
+        job = Job.objects.create(service='Test', title='Test job')
+        writer = BufferedHistoryWriter(max_size=10)
+        writer.add(job, '[Entering fake prepare]')
+        writer.add(job, '[Entering fake prepare]', status=JobStatus.JOB_PREPARED)
+        # status change written directly, after buffered entries
+        job.status = JobStatus.JOB_PREPARED
+        self.assertEqual(writer.flush(), 2)
+        history = list(job.job_history.all()[:3])
+        self.assertEqual([entry.message for entry in history[1:]], ['[Entering fake prepare]'] * 2)
+        self.assertNotEqual(history[0].message, '[Entering fake prepare]')
+
+    def test_flush_on_max_size(self):
+        jobs = [Job.objects.create(service='Test', title='Test job %i' % i) for i in range(3)]
+        writer = BufferedHistoryWriter(max_size=2)
+        for job in jobs:
+            writer.add(job, 'Status poll')
+        self.assertEqual(writer.flushed, 2)
+        self.assertEqual(len(writer), 1)
+
+
+class CatalogueTestCase(JobDirTestMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = ServiceCategory.objects.create(name='Category')
+        for i, status in enumerate((Service.SRV_PUBLIC, Service.SRV_REGISTERED, Service.SRV_DRAFT)):
+            Service.objects.create(name='Service %i' % i, api_name='service_%i' % i, status=status,
+                                   category=self.category)
+
+    def test_catalogue_permission_classes(self):
+        self.assertEqual(len(get_categories(AnonymousUser())[0]['services']), 1)
+        user = User.objects.create_user(email="registered@example.com")
+        self.assertEqual(len(get_categories(user)[0]['services']), 2)
+
+    def test_anonymous_catalogue_cached(self):
+        self.client.get(reverse('waves_demo:categories_list'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('waves_demo:categories_list'))
+        self.assertContains(response, 'Service 0')
+        self.assertNotContains(response, 'Service 1')
+
+    def test_catalogue_invalidated(self):
+        self.assertEqual(len(get_categories(AnonymousUser())[0]['services']), 1)
+        Service.objects.create(name='New service', api_name='new_service', status=Service.SRV_PUBLIC,
+                               category=self.category)
+        self.assertEqual(len(get_categories(AnonymousUser())[0]['services']), 2)
+
+
+class ServiceCategoryTreeTestCase(JobDirTestMixin, TestCase):
+
+    def setUp(self):
+        self.root = ServiceCategory.objects.create(name='Root')
+        self.child = ServiceCategory.objects.create(name='Child', parent=self.root)
+        self.leaf = ServiceCategory.objects.create(name='Leaf', parent=self.child)
+        Service.objects.create(name='Root service', api_name='root_service', category=self.root)
+        Service.objects.create(name='Leaf service', api_name='leaf_service', category=self.leaf)
+
+    def test_tree_queries(self):
+        leaf = ServiceCategory.objects.get(pk=self.leaf.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual([c.name for c in leaf.get_ancestors()], ['Root', 'Child'])
+        root = ServiceCategory.objects.get(pk=self.root.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(root.get_descendants(include_self=True)), 3)
+        with self.assertNumQueries(1):
+            counts = {c.name: c.services_count for c in ServiceCategory.objects.with_services_count()}
+        self.assertEqual(counts, {'Root': 2, 'Child': 1, 'Leaf': 1})
+        self.assertEqual(root.get_tree_services().count(), 2)
+
+
+class ServiceMetasTestCase(JobDirTestMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.service = self.create_service()
+
+    def add_metas(self, *meta_types):
+        for i, meta_type in enumerate(meta_types):
+            ServiceMeta.objects.create(service=self.service, type=meta_type, title='%s %i' % (meta_type, i),
+                                       value='http://example.com/%i' % i, order=i)
+
+    def details_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('wcore:service_details', args=[self.service.api_name]))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_metas_grouped_and_cached(self):
+        self.add_metas(ServiceMeta.META_WEBSITE, ServiceMeta.META_DOC, ServiceMeta.META_WEBSITE)
+        with self.assertNumQueries(1):
+            metas = get_service_metas(self.service)
+        self.assertEqual([len(v) for v in metas.values()], [1, 2])
+        with self.assertNumQueries(0):
+            get_service_metas(self.service)
+        self.add_metas(ServiceMeta.META_CITE)
+        self.assertEqual(len(get_service_metas(self.service)), 3)
+
+    def test_details_query_budget(self):
+        self.add_metas(ServiceMeta.META_WEBSITE)
+        budget = self.details_queries()
+        self.add_metas(*[meta_type for meta_type, title in ServiceMeta.SERVICE_META])
+        self.assertEqual(self.details_queries(), budget)
+
+
+class DemoApiTokenTestCase(JobDirTestMixin, TestCase):
+
+    def setUp(self):
+        demo_api_token.invalidate()
+        self.user = User.objects.create_user(email=demo_settings.API_USER_EMAIL)
+        self.service = self.create_service()
+
+    def test_token_cookie_cached(self):
+        response = self.client.get(reverse('wcore:service_details', args=[self.service.api_name]))
+        self.assertEqual(response.cookies['waves_token'].value, self.user.waves_user.key)
+        with self.assertNumQueries(0):
+            self.assertEqual(demo_api_token.get(), self.user.waves_user.key)
+
+    def test_token_invalidated(self):
+        old_key = demo_api_token.get()
+        self.user.waves_user.delete()
+        self.assertIsNone(demo_api_token.get())
+        new_token = WavesApiUser.objects.create(user=self.user)
+        self.assertNotEqual(demo_api_token.get(), old_key)
+        self.assertEqual(demo_api_token.get(), new_token.key)
+
+
+class ResultsStageTestCase(JobDirTestMixin, TestCase):
+
+    def setUp(self):
+        self.jobs = [Job.objects.create(service='Test', title='Test job %i' % i) for i in range(3)]
+        for job in self.jobs:
+            JobOutput.objects.create(job=job, _name='Result', value='result', extension='txt', api_name='result')
+
+    @override_settings(WAVES_DEMO={'RESULTS_OUTPUT_SIZE': 0.5, 'RESULTS_CHUNK_SIZE': 4096})
+    def test_stage_results(self):
+        stage = ResultsStage(workers=2)
+        jobs = list(Job.objects.filter(pk__in=[job.pk for job in self.jobs]))
+        with self.assertNumQueries(1):
+            timings = stage.write([(job, 'command') for job in jobs])
+        self.assertEqual(len(timings), 3)
+        for job in jobs:
+            output = [o for o in job.outputs.all() if o.api_name == 'result'][0]
+            self.assertEqual(os.path.getsize(output.file_path), 512 * 1024)
+            self.assertGreaterEqual(timings[job.pk].bytes, 512 * 1024)
+            self.assertTrue(stage.consume(job))
+            self.assertFalse(stage.consume(job))
+
+
+class LoadTestModeTestCase(JobDirTestMixin, TestCase):
+
+    def setUp(self):
+        self.service = self.create_service()
+
+    @override_settings(WAVES_DEMO={'LOAD_TEST': {'RUNTIME_MEAN': 0, 'RUNTIME_SD': 0, 'FAILURE_RATE': 0.5},
+                                   'POLL_MIN_INTERVAL': 0})
+    def test_jobs_lifecycle(self):
+        load_test = LoadTest([self.service.default_submission], interval=0, timeout=60)
+        load_test.run(4)
+        self.assertEqual(len(load_test.final_status), 4)
+        self.assertEqual(len(load_test.latencies), 4)
+        self.assertIn('submitted', load_test.transitions)
+        for job in Job.objects.filter(pk__in=load_test.final_status.keys()):
+            self.assertTrue(job.remote_job_id.startswith('load:'))
+            self.assertGreaterEqual(job.status, JobStatus.JOB_TERMINATED)
+
+
+class FakeTransport(object):
+    """ In process fake transport, counts opened sessions, may be set to fail """
+
+    class Session(object):
+        valid = True
+
+        def close(self):
+            self.valid = False
+
+    def __init__(self):
+        self.opened = 0
+        self.fail = False
+
+    def __call__(self):
+        if self.fail:
+            raise IOError('Connection refused')
+        self.opened += 1
+        return self.Session()
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@override_settings(WAVES_DEMO={'SSH_POOL_SIZE': 2, 'SSH_POOL_MAX_SHARED': 2, 'SSH_POOL_WAIT': 0,
+                               'SSH_POOL_IDLE_TIMEOUT': 300, 'SSH_POOL_HEALTH_INTERVAL': 60, 'SSH_POOL_BACKOFF': 1,
+                               'SSH_POOL_BACKOFF_MAX': 4, 'LOAD_TEST': {'POLL_LATENCY': 0}})
+class ConnectionPoolTestCase(JobDirTestMixin, TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.transport = FakeTransport()
+        self.pool = ConnectionPool(clock=self.clock)
+
+    def test_sessions_reused_and_shared(self):
+        for _ in range(10):
+            self.pool.release('runner', self.pool.acquire('runner', self.transport))
+        self.assertEqual(self.transport.opened, 1)
+        sessions = [self.pool.acquire('runner', self.transport) for _ in range(4)]
+        self.assertEqual(self.transport.opened, 2)
+        self.assertEqual(len(set(sessions)), 2)
+        stats = self.pool.statistics()
+        self.assertEqual(stats['sessions'], {'runner': 2})
+        self.assertEqual(stats['in_use'], {'runner': 4})
+        self.assertEqual(stats['shared'], 2)
+        # sessions shared by 2 operations at most
+        self.assertRaises(AdaptorConnectException, self.pool.acquire, 'runner', self.transport)
+        self.assertEqual(self.pool.stats['exhausted'], 1)
+        self.pool.release('runner', sessions[0])
+        self.assertIs(self.pool.acquire('runner', self.transport), sessions[0])
+
+    def test_health_check_and_eviction(self):
+        session = self.pool.acquire('runner', self.transport)
+        self.pool.release('runner', session)
+        session.valid = False
+        self.clock.now += 120
+        fresh = self.pool.acquire('runner', self.transport)
+        self.assertIsNot(fresh, session)
+        self.assertEqual(self.pool.stats['unhealthy'], 1)
+        self.pool.release('runner', fresh)
+        self.clock.now += 301
+        self.assertEqual(self.pool.evict_idle(), 1)
+        self.assertEqual(self.pool.statistics()['sessions'], {})
+
+    def test_reconnect_backoff(self):
+        self.transport.fail = True
+        self.assertRaises(AdaptorConnectException, self.pool.acquire, 'runner', self.transport)
+        self.transport.fail = False
+        # retry delayed for 1s
+        self.assertRaises(AdaptorConnectException, self.pool.acquire, 'runner', self.transport)
+        self.clock.now += 1
+        self.assertIsNotNone(self.pool.acquire('runner', self.transport))
+        self.assertEqual((self.pool.stats['failures'], self.pool.stats['refused']), (1, 1))
+
+    def test_broken_shared_session(self):
+        sessions = [self.pool.acquire('runner', self.transport) for _ in range(3)]
+        shared = sessions[2]
+        self.assertIn(shared, sessions[:2])
+        self.pool.release('runner', shared, broken=True)
+        # still used by another operation: kept open, but not handed out anymore
+        self.assertTrue(shared.valid)
+        fresh = self.pool.acquire('runner', self.transport)
+        self.assertNotIn(fresh, sessions)
+        self.pool.release('runner', shared)
+        self.assertFalse(shared.valid)
+        self.assertEqual(self.pool.statistics()['sessions'], {'runner': 2})
+
+    def test_connect_outside_lock(self):
+        connecting, hung = threading.Event(), threading.Event()
+
+        def hung_host():
+            connecting.set()
+            hung.wait(5)
+            return self.transport()
+
+        thread = threading.Thread(target=self.pool.acquire, args=('hung', hung_host))
+        thread.start()
+        self.assertTrue(connecting.wait(5))
+        # other runners connect while a host hangs
+        self.assertIsNotNone(self.pool.acquire('runner', self.transport))
+        hung.set()
+        thread.join(5)
+        self.assertEqual(self.pool.statistics()['sessions'], {'hung': 1, 'runner': 1})
+
+    def test_adaptor_operations_release_connector(self):
+        job = Job.objects.create(service='Test', title='Test job')
+        job.remote_job_id = 'load:0:0:%.3f:ok' % (time.time() + 86400)
+        adaptor = SshShellAdaptor(host='localhost', user_id='demo', password='demo')
+        for _ in range(3):
+            adaptor.job_status(job)
+        self.assertFalse(adaptor.connected)
+        self.assertEqual(connection_pool.statistics()['in_use'].get(adaptor.pool_key, 0), 0)
+
+        class FailingAdaptor(SshShellAdaptor):
+            def _job_status(self, job):
+                raise AdaptorConnectException('Connection lost')
+
+        adaptor = FailingAdaptor(host='localhost', user_id='demo', password='demo')
+        self.assertRaises(AdaptorConnectException, adaptor.job_status, job)
+        # broken session closed
+        self.assertNotIn(adaptor.pool_key, connection_pool.statistics()['sessions'])
+
+
+class BulkPollingTestCase(JobDirTestMixin, TestCase):
+
+    def setUp(self):
+        self.service = self.create_service('demo.adaptors.SshClusterAdaptor')
+
+    def create_running_jobs(self, count):
+        pks = [Job.objects.create_from_submission(self.service.default_submission, submitted_inputs={}).pk
+               for _ in range(count)]
+        for pk in pks:
+            Job.objects.filter(pk=pk).update(_status=JobStatus.JOB_RUNNING, remote_job_id='load:%s:0:0:ok' % pk)
+        return list(Job.objects.filter(pk__in=pks))
+
+    @override_settings(WAVES_DEMO={'LOAD_TEST': {}})
+    def test_queries_per_runner(self):
+        few, many = self.create_running_jobs(2), self.create_running_jobs(8)
+        with CaptureQueriesContext(connection) as few_ctx:
+            poll_jobs(few)
+        with CaptureQueriesContext(connection) as many_ctx:
+            polled = poll_jobs(many)
+        self.assertEqual(len(polled), 8)
+        self.assertEqual(len(few_ctx.captured_queries), len(many_ctx.captured_queries))
+        for job in Job.objects.filter(pk__in=[job.pk for job in many]):
+            self.assertEqual(job.status, JobStatus.JOB_COMPLETED)
+            self.assertEqual(job.job_history.filter(status=JobStatus.JOB_COMPLETED).count(), 1)
+
+
+class WorkerPoolTestCase(TestCase):
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+        self.running = {}
+        self.peak = {}
+
+    def tearDown(self):
+        self.release.set()
+
+    def task(self, key, hang=False):
+        def run():
+            with self.lock:
+                self.running[key] = self.running.get(key, 0) + 1
+                self.peak[key] = max(self.peak.get(key, 0), self.running[key])
+            if hang:
+                self.release.wait(5)
+            with self.lock:
+                self.running[key] -= 1
+        return key, run
+
+    def test_runner_caps_and_isolation(self):
+        # time only passes once the other runner operations are all done: hung ones then time out, deterministically
+        pool = WorkerPool(workers=4, per_runner=2, timeout=30, clock=lambda: 60 if pool.stats['done'] == 6 else 0)
+        tasks = [self.task('hung', hang=True) for _ in range(3)] + [self.task('runner') for _ in range(6)]
+        stats = pool.run(tasks)
+        self.assertEqual(stats, dict(done=6, failed=0, timed_out=2, skipped=1))
+        self.assertLessEqual(self.peak['runner'], 2)
+        self.assertEqual(pool.hung_runners, ['hung'])
+
+
+@override_settings(WAVES_DEMO={'POLL_MIN_INTERVAL': 10, 'POLL_BACKOFF': 2, 'POLL_MAX_INTERVAL': 60})
+class PollSchedulerTestCase(JobDirTestMixin, TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = PollScheduler(clock=self.clock)
+
+    def create_job(self, status=JobStatus.JOB_RUNNING, service='Service'):
+        return Job.objects.create(service=service, title='Job', _status=status)
+
+    def cycle(self, jobs, elapsed=0):
+        self.clock.now += elapsed
+        due = self.scheduler.due(jobs)
+        self.scheduler.update(due)
+        return due
+
+    def test_backoff_and_reset(self):
+        jobs = [self.create_job(), self.create_job(JobStatus.JOB_QUEUED)]
+        self.assertEqual(len(self.cycle(jobs)), 2)
+        self.assertEqual(self.cycle(jobs, 5), [])
+        self.assertEqual(len(self.cycle(jobs, 5)), 2)
+        # unchanged: next check 20s later
+        self.assertEqual(self.cycle(jobs, 15), [])
+        self.clock.now += 5
+        due = self.scheduler.due(jobs)
+        self.assertEqual(len(due), 2)
+        jobs[1]._status = JobStatus.JOB_RUNNING
+        self.scheduler.update(due)
+        # changed status: back to min interval
+        self.assertEqual(self.cycle(jobs, 10), [jobs[1]])
+        jobs[0]._status = JobStatus.JOB_COMPLETED
+        self.assertEqual(self.cycle(jobs), [jobs[0]])
+        stats = self.scheduler.statistics()
+        self.assertEqual((stats['polls'], stats['saved'], stats['scheduled']), (7, 6, 1))
+
+    def test_learned_runtime(self):
+        for _ in range(3):
+            job = self.create_job(JobStatus.JOB_TERMINATED, service='Long')
+            Job.objects.filter(pk=job.pk).update(updated=job.created + datetime.timedelta(seconds=45))
+        self.assertEqual(self.scheduler.expected_runtime('Long'), 45)
+        self.assertIsNone(self.scheduler.expected_runtime('Service'))
+        job = self.create_job(service='Long')
+        self.cycle([job])
+        self.assertEqual(self.cycle([job], 40), [])
+        self.assertEqual(self.cycle([job], 5), [job])
+
+
+class JobDirWatcherTestCase(JobDirTestMixin, TestCase):
+
+    def setUp(self):
+        self.service = self.create_service()
+
+    def create_job(self):
+        job = Job.objects.create_from_submission(self.service.default_submission, submitted_inputs={})
+        job._status = JobStatus.JOB_RUNNING
+        return job
+
+    def test_finished_jobs_pushed(self):
+        # default backend is inotify on Linux
+        for backend in (None, PollingBackend(interval=0.05)):
+            watcher = JobDirWatcher(backend)
+            running, finished = self.create_job(), self.create_job()
+            self.assertTrue(watcher.watch(running))
+            self.assertTrue(watcher.watch(finished))
+            write_exit_code(finished.working_dir, 1)
+            self.assertTrue(watcher.wait(5))
+            self.assertEqual(watcher.pop_finished(), {finished.pk})
+            # finished jobs are not watched anymore, they are left to polling
+            self.assertFalse(watcher.watch(finished))
+            self.assertEqual(len(watcher), 1)
+            self.assertEqual(finished.adaptor._job_status(finished), JobStatus.JOB_ERROR)
+            watcher.stop()
+            self.assertEqual(len(watcher), 0)
+
+    @override_settings(WAVES_DEMO={'WATCH_JOB_DIRS': True, 'POLL_MAX_INTERVAL': 600, 'LOAD_TEST': {'POLL_LATENCY': 0}})
+    def test_lost_process_polled(self):
+        # daemon restarted: running job process is lost, its exit code file is never written
+        job = self.create_job()
+        Job.objects.filter(pk=job.pk).update(_status=JobStatus.JOB_RUNNING, remote_job_id='load:0:0:0:ok')
+        daemon = DemoJobQueueRunDaemon(pidfile=os.path.join(self._job_dir, 'daemon.pid'))
+        try:
+            self.assertEqual(daemon.select_jobs(list(daemon.get_jobs())), [])
+            self.assertTrue(job_watcher.is_watched(job))
+            with override_settings(WAVES_DEMO={'WATCH_JOB_DIRS': True, 'POLL_MAX_INTERVAL': 0,
+                                               'LOAD_TEST': {'POLL_LATENCY': 0}}):
+                for _ in range(2):
+                    daemon.run_cycle(list(daemon.get_jobs()))
+        finally:
+            job_watcher.stop()
+        self.assertGreaterEqual(Job.objects.get(pk=job.pk).status, JobStatus.JOB_TERMINATED)
+        self.assertEqual(daemon.watch_checks, {})
+
+
+class AdaptorCacheTestCase(JobDirTestMixin, TestCase):
+
+    def setUp(self):
+        self.service = self.create_service('demo.adaptors.SshClusterAdaptor')
+        self.runner = self.service.runner
+        self.cache = adaptor_cache
+        self.cache.clear()
+
+    def get_submission_adaptor(self):
+        submission = type(self.service.default_submission).objects.get(pk=self.service.default_submission.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            adaptor = self.cache.get(submission)
+        return adaptor, sum(1 for query in ctx.captured_queries
+                            if AdaptorInitParam._meta.db_table in query['sql'])
+
+    def test_runner_adaptors(self):
+        adaptor, queries = self.get_submission_adaptor()
+        self.assertGreater(queries, 0)
+        cached, queries = self.get_submission_adaptor()
+        self.assertEqual(queries, 0)
+        self.assertIsNot(cached, adaptor)
+        self.assertEqual(cached.serialize(), adaptor.serialize())
+        self.assertEqual(self.cache.stats['built'], 1)
+        # runner init param change
+        param = self.runner.adaptor_params.get(name='host')
+        param.value = 'cluster.example.com'
+        param.save()
+        adaptor, queries = self.get_submission_adaptor()
+        self.assertGreater(queries, 0)
+        self.assertEqual(adaptor.host, 'cluster.example.com')
+
+    def test_job_adaptors(self):
+        job = Job.objects.create_from_submission(self.service.default_submission, submitted_inputs={})
+        adaptors = [self.cache.for_job(job) for _ in range(3)]
+        self.assertEqual(self.cache.stats, dict(built=1, hits=2, invalidated=0))
+        self.assertEqual(len(set(id(adaptor) for adaptor in adaptors)), 3)
+        adaptors[0].connect()
+        self.assertFalse(adaptors[1].connected)
+        adaptors[0].disconnect()
+
+    @override_settings(WAVES_DEMO={'LOAD_TEST': {'POLL_LATENCY': 0}})
+    def test_job_transition_adaptor(self):
+        pk = Job.objects.create_from_submission(self.service.default_submission, submitted_inputs={}).pk
+        self.cache.clear()
+        job = Job.objects.get(pk=pk)
+        adaptor = job.adaptor
+        DemoJobQueueRunDaemon(pidfile=os.path.join(self._job_dir, 'daemon.pid')).process_job(job)
+        self.assertEqual(job.status, JobStatus.JOB_PREPARED)
+        # one adaptor for the whole transition, disconnected once done
+        self.assertIs(job.adaptor, adaptor)
+        self.assertFalse(adaptor.connected)
+        self.assertEqual(self.cache.stats['built'], 1)
+        # next daemon cycle job object
+        self.assertIsNot(Job.objects.get(pk=pk).adaptor, adaptor)
+        self.assertEqual(self.cache.stats, dict(built=1, hits=1, invalidated=0))
+
+
+class LeaseManagerTestCase(JobDirTestMixin, TestCase):
+
+    def setUp(self):
+        self.jobs = [Job.objects.create(service='Service', title='Job', _status=JobStatus.JOB_RUNNING,
+                                        _adaptor='runner%i' % (i % 3)) for i in range(6)]
+        self.queryset = Job.objects.filter(pk__in=[job.pk for job in self.jobs])
+
+    def test_exclusive_claims_and_reclaim(self):
+        first = LeaseManager(owner='first', ttl=60, batch=4, shards=0)
+        second = LeaseManager(owner='second', ttl=60, batch=4, shards=0)
+        claimed = first.claim(self.queryset)
+        self.assertEqual(len(claimed), 4)
+        self.assertEqual(first.claim(self.queryset), claimed)
+        others = second.claim(self.queryset)
+        self.assertEqual(len(others), 2)
+        self.assertFalse(claimed & others)
+        # first daemon crashed: its leases expire, then they are reclaimed
+        JobLease.objects.filter(owner='first').update(expires=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(first.owned(), set())
+        self.assertEqual(len(second.claim(self.queryset)), 4)
+        self.assertEqual(second.stats['reclaimed'], 2)
+        self.assertEqual(first.renew(), 2)
+        self.assertEqual(len(first.owned() | second.owned()), 6)
+        second.release(Job.objects.get(pk=min(others)))
+        self.assertEqual(len(second.owned()), 3)
+
+    def test_runner_shards(self):
+        shards = [LeaseManager(owner='shard%i' % i, batch=10, shards=2, shard=i) for i in range(2)]
+        claimed = [shard.claim(self.queryset) for shard in shards]
+        self.assertFalse(claimed[0] & claimed[1])
+        self.assertEqual(len(claimed[0] | claimed[1]), 6)
+        for shard, pks in enumerate(claimed):
+            for job in Job.objects.filter(pk__in=pks):
+                self.assertEqual(runner_shard(job._adaptor, 2), shard)
+
+
+@skipIf(connection.vendor == 'sqlite', 'Daemon processes need a database server (TEST_DATABASE_URL)')
+@override_settings(WAVES_DEMO={'LOAD_TEST': {'POLL_LATENCY': 0.01, 'RUNTIME_MEAN': 0, 'RUNTIME_SD': 0},
+                               'LEASES': True, 'LEASE_BATCH': 10, 'ADAPTIVE_POLLING': False})
+class LeaseProcessesTestCase(JobDirTestMixin, TransactionTestCase):
+
+    def test_transitions_done_once(self):
+        service = self.create_service('demo.adaptors.SshClusterAdaptor')
+        pks = [Job.objects.create_from_submission(service.default_submission, submitted_inputs={}).pk
+               for _ in range(40)]
+        run_lease_daemons(pks, processes=4, timeout=120)
+        self.assertEqual(Job.objects.filter(pk__in=pks, _status__gte=JobStatus.JOB_TERMINATED).count(), len(pks))
+        self.assertEqual(duplicated_transitions(pks), 0)
+
+
+class FairShareSchedulerTestCase(JobDirTestMixin, TestCase):
+
+    def setUp(self):
+        service = self.create_service('demo.adaptors.SshClusterAdaptor')
+        user = User.objects.create_user(email="scripted@example.com")
+        submission = service.default_submission
+        # one user submits 6 jobs, then an anonymous user 2
+        self.jobs = [Job.objects.create_from_submission(submission, submitted_inputs={}, user=user)
+                     for _ in range(6)]
+        self.jobs += [Job.objects.create_from_submission(submission, submitted_inputs={},
+                                                         email_to='anonymous@example.com') for _ in range(2)]
+
+    def run_rounds(self, scheduler, rounds):
+        """ Each round, dispatched jobs run then end """
+        order = []
+        for _ in range(rounds):
+            dispatched = scheduler.schedule([job for job in self.jobs if job.status < JobStatus.JOB_TERMINATED])
+            order.extend(sorted(dispatched))
+            for job in self.jobs:
+                if job.pk in dispatched:
+                    job._status = JobStatus.JOB_TERMINATED
+        return order
+
+    def test_fair_dispatch(self):
+        scheduler = FairShareScheduler(slots=2, runner_slots={}, weights={})
+        scripted, anonymous = [job.pk for job in self.jobs[:6]], [job.pk for job in self.jobs[6:]]
+        self.assertEqual(self.run_rounds(scheduler, 2), [scripted[0], anonymous[0], scripted[1], anonymous[1]])
+        # dispatched jobs keep their slot until prepared
+        self.assertEqual(scheduler.schedule(self.jobs[2:4] + self.jobs[4:6]), {scripted[2], scripted[3]})
+        self.assertEqual(scheduler.schedule(self.jobs[2:6]), {scripted[2], scripted[3]})
+        self.jobs[2]._status = JobStatus.JOB_PREPARED
+        self.assertEqual(scheduler.schedule(self.jobs[2:6]), {scripted[3]})
+        # queues rebuilt from jobs after a restart
+        rebuilt = FairShareScheduler(slots=2, runner_slots={}, weights={})
+        self.assertEqual(rebuilt.schedule(self.jobs[2:6]), {scripted[3]})
+
+    def test_weights(self):
+        scheduler = FairShareScheduler(slots=3, runner_slots={}, weights={'email:anonymous@example.com': 0.25})
+        dispatched = self.run_rounds(scheduler, 1)
+        self.assertEqual(dispatched, [job.pk for job in self.jobs[:3]])
+
+
+class ArrayJobsTestCase(JobDirTestMixin, TestCase):
+
+    def setUp(self):
+        service = self.create_service('demo.adaptors.SshClusterAdaptor')
+        pks = [Job.objects.create_from_submission(service.default_submission, submitted_inputs={}).pk
+               for _ in range(5)]
+        Job.objects.filter(pk__in=pks).update(_status=JobStatus.JOB_PREPARED)
+        self.jobs = list(Job.objects.filter(pk__in=pks).order_by('pk'))
+        self.pks = [job.pk for job in self.jobs]
+
+    def test_batches(self):
+        clock = FakeClock()
+        batcher = ArrayBatcher(window=5, max_size=3, clock=clock)
+        batches, held = batcher.collect(self.jobs)
+        self.assertEqual([[job.pk for job in batch] for batch in batches], [self.pks[:3]])
+        self.assertEqual(held, set(self.pks[3:]))
+        clock.now += 5
+        batches, held = batcher.collect(self.jobs[3:])
+        self.assertEqual([[job.pk for job in batch] for batch in batches], [self.pks[3:]])
+        self.assertEqual(held, set())
+
+    @override_settings(WAVES_DEMO={'LOAD_TEST': {'QUEUE_WAIT': 60}})
+    def test_array_launch(self):
+        launch_array(self.jobs)
+        jobs = list(Job.objects.filter(pk__in=self.pks).order_by('pk'))
+        tasks = [parse_array_task(job.remote_job_id) for job in jobs]
+        self.assertEqual(len(set(array_id for array_id, _ in tasks)), 1)
+        self.assertEqual([task for _, task in tasks], [1, 2, 3, 4, 5])
+        for job in jobs:
+            self.assertEqual(job.status, JobStatus.JOB_QUEUED)
+            self.assertEqual(job.job_history.filter(status=JobStatus.JOB_QUEUED).count(), 1)
+        # array tasks status mapped back to jobs
+        statuses = adaptor_cache.for_job(jobs[0]).jobs_status(jobs)
+        self.assertEqual(statuses, {pk: JobStatus.JOB_QUEUED for pk in self.pks})
+
+
+@override_settings(LOGIN_IP_FLUSH_INTERVAL=0)
+class JobListTestCase(JobDirTestMixin, TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(email='staff@example.com')
+        user.is_staff = True
+        user.save()
+        self.client.force_login(user)
+        self.pks = [Job.objects.create(service='Test', title='Test job %i' % i, client=user).pk for i in range(45)]
+        self.pks.reverse()
+
+    def get_page(self, query=''):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('job_list') + ('?' + query if query else ''))
+        self.assertEqual(response.status_code, 200)
+        return response.context['page_obj'], len(ctx.captured_queries)
+
+    def test_keyset_pages(self):
+        page, _ = self.get_page()
+        self.assertEqual([job.pk for job in page], self.pks[:10])
+        self.assertEqual([number for number, _ in page.page_links], [1, 2, 3, 4, 5])
+        second, second_queries = self.get_page(page.next_query)
+        self.assertEqual([job.pk for job in second], self.pks[10:20])
+        fourth, fourth_queries = self.get_page(page.next_links[2][1])
+        self.assertEqual(fourth.number, 4)
+        self.assertEqual([job.pk for job in fourth], self.pks[30:40])
+        self.assertEqual([number for number, _ in fourth.page_links], [1, 2, 3, 4, 5])
+        # same queries count whatever page depth (no count, no per row query)
+        self.assertEqual(second_queries, fourth_queries)
+        third, _ = self.get_page(fourth.previous_query)
+        self.assertEqual([job.pk for job in third], self.pks[20:30])
+        first, _ = self.get_page(third.page_links[0][1])
+        self.assertEqual([job.pk for job in first], self.pks[:10])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('job_list') + '?after=invalid')
+        self.assertEqual(response.status_code, 404)
+
+
+class JobDetailTestCase(JobDirTestMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        service = self.create_service()
+        self.jobs = [Job.objects.create_from_submission(service.default_submission, submitted_inputs={})
+                     for _ in range(2)]
+        for i in range(4):
+            JobOutput.objects.create(job=self.jobs[1], _name='Result %i' % i, value='result%i' % i, extension='txt',
+                                     api_name='result%i' % i)
+
+    def get_job_page(self, job):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('job_details', kwargs={'unique_id': job.slug}))
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_fixed_queries(self):
+        _, few = self.get_job_page(self.jobs[0])
+        _, many = self.get_job_page(self.jobs[1])
+        self.assertEqual(few, many)
+
+    def test_finished_job_cached(self):
+        job = self.jobs[1]
+        Job.objects.filter(pk=job.pk).update(_status=JobStatus.JOB_TERMINATED)
+        response, queries = self.get_job_page(job)
+        self.assertContains(response, 'Result 3')
+        cached_response, cached_queries = self.get_job_page(job)
+        self.assertContains(cached_response, 'Result 3')
+        self.assertLess(cached_queries, queries)
+
+
+class QueryPlansTestCase(TestCase):
+    """ Hot queries plans, on SQLite or on the database set in TEST_DATABASE_URL environment variable """
+
+    def setUp(self):
+        if connection.vendor not in SUPPORTED_VENDORS:
+            self.skipTest('Query plans are not supported for %s' % connection.vendor)
+
+    def test_no_full_scan(self):
+        for name, (queryset, _) in hot_queries().items():
+            self.assertEqual(full_scans(queryset), [], '%s full scan: %s' % (name, explain(queryset)))
+
+    def test_ordering_from_index(self):
+        for name, (queryset, ordered) in hot_queries().items():
+            if ordered:
+                self.assertFalse(sorts(queryset), '%s sorted: %s' % (name, explain(queryset)))
+
+
+class JobDirsTestCase(JobDirTestMixin, TestCase):
+
+    def test_sharded_layout(self):
+        with override_settings(WAVES_DEMO={'JOB_DIR_SHARD_DEPTH': 2}):
+            job = Job.objects.create(service='Test', title='Test job')
+            self.assertEqual(len(os.path.relpath(job.working_dir, self._job_dir).split(os.sep)), 3)
+            self.assertTrue(os.path.isdir(job.working_dir))
+
+    def test_move_flat_dirs(self):
+        jobs = [Job.objects.create(service='Test', title='Test job %i' % i) for i in range(3)]
+        Job.objects.filter(pk__in=[job.pk for job in jobs]).update(_status=JobStatus.JOB_TERMINATED)
+        with override_settings(WAVES_DEMO={'JOB_DIR_SHARD_DEPTH': 2}):
+            # not moved yet: flat directories are still resolved
+            self.assertEqual(jobs[0].working_dir, flat_dir(self._job_dir, jobs[0].slug))
+            # interrupted after first batch, then resumed
+            progress = next(migrate_job_dirs(batch=1))
+            self.assertEqual((progress['jobs'], progress['moved']), (1, 1))
+            progress = list(migrate_job_dirs(batch=1))[-1]
+            self.assertEqual(progress['resumed_after'], jobs[0].pk)
+            self.assertEqual((progress['jobs'], progress['moved']), (2, 2))
+            for job in Job.objects.filter(pk__in=[job.pk for job in jobs]):
+                self.assertNotEqual(job.working_dir, flat_dir(self._job_dir, job.slug))
+                self.assertTrue(os.path.isdir(job.working_dir))
+                self.assertFalse(os.path.isdir(flat_dir(self._job_dir, job.slug)))
+            # back to flat layout
+            self.assertEqual(list(migrate_job_dirs(flat=True))[-1]['moved'], 3)
+        self.assertTrue(os.path.isdir(jobs[0].working_dir))
+        self.assertEqual(os.listdir(self._job_dir).count(str(jobs[0].slug)), 1)
+
+
+class PurgeTestCase(JobDirTestMixin, TestCase):
+
+    def setUp(self):
+        self.service = self.create_service()
+        self.user = User.objects.create_user('purge', 'purge@example.com', 'password')
+
+    def create_jobs(self, count, days, **kwargs):
+        jobs = [Job.objects.create_from_submission(self.service.default_submission, submitted_inputs={}, **kwargs)
+                for _ in range(count)]
+        for job in jobs:
+            with open(os.path.join(job.working_dir, 'output.txt'), 'w') as fp:
+                fp.write('x' * 100)
+        Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            updated=timezone.now() - datetime.timedelta(days=days))
+        return jobs
+
+    def test_expired_jobs(self):
+        with override_settings(WAVES_CORE=dict(getattr(settings, 'WAVES_CORE', {}), JOB_BASE_DIR=self._job_dir,
+                                               KEEP_ANONYMOUS_JOBS=2, KEEP_REGISTERED_JOBS=10)):
+            anonymous = self.create_jobs(1, 5)
+            self.create_jobs(1, 5, user=self.user)
+            self.create_jobs(1, 1)
+            self.assertEqual(list(expired_jobs()), anonymous)
+            Service.objects.filter(pk=self.service.pk).update(to_delete=False)
+            self.assertEqual(list(expired_jobs()), [])
+
+    def test_dry_run(self):
+        jobs = self.create_jobs(3, 60)
+        progress = list(purge_jobs(dry_run=True))[-1]
+        self.assertEqual((progress['jobs'], progress['dirs']), (3, 3))
+        self.assertGreater(progress['rows'], 3)
+        self.assertGreaterEqual(progress['bytes'], 300)
+        self.assertEqual(Job.objects.count(), 3)
+        self.assertTrue(all(os.path.isdir(job.working_dir) for job in jobs))
+
+    def test_purge_resumes(self):
+        jobs = self.create_jobs(3, 60)
+        kept = self.create_jobs(1, 0)
+        # interrupted after first batch, one dir left in trash
+        purge = purge_jobs(batch=2)
+        self.assertEqual(next(purge)['jobs'], 2)
+        purge.close()
+        trash = os.path.join(self._job_dir, '.demo_purge')
+        os.makedirs(os.path.join(trash, 'left_over'))
+        progress = list(purge_jobs(batch=2))[-1]
+        self.assertTrue(progress['done'])
+        self.assertEqual((progress['resumed_after'], progress['jobs'], progress['dirs']), (jobs[1].pk, 1, 2))
+        self.assertEqual(list(Job.objects.all()), kept)
+        self.assertFalse(any(os.path.isdir(job.working_dir) for job in jobs))
+        self.assertEqual(os.listdir(trash), [])
+        self.assertTrue(os.path.isdir(kept[0].working_dir))
+
+    def test_failed_delete_restores_dirs(self):
+        jobs = self.create_jobs(2, 60)
+        remover = job_trash(workers=1)
+
+        def failing_delete(pks):
+            raise DatabaseError('Deadlock found')
+
+        delete_rows, demo_purge._delete_rows = demo_purge._delete_rows, failing_delete
+        try:
+            self.assertRaises(DatabaseError, delete_jobs, [(job.pk, job.slug) for job in jobs], remover)
+        finally:
+            demo_purge._delete_rows = delete_rows
+        # jobs still exist: nothing left in trash for next purge
+        self.assertEqual(remover.resume(), 0)
+        remover.close()
+        self.assertTrue(all(os.path.isdir(job.working_dir) for job in jobs))
+
+    def test_failed_jobs_delete_keeps_dirs(self):
+        jobs = self.create_jobs(2, 60)
+        remover = job_trash(workers=1)
+
+        def failing_handler(sender, instance, **kwargs):
+            raise DatabaseError('Deadlock found')
+
+        post_delete.connect(failing_handler, sender=Job)
+        try:
+            self.assertRaises(DatabaseError, delete_jobs, [(job.pk, job.slug) for job in jobs], remover)
+        finally:
+            post_delete.disconnect(failing_handler, sender=Job)
+        remover.close()
+        self.assertEqual(Job.objects.count(), 2)
+        self.assertTrue(all(os.path.isdir(job.working_dir) for job in jobs))
+        # waves-core handler is connected again
+        self.assertTrue(post_delete.has_listeners(Job))
+
+    def test_io_throttle(self):
+        clock = FakeClock()
+        slept = []
+
+        def sleep(seconds):
+            slept.append(seconds)
+
+        remover = TrashRemover(self._job_dir, workers=1, io_rate=10, clock=clock, sleep=sleep)
+        for _ in range(3):
+            remover.throttle()
+        remover.close()
+        self.assertEqual(len(slept), 2)
+        self.assertAlmostEqual(slept[0], 0.1)
+        self.assertAlmostEqual(slept[1], 0.2)
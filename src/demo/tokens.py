@@ -0,0 +1,39 @@
+""" Demo api user token, resolved lazily and kept in process for API_TOKEN_TIMEOUT seconds
+
+Token is dropped from demo.signals when demo api user or any api token changes.
+"""
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from waves.authentication.models import WavesApiUser
+
+from demo.settings import demo_settings
+
+__all__ = ['DemoApiToken', 'demo_api_token']
+
+
+class DemoApiToken(object):
+    """ Process level cache for demo api user ('API_USER_EMAIL' setting) token key """
+
+    def __init__(self):
+        self._key = None
+        self._expires = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """ Token key, None if demo api user (or its token) does not exist """
+        if self._expires < time.time():
+            with self._lock:
+                if self._expires < time.time():
+                    self._key = WavesApiUser.objects.filter(
+                        user__email=demo_settings.API_USER_EMAIL).values_list('key', flat=True).first()
+                    self._expires = time.time() + demo_settings.API_TOKEN_TIMEOUT
+        return self._key
+
+    def invalidate(self):
+        self._expires = 0
+
+
+demo_api_token = DemoApiToken()
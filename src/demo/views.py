@@ -1,29 +1,41 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.contrib.auth import get_user_model
-from django.db.models import Prefetch
 from django.views import generic
 
-from demo.models import ServiceCategory
+from demo.catalogue import get_categories
+from demo.details import job_detail_queryset, render_job_detail
+from demo.metas import get_service_metas
+from demo.models import ServiceCategory, ServiceMeta
+from demo.pagination import KeysetPaginator
+from demo.tokens import demo_api_token
 from waves.wcore.models import get_service_model
 from waves.wcore.views.jobs import JobSubmissionView as CoreDetailView, JobListView as CoreJobListView, Job, \
     JobView as CoreJobView
 
 Service = get_service_model()
-User = get_user_model()
 
 
 class ServiceDetailView(CoreDetailView):
     model = Service
     template_name = 'demo/service_details.html'
 
+    def get_context_data(self, **kwargs):
+        """ Add service metas, grouped by type ('service_metas') and as one list per type ('service_<type>') """
+        context = super(ServiceDetailView, self).get_context_data(**kwargs)
+        metas = get_service_metas(self.object)
+        context['service_metas'] = metas
+        for meta_type, title in ServiceMeta.SERVICE_META:
+            context['service_%s' % meta_type] = metas.get(meta_type, [])
+            context['service_meta_title_%s' % meta_type] = title
+        return context
+
     def render_to_response(self, context, **response_kwargs):
+        """ Set demo api user token cookie (token is cached in process) """
         response = super(ServiceDetailView, self).render_to_response(context, **response_kwargs)
-        api_user = User.objects.filter(email='demoapiuser@atgc-montpellier.fr')
-        if api_user:
-            # user_waves =
-            response.set_cookie('waves_token', api_user[0].waves_user.key)
+        token = demo_api_token.get()
+        if token:
+            response.set_cookie('waves_token', token)
         return response
 
 
@@ -32,7 +44,15 @@ class CategoryDetailView(generic.DetailView):
     context_object_name = 'category'
     model = ServiceCategory
     template_name = 'category/category_details.html'
-    context_object_name = 'category'
+
+    def get_context_data(self, **kwargs):
+        """ Add category ancestors, siblings (with recursive services count) and sub tree services """
+        context = super(CategoryDetailView, self).get_context_data(**kwargs)
+        category = self.object
+        context['ancestors'] = category.get_ancestors()
+        context['siblings'] = ServiceCategory.objects.with_services_count(category.get_siblings(include_self=True))
+        context['services'] = category.get_tree_services(Service.objects.get_services(user=self.request.user))
+        return context
 
 
 class CategoryListView(generic.ListView):
@@ -41,23 +61,36 @@ class CategoryListView(generic.ListView):
     context_object_name = 'online_categories'
 
     def get_queryset(self):
-        return ServiceCategory.objects.filter(category_tools__isnull=False).prefetch_related(
-            Prefetch('category_tools',
-                     queryset=Service.objects.get_services(user=self.request.user),
-                     to_attr="category_public_tools"
-                     )
-        ).distinct()
+        """ Cached categories tree, with services available for current user """
+        return get_categories(self.request.user)
 
 
 class JobListView(CoreJobListView):
 
     def get_queryset(self):
-        queryset = Job.objects.all()
-        return queryset
+        """ All jobs, with relations displayed in list """
+        return Job.objects.select_related('client')
+
+    def paginate_queryset(self, queryset, page_size):
+        """ Keyset pagination on (created, id) from 'after' / 'before' cursors, no rows count """
+        try:
+            number = int(self.request.GET.get('page', 1))
+        except ValueError:
+            number = 1
+        paginator = KeysetPaginator(queryset, page_size)
+        page = paginator.page(after=self.request.GET.get('after'), before=self.request.GET.get('before'),
+                              number=number)
+        return paginator, page, page.object_list, page.has_other_pages()
 
 
 class JobView(CoreJobView):
 
     def get_queryset(self):
-        queryset = Job.objects.all()
-        return queryset
+        """ Jobs with relations displayed in page """
+        return job_detail_queryset()
+
+    def get_context_data(self, **kwargs):
+        """ Add job detail fragment ('job_detail'), cached for finished jobs """
+        context = super(JobView, self).get_context_data(**kwargs)
+        context['job_detail'] = render_job_detail(self.object)
+        return context
@@ -0,0 +1,273 @@
+""" Job working directories watcher, for local adaptors completion detection
+
+Local jobs write their exit code in 'job.exit' file in their working directory when they end. Daemon watches working
+directories of running local jobs instead of polling their status: watcher thread pushes finished jobs as soon as the
+file appears, and wakes daemon up. Linux inotify is used through libc (no extra dependency), other platforms (or
+inotify failures) fall back to checking watched directories every 'WATCH_POLL_INTERVAL' seconds.
+"""
+from __future__ import unicode_literals
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from os.path import exists, join
+
+from waves.wcore.adaptors.const import JobStatus
+
+from demo.settings import demo_settings
+
+logger = logging.getLogger('waves.daemon')
+
+__all__ = ['EXIT_CODE_FILE', 'read_exit_code', 'write_exit_code', 'exit_status', 'InotifyBackend', 'PollingBackend',
+           'JobDirWatcher', 'job_watcher']
+
+#: File written in job working directory with job exit code
+EXIT_CODE_FILE = 'job.exit'
+#: Exit code for a terminated (cancelled) process
+CANCELLED_EXIT_CODE = 143
+
+
+def read_exit_code(working_dir):
+    """ Job exit code or None if job has not ended """
+    try:
+        with open(join(working_dir, EXIT_CODE_FILE)) as fp:
+            return int(fp.read().strip())
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def write_exit_code(working_dir, exit_code):
+    """ Write exit code file, renamed once written so that watchers never see a partial file """
+    tmp_path = join(working_dir, '.%s.tmp' % EXIT_CODE_FILE)
+    try:
+        with open(tmp_path, 'w') as fp:
+            fp.write('%i\n' % exit_code)
+        os.rename(tmp_path, join(working_dir, EXIT_CODE_FILE))
+    except (IOError, OSError) as exc:
+        logger.error('Unable to write exit code in %s: %s', working_dir, exc)
+
+
+def exit_status(exit_code):
+    """ Job status for exit code """
+    if exit_code == 0:
+        return JobStatus.JOB_COMPLETED
+    if exit_code == CANCELLED_EXIT_CODE:
+        return JobStatus.JOB_CANCELLED
+    return JobStatus.JOB_ERROR
+
+
+class InotifyBackend(object):
+    """ Directories watched with Linux inotify, raise OSError when not available """
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    _event = struct.Struct(str('iIII'))
+
+    def __init__(self):
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            init = self._libc.inotify_init1
+        except (OSError, AttributeError) as exc:
+            raise OSError(errno.ENOSYS, 'inotify not available: %s' % exc)
+        self._fd = init(os.O_NONBLOCK)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+    def add(self, path):
+        """ Watch directory, return watch token """
+        if not isinstance(path, bytes):
+            path = path.encode(sys.getfilesystemencoding())
+        wd = self._libc.inotify_add_watch(self._fd, path, self.IN_CLOSE_WRITE | self.IN_MOVED_TO)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch failed for %s' % path)
+        return wd
+
+    def remove(self, token):
+        self._libc.inotify_rm_watch(self._fd, token)
+
+    def wait(self, timeout):
+        """ Wait for events up to timeout seconds, return tokens of directories where exit code file appeared """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except OSError as exc:
+            if exc.errno == errno.EAGAIN:
+                return []
+            raise
+        tokens = []
+        offset = 0
+        while offset + self._event.size <= len(data):
+            wd, mask, cookie, length = self._event.unpack_from(data, offset)
+            offset += self._event.size
+            name = data[offset:offset + length].rstrip(b'\0').decode(sys.getfilesystemencoding())
+            offset += length
+            if name == EXIT_CODE_FILE:
+                tokens.append(wd)
+        return tokens
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingBackend(object):
+    """ Directories checked for exit code file every 'interval' seconds """
+
+    def __init__(self, interval=None):
+        self.interval = interval
+        self._paths = {}
+        self._next_token = 0
+        self._lock = threading.Lock()
+
+    def add(self, path):
+        with self._lock:
+            self._next_token += 1
+            self._paths[self._next_token] = path
+            return self._next_token
+
+    def remove(self, token):
+        with self._lock:
+            self._paths.pop(token, None)
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval or demo_settings.WATCH_POLL_INTERVAL))
+        with self._lock:
+            paths = list(self._paths.items())
+        return [token for token, path in paths if exists(join(path, EXIT_CODE_FILE))]
+
+    def close(self):
+        pass
+
+
+class JobDirWatcher(object):
+    """ Watch working directories of running jobs, collect finished ones
+
+    Jobs are watched until their exit code file appears, they are then returned (once) by 'pop_finished'. Jobs
+    finished but still running (unexpected exit code file) are not watched anymore, so that daemon polls them.
+    """
+    #: Seconds between two checks for watcher stop
+    tick = 1
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._tokens = {}
+        self._watched = {}
+        self._fired = set()
+        self._finished = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            try:
+                self._backend = InotifyBackend()
+            except OSError as exc:
+                logger.warning('Job directories watched by polling: %s', exc)
+                self._backend = PollingBackend()
+        return self._backend
+
+    def is_watched(self, job):
+        return job.pk in self._watched
+
+    def watch(self, job):
+        """ Watch job working directory, return False if job can not be watched (it is then left to polling) """
+        with self._lock:
+            if job.pk in self._watched:
+                return True
+            if job.pk in self._fired:
+                return False
+            try:
+                token = self.backend.add(job.working_dir)
+            except OSError as exc:
+                logger.warning('Unable to watch job %s directory: %s', job.slug, exc)
+                return False
+            self._watched[job.pk] = token
+            self._tokens[token] = job.pk
+        self.start()
+        # job may have ended before watch was set
+        if read_exit_code(job.working_dir) is not None:
+            self._push([token])
+        return True
+
+    def unwatch(self, job):
+        """ Stop watching job directory, forget it """
+        with self._lock:
+            self._fired.discard(job.pk)
+            self._finished.discard(job.pk)
+            self._remove(job.pk)
+
+    def _remove(self, pk):
+        token = self._watched.pop(pk, None)
+        if token is not None:
+            self._tokens.pop(token, None)
+            try:
+                self.backend.remove(token)
+            except OSError:
+                pass
+
+    def _push(self, tokens):
+        with self._lock:
+            for token in tokens:
+                pk = self._tokens.get(token)
+                if pk is not None:
+                    self._remove(pk)
+                    self._fired.add(pk)
+                    self._finished.add(pk)
+            if self._finished:
+                self._wakeup.set()
+
+    def pop_finished(self):
+        """ Jobs ids for which exit code file appeared since last call """
+        with self._lock:
+            finished, self._finished = self._finished, set()
+            self._wakeup.clear()
+        return finished
+
+    def wait(self, timeout):
+        """ Sleep for timeout seconds, or until a watched job ends, return True if a job ended """
+        return self._wakeup.wait(timeout)
+
+    def start(self):
+        """ Start watcher thread if not running """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='job-dir-watcher')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def stop(self):
+        """ Stop watcher thread, forget all watched jobs """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.tick * 2)
+        with self._lock:
+            for pk in list(self._watched.keys()):
+                self._remove(pk)
+            self._fired.clear()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._push(self.backend.wait(self.tick))
+            except Exception as exc:
+                logger.exception('Job directories watcher error: %s', exc)
+                time.sleep(self.tick)
+
+    def __len__(self):
+        return len(self._watched)
+
+
+job_watcher = JobDirWatcher()
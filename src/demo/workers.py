@@ -0,0 +1,116 @@
+""" Worker pool for daemon job operations, with a global and a per runner concurrency cap
+
+Each operation runs in its own thread, at most 'WORKERS' at a time and 'WORKERS_PER_RUNNER' for a runner. An
+operation running longer than 'OPERATION_TIMEOUT' seconds can not be killed: it is left running, its slot is given
+back, and its runner is isolated (no more operations dispatched to it) until it returns, so that a hung runner does not
+stall the others.
+"""
+from __future__ import unicode_literals
+
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+from django.db import connection
+
+from demo.settings import demo_settings
+
+logger = logging.getLogger('waves.daemon')
+
+__all__ = ['WorkerPool']
+
+
+class WorkerPool(object):
+    """ Run (runner key, callable) tasks with concurrency caps and operation timeout """
+    #: Seconds between two checks for finished or timed out operations
+    tick = 0.05
+
+    def __init__(self, workers=None, per_runner=None, timeout=None, clock=time.time):
+        self.clock = clock
+        self.workers = workers or demo_settings.WORKERS
+        self.per_runner = per_runner or demo_settings.WORKERS_PER_RUNNER
+        self.timeout = timeout or demo_settings.OPERATION_TIMEOUT
+        self._cond = threading.Condition()
+        self._running = {}
+        self._hung = {}
+        self.stats = dict(done=0, failed=0, timed_out=0, skipped=0)
+
+    @property
+    def hung_runners(self):
+        """ Runners with operations still running after timeout """
+        with self._cond:
+            return [key for key, count in self._hung.items() if count]
+
+    def _execute(self, token, key, func):
+        failed = False
+        try:
+            func()
+        except Exception as exc:
+            failed = True
+            logger.exception('Operation failed (runner:%s): %s', key, exc)
+        finally:
+            connection.close()
+            with self._cond:
+                if self._running.pop(token, None) is None:
+                    # returned after timeout
+                    self._hung[key] -= 1
+                    logger.warning('Hung operation returned (runner:%s)', key)
+                else:
+                    self.stats['failed' if failed else 'done'] += 1
+                self._cond.notify_all()
+
+    def _running_for(self, key):
+        return sum(1 for running_key, started in self._running.values() if running_key == key)
+
+    def _start_ready(self, pending):
+        """ Start pending tasks allowed by caps, round robin over runners """
+        started = True
+        while started and len(self._running) < self.workers:
+            started = False
+            for key in list(pending.keys()):
+                if len(self._running) >= self.workers:
+                    break
+                if self._hung.get(key):
+                    self.stats['skipped'] += len(pending.pop(key))
+                    logger.warning('Runner %s is isolated (hung operation), its jobs are skipped', key)
+                    continue
+                if self._running_for(key) >= self.per_runner:
+                    continue
+                func = pending[key].popleft()
+                if not pending[key]:
+                    del pending[key]
+                token = object()
+                self._running[token] = (key, self.clock())
+                thread = threading.Thread(target=self._execute, args=(token, key, func), name='demo-worker')
+                thread.daemon = True
+                thread.start()
+                started = True
+
+    def _expire(self):
+        """ Give back slots of operations running for longer than timeout, isolate their runner """
+        limit = self.clock() - self.timeout
+        for token, (key, started) in list(self._running.items()):
+            if started < limit:
+                del self._running[token]
+                self._hung[key] = self._hung.get(key, 0) + 1
+                self.stats['timed_out'] += 1
+                logger.error('Operation timed out after %ss (runner:%s), runner isolated', self.timeout, key)
+
+    def run(self, tasks):
+        """ Run tasks, return when all are done, timed out or skipped
+
+        :param tasks: iterable of (runner key, callable)
+        :return: stats dict (done, failed, timed_out, skipped), cumulated over calls
+        """
+        pending = OrderedDict()
+        for key, func in tasks:
+            pending.setdefault(key, deque()).append(func)
+        with self._cond:
+            while True:
+                self._expire()
+                self._start_ready(pending)
+                if not self._running:
+                    break
+                self._cond.wait(self.tick)
+        return dict(self.stats)
@@ -34,6 +34,7 @@ class NewUserAdmin(NamedUserAdmin):
                     'institution')
     list_filter = ('profile__country', 'is_active', 'profile__institution', 'name', 'email')
     ordering = ['name', 'email', 'is_staff']
+    actions = ['activate_users']
 
     def get_fieldsets(self, request, obj=None):
         fieldsets = super(NewUserAdmin, self).get_fieldsets(request, obj)
@@ -54,5 +55,13 @@ class NewUserAdmin(NamedUserAdmin):
     def api_key(self, obj):
         return obj.profile.api_key
 
+    def activate_users(self, request, queryset):
+        """ Activate selected users, api keys are generated in bulk for those registered for api use """
+        activated = queryset.update(is_active=True)
+        keys = UserProfile.objects.generate_api_keys(queryset)
+        self.message_user(request, "%i user(s) activated, %i api key(s) generated" % (activated, keys))
+
+    activate_users.short_description = "Activate selected users"
+
 admin.site.unregister(User)
 admin.site.register(User, NewUserAdmin)
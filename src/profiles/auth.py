@@ -1,9 +1,108 @@
+""" API key authentication """
+from __future__ import unicode_literals
+
+import copy
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
 from django.contrib.auth import user_logged_in
 from django.core.exceptions import ObjectDoesNotExist
 from rest_framework.authentication import BaseAuthentication
 
 from profiles.models import UserProfile
 
+#: Cached api key entry, 'user' is the user instance loaded with profile
+ApiKeyEntry = namedtuple('ApiKeyEntry', ['user_id', 'banned', 'user', 'expires'])
+
+
+class ApiKeyCache(object):
+    """ In process TTL + LRU cache api_key -> (user id, banned flag)
+
+    Entries are dropped from profiles signals whenever a profile or its user is saved or deleted, TTL bounds staleness
+    for other processes. Also records last 'user_logged_in' signal time per key in order to coalesce IP updates.
+    Settings (read at each call): API_KEY_CACHE_TTL (seconds, 0 disables cache), API_KEY_CACHE_SIZE (max entries),
+    API_KEY_LOGIN_INTERVAL (min seconds between two login signals for a key).
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._user_keys = {}
+        self._last_login = {}
+        self._lock = threading.RLock()
+        self.hits = self.misses = 0
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'API_KEY_CACHE_TTL', 60)
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'API_KEY_CACHE_SIZE', 1000)
+
+    @property
+    def login_interval(self):
+        return getattr(settings, 'API_KEY_LOGIN_INTERVAL', 300)
+
+    def get(self, api_key):
+        """ Cached entry for api_key, None if missing or expired """
+        with self._lock:
+            entry = self._entries.pop(api_key, None)
+            if entry is None or entry.expires < time.time():
+                self.misses += 1
+                return None
+            # re-insert as most recently used
+            self._entries[api_key] = entry
+            self.hits += 1
+            return entry
+
+    def set(self, api_key, profile):
+        """ Cache profile (with its user) for api_key, return entry """
+        entry = ApiKeyEntry(profile.user_id, profile.banned, profile.user, time.time() + self.ttl)
+        if self.ttl <= 0:
+            return entry
+        with self._lock:
+            self._entries.pop(api_key, None)
+            self._entries[api_key] = entry
+            self._user_keys[entry.user_id] = api_key
+            while len(self._entries) > self.max_size:
+                old_key, old_entry = self._entries.popitem(last=False)
+                self._user_keys.pop(old_entry.user_id, None)
+                self._last_login.pop(old_key, None)
+        return entry
+
+    def invalidate(self, user_id):
+        """ Drop cached entry for user """
+        with self._lock:
+            api_key = self._user_keys.pop(user_id, None)
+            if api_key is not None:
+                self._entries.pop(api_key, None)
+                self._last_login.pop(api_key, None)
+
+    def login_due(self, api_key):
+        """ Whether a login signal should be sent for api_key (at most once per interval), record it if so """
+        now = time.time()
+        with self._lock:
+            if now - self._last_login.get(api_key, 0) < self.login_interval:
+                return False
+            if api_key in self._entries:
+                self._last_login[api_key] = now
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+            self._last_login.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+api_key_cache = ApiKeyCache()
+
 
 class APIKeyAuthBackend(BaseAuthentication):
     """ API (public key) authentication backend """
@@ -12,12 +111,16 @@ class APIKeyAuthBackend(BaseAuthentication):
         api_key = request.POST.get('api_key', request.GET.get('api_key', None))
         if not api_key:
             return None
-        try:
-            api_prof = UserProfile.objects.get(api_key=api_key)
-            if not api_prof.banned:
-                # Authorized all 'api_key' except when user is banned
-                user_logged_in.send(sender=api_prof.__class__, request=request, user=api_prof.user)
-                return api_prof.user, None
-        except ObjectDoesNotExist:
-            return None, None
+        entry = api_key_cache.get(api_key)
+        if entry is None:
+            try:
+                entry = api_key_cache.set(api_key, UserProfile.objects.select_related('user').get(api_key=api_key))
+            except ObjectDoesNotExist:
+                return None, None
+        if not entry.banned:
+            # Authorized all 'api_key' except when user is banned, cached user is shared: return a copy
+            user = copy.copy(entry.user)
+            if api_key_cache.login_due(api_key):
+                user_logged_in.send(sender=UserProfile, request=request, user=user)
+            return user, None
         return None, None
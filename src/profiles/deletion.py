@@ -0,0 +1,82 @@
+""" Users accounts deletion
+
+Deleting a user cascades over every job it ran, then removes its profile media directory: for heavy users this takes
+minutes. Deletion requests instead deactivate the account at once (api key dropped), pending deletions are then run out
+of web server processes by './manage.py process_deletions' (scheduled with cron): jobs are deleted by batches of
+ACCOUNT_DELETION_BATCH jobs (rows bulk deleted, working dirs removed by demo purge trash, see demo.purge), then profile
+files and finally the user. Progress is recorded on the AccountDeletion request, interrupted deletions are resumed on
+next run.
+"""
+from __future__ import unicode_literals
+
+import logging
+import os
+import shutil
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from waves.wcore.models import Job
+
+from demo.purge import delete_jobs, job_trash
+from profiles.models import AccountDeletion
+from profiles.storage import profile_directory
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['request_deletion', 'run_deletion', 'pending_deletions']
+
+
+def request_deletion(user):
+    """ Deactivate user and record its account deletion request, return AccountDeletion request """
+    with transaction.atomic():
+        deletion, created = AccountDeletion.objects.get_or_create(
+            user=user, defaults=dict(jobs_total=Job.objects.filter(client=user).count()))
+        profile = user.profile
+        profile.api_key = None
+        profile.save(update_fields=['api_key'])
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+    return deletion
+
+
+def pending_deletions():
+    """ Account deletion requests not finished yet """
+    return AccountDeletion.objects.filter(finished__isnull=True).order_by('requested')
+
+
+def run_deletion(deletion_id, batch=None):
+    """ Delete account jobs by batches, profile files and user, return AccountDeletion request """
+    batch = batch or getattr(settings, 'ACCOUNT_DELETION_BATCH', 100)
+    deletion = AccountDeletion.objects.select_related('user__profile').get(pk=deletion_id)
+    user = deletion.user
+    if deletion.finished:
+        return deletion
+    if user is None:
+        # user deleted by an interrupted run
+        return _finish(deletion)
+    remover = job_trash()
+    try:
+        while True:
+            rows = list(Job.objects.filter(client=user).order_by('pk').values_list('pk', 'slug')[:batch])
+            if not rows:
+                break
+            delete_jobs(rows, remover)
+            AccountDeletion.objects.filter(pk=deletion.pk).update(jobs_deleted=F('jobs_deleted') + len(rows))
+    finally:
+        remover.close()
+    profile_dir = os.path.join(settings.MEDIA_ROOT, profile_directory(user.profile, ''))
+    if os.path.exists(profile_dir):
+        shutil.rmtree(profile_dir)
+    with transaction.atomic():
+        user.delete()
+        return _finish(deletion)
+
+
+def _finish(deletion):
+    AccountDeletion.objects.filter(pk=deletion.pk).update(finished=timezone.now())
+    deletion.refresh_from_db()
+    logger.info('Account deletion %s done', deletion.slug)
+    return deletion
+
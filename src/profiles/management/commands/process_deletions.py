@@ -0,0 +1,36 @@
+from __future__ import unicode_literals, absolute_import
+
+import fcntl
+import os
+import tempfile
+
+from django.core.management import BaseCommand
+
+from profiles.deletion import pending_deletions, run_deletion
+
+
+class Command(BaseCommand):
+    """
+    Run pending account deletions (see profiles.deletion), to be scheduled with cron. A run started while another one
+    is still running exits at once
+    """
+    help = 'Delete jobs, files and profiles of accounts with a pending deletion request'
+    lockfile = os.path.join(tempfile.gettempdir(), 'waves_demo_deletions.lock')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', action='store', dest='batch', type=int, default=None,
+                            help='Jobs deleted per batch (default ACCOUNT_DELETION_BATCH setting)')
+
+    def handle(self, *args, **options):
+        with open(self.lockfile, 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                self.stdout.write('Account deletions already running')
+                return
+            pending = list(pending_deletions().values_list('pk', flat=True))
+            for deletion_id in pending:
+                deletion = run_deletion(deletion_id, batch=options['batch'])
+                self.stdout.write('%s: %i job(s) deleted' % (deletion, deletion.jobs_deleted))
+            if not pending:
+                self.stdout.write('No pending account deletion')
@@ -0,0 +1,77 @@
+from __future__ import unicode_literals, absolute_import
+
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from profiles.models import UserProfile
+
+
+class Command(BaseCommand):
+    """
+    Create users (with their profiles) in bulk and report timings
+    """
+    help = 'Provision N users with profiles, optionally registered for api use, and print a timing report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, action='store', help="Number of users to create")
+        parser.add_argument('--email', action='store', dest='email', default='user{}@example.com',
+                            help="Users email pattern, '{}' is replaced by user index")
+        parser.add_argument('--api', action='store_true', dest='api', default=False,
+                            help='Register users for api use (generates api keys)')
+        parser.add_argument('--one-by-one', action='store_true', dest='one_by_one', default=False,
+                            help='Create users one by one (post_save signals path), for comparison')
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run', default=False,
+                            help='Rollback created users')
+
+    def handle(self, *args, **options):
+        emails = [options['email'].format(i) for i in range(options['count'])]
+        timings = []
+        with CaptureQueriesContext(connection) as ctx, transaction.atomic():
+            start = time.time()
+            if options['one_by_one']:
+                self.create_one_by_one(emails, options['api'], timings)
+            else:
+                self.create_bulk(emails, options['api'], timings)
+            timings.append(('total', time.time() - start))
+            if options['dry_run']:
+                transaction.set_rollback(True)
+        for step, elapsed in timings:
+            self.stdout.write('%s: %.3fs' % (step, elapsed))
+        total = timings[-1][1]
+        self.stdout.write('users: %i | queries: %i | users / s: %.1f' % (
+            len(emails), len(ctx.captured_queries), len(emails) / total if total else 0))
+
+    def create_bulk(self, emails, api, timings):
+        """ Bulk create users then their profiles, in a constant number of queries per batch """
+        User = get_user_model()
+        start = time.time()
+        users = []
+        for email in emails:
+            user = User(email=email, name=email.split('@')[0], is_active=True)
+            user.set_unusable_password()
+            users.append(user)
+        User.objects.bulk_create(users, batch_size=UserProfile.objects.batch_size)
+        timings.append(('users', time.time() - start))
+        start = time.time()
+        # bulk_create does not set primary keys for all backends
+        batch_size = UserProfile.objects.batch_size
+        users = []
+        for i in range(0, len(emails), batch_size):
+            users.extend(User.objects.filter(email__in=emails[i:i + batch_size]))
+        UserProfile.objects.create_profiles(users, registered_for_api=api)
+        timings.append(('profiles', time.time() - start))
+
+    def create_one_by_one(self, emails, api, timings):
+        """ Create users with profiles through post_save signals """
+        User = get_user_model()
+        start = time.time()
+        for email in emails:
+            user = User.objects.create_user(email=email, name=email.split('@')[0])
+            if api:
+                user.profile.registered_for_api = True
+                user.save()
+        timings.append(('users', time.time() - start))
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('profiles', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountDeletion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('requested', models.DateTimeField(auto_now_add=True, verbose_name='Requested on')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='Finished on')),
+                ('jobs_total', models.PositiveIntegerField(default=0, verbose_name='Jobs to delete')),
+                ('jobs_deleted', models.PositiveIntegerField(default=0, verbose_name='Deleted jobs')),
+                ('user', models.OneToOneField(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deletion', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -3,12 +3,51 @@ from __future__ import unicode_literals
 
 from django.conf import settings
 from django.db import models
+from django.db.models import Case, Q, Value, When
 import uuid
 from django.utils.encoding import python_2_unicode_compatible
 from django_countries.fields import CountryField
 from profiles.storage import profile_storage, profile_directory
 
 
+def new_api_key():
+    """ Generate a new api key """
+    return str(uuid.uuid1())
+
+
+class UserProfileManager(models.Manager):
+    """ Bulk operations on profiles, with a constant number of queries per batch of users """
+    batch_size = 500
+
+    def create_profiles(self, users, registered_for_api=False, **fields):
+        """ Create profiles for users (no post_save signal), api keys set for registered ones """
+        profiles = [self.model(user=user,
+                               registered_for_api=registered_for_api or user.is_staff or user.is_superuser,
+                               **fields) for user in users]
+        for profile in profiles:
+            if profile.registered_for_api and profile.user.is_active:
+                profile.api_key = new_api_key()
+        return self.bulk_create(profiles, batch_size=self.batch_size)
+
+    def generate_api_keys(self, users):
+        """ Set an api key to active users' profiles registered for api use without any key
+
+        :param users: users queryset or list
+        :return: number of updated profiles
+        """
+        profile_ids = list(self.filter(user__in=users, user__is_active=True).filter(
+            Q(api_key__isnull=True) | Q(api_key='')).filter(
+            Q(registered_for_api=True) | Q(user__is_staff=True) | Q(user__is_superuser=True)).values_list('pk',
+                                                                                                       flat=True))
+        for i in range(0, len(profile_ids), self.batch_size):
+            batch = profile_ids[i:i + self.batch_size]
+            self.filter(pk__in=batch).update(
+                registered_for_api=True,
+                api_key=Case(*[When(pk=pk, then=Value(new_api_key())) for pk in batch],
+                             output_field=models.CharField()))
+        return len(profile_ids)
+
+
 @python_2_unicode_compatible
 class UserProfile(models.Model):
     """ Added data to standard Django AuthModel to add some information """
@@ -57,6 +96,8 @@ class UserProfile(models.Model):
     banned = models.BooleanField('Banned (abuse)', default=False)
     slug = models.UUIDField(default=uuid.uuid4, blank=True, unique=True, editable=False)
 
+    objects = UserProfileManager()
+
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
         if self.user.is_staff or self.user.is_superuser:
             self.registered_for_api = True
@@ -66,4 +107,27 @@ class UserProfile(models.Model):
         return "{}".format(self.user.name)
 
     def __unicode__(self):
-        return "{}".format(self.user.name)
\ No newline at end of file
+        return "{}".format(self.user.name)
+
+
+@python_2_unicode_compatible
+class AccountDeletion(models.Model):
+    """ User account deletion request: user is deactivated at once, its jobs, files and profile are then deleted in
+    background (see profiles.deletion). Request is kept once done, as deletion status """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, null=True, related_name='deletion',
+                                on_delete=models.SET_NULL)
+    slug = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    requested = models.DateTimeField('Requested on', auto_now_add=True)
+    finished = models.DateTimeField('Finished on', null=True, blank=True)
+    jobs_total = models.PositiveIntegerField('Jobs to delete', default=0)
+    jobs_deleted = models.PositiveIntegerField('Deleted jobs', default=0)
+
+    @property
+    def progress(self):
+        """ Deletion progress (percent) """
+        if self.finished:
+            return 100
+        return min(99, 100 * self.jobs_deleted // self.jobs_total) if self.jobs_total else 0
+
+    def __str__(self):
+        return "Account deletion {}".format(self.slug)
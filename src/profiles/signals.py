@@ -1,45 +1,66 @@
 """ Profiles related signals """
-import uuid
 from django.conf import settings
 from django.contrib.auth import user_logged_in
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from ipware.ip import get_real_ip
 
-from profiles.models import UserProfile
+from profiles.auth import api_key_cache
+from profiles.models import UserProfile, new_api_key
 from profiles.storage import profile_directory
+from profiles.tracking import login_ip_buffer
 
 
 @receiver(user_logged_in)
 def login_action_handler(sender, user, **kwargs):
-    """ Register user ip address upon login """
+    """ Register user ip address upon login (written in background, see profiles.tracking) """
     request = kwargs.get('request')
-    ip = get_real_ip(request)
+    ip = get_real_ip(request) or request.META.get('REMOTE_ADDR', None)
     if ip is not None:
-        user_prof = user.profile
-        user_prof.ip = ip
-        user_prof.save(update_fields=['ip'])
-    else:
-        ip = request.META.get('REMOTE_ADDR', None)
-        if ip is not None:
-            user_prof = user.profile
-            user_prof.ip = ip
-            user_prof.save(update_fields=['ip'])
+        login_ip_buffer.record(user.pk, ip)
+
+
+def expected_api_key(user, profile):
+    """ Api key profile should hold: kept (or generated) when registered for waves_api use, removed otherwise """
+    if not user.is_active:
+        return profile.api_key
+    if profile.registered_for_api or user.is_staff or user.is_superuser:
+        return profile.api_key or new_api_key()
+    return None
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
-def profile_post_save_handler(sender, instance, created, **kwargs):
-    """ Post save handler for Auth user model (create default UserProfile if needed) """
-    if created:
-        # Create the profile object, only if it is newly created
-        profile = UserProfile(user=instance)
+def profile_post_save_handler(sender, instance, created, update_fields=None, **kwargs):
+    """ Post save handler for Auth user model (create default UserProfile if needed), profile is saved only when
+    created or when its api_key changes """
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    try:
+        profile = UserProfile(user=instance) if created else instance.profile
+    except UserProfile.DoesNotExist:
+        created, profile = True, UserProfile(user=instance)
+    api_key = expected_api_key(instance, profile)
+    if created or api_key != profile.api_key:
+        profile.api_key = api_key
         profile.save()
-    if instance.is_active and instance.profile.registered_for_api and not instance.profile.api_key:
-        # User is activated, has registered for waves_api services, and do not have any api_key
-        instance.profile.api_key = uuid.uuid1()
-    if instance.is_active and not instance.profile.registered_for_api:
-        instance.profile.api_key = None
-    instance.profile.save()
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def api_key_cache_profile_handler(sender, instance, **kwargs):
+    """ Drop cached api key for changed profile (api_key, banned), except for ip only updates """
+    update_fields = kwargs.get('update_fields')
+    if not update_fields or not set(update_fields) <= {'ip'}:
+        api_key_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def api_key_cache_user_handler(sender, instance, **kwargs):
+    """ Drop cached api key for changed user (is_active, is_staff...), except for last_login only updates """
+    update_fields = kwargs.get('update_fields')
+    if not update_fields or not set(update_fields) <= {'last_login'}:
+        api_key_cache.invalidate(instance.pk)
 
 
 @receiver(post_delete, sender=UserProfile)
@@ -1,14 +1,26 @@
 """ Tests profiles """
 from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+
 from django.contrib.auth import get_user_model
 from django.core import mail
-from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils.six import StringIO
 from os.path import join, dirname
 
 # Create your tests here.
 from django.urls import reverse
 from django.conf import settings
 from accounts.views import SignUpView
+from waves.wcore.models import Job
+
+from profiles.auth import APIKeyAuthBackend, api_key_cache
+from profiles.deletion import pending_deletions, request_deletion, run_deletion
+from profiles.models import AccountDeletion, UserProfile
+from profiles.tracking import LoginIPBuffer
 
 User = get_user_model()
 
@@ -35,3 +47,130 @@ class ProfileTestCase(TestCase):
         u.profile.registered_for_api = True
         u.save()
         self.assertIsNotNone(u.profile.api_key)
+
+    def test_profile_saved_only_on_api_key_change(self):
+        User.objects.create_user(email="dummy@example.com")
+        u = User.objects.get(email="dummy@example.com")
+        with self.assertNumQueries(1):
+            u.save(update_fields=['last_login'])
+        u.name = 'New name'
+        with self.assertNumQueries(2):
+            u.save()
+        u.profile.registered_for_api = True
+        with self.assertNumQueries(2):
+            u.save()
+        self.assertIsNotNone(UserProfile.objects.get(pk=u.pk).api_key)
+
+    def test_bulk_api_keys(self):
+        users = [User.objects.create_user(email="bulk%i@example.com" % i) for i in range(5)]
+        UserProfile.objects.filter(user__in=users).update(registered_for_api=True)
+        with self.assertNumQueries(2):
+            self.assertEqual(UserProfile.objects.generate_api_keys(users), 5)
+        keys = set(UserProfile.objects.filter(user__in=users).values_list('api_key', flat=True))
+        self.assertEqual(len(keys), 5)
+        self.assertNotIn(None, keys)
+
+
+class APIKeyAuthTestCase(TestCase):
+
+    def setUp(self):
+        api_key_cache.clear()
+        self.user = User.objects.create_user(email="api@example.com")
+        self.user.profile.registered_for_api = True
+        self.user.save()
+        self.api_key = User.objects.get(pk=self.user.pk).profile.api_key
+        self.request = RequestFactory().get('/api/', {'api_key': self.api_key})
+
+    def test_cached_authentication(self):
+        user, _ = APIKeyAuthBackend().authenticate(self.request)
+        self.assertEqual(user.pk, self.user.pk)
+        with self.assertNumQueries(0):
+            for _ in range(10):
+                user, _ = APIKeyAuthBackend().authenticate(self.request)
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_banned_invalidates_cache(self):
+        APIKeyAuthBackend().authenticate(self.request)
+        profile = User.objects.get(pk=self.user.pk).profile
+        profile.banned = True
+        profile.save()
+        self.assertEqual(APIKeyAuthBackend().authenticate(self.request), (None, None))
+
+
+@override_settings(LOGIN_IP_FLUSH_INTERVAL=60)
+class LoginIPBufferTestCase(TestCase):
+
+    def setUp(self):
+        self.buffer = LoginIPBuffer(max_size=2)
+        self.users = [User.objects.create_user(email="ip%i@example.com" % i) for i in range(3)]
+
+    def tearDown(self):
+        self.buffer.stop()
+
+    def test_write_behind(self):
+        self.assertTrue(self.buffer.record(self.users[0].pk, '10.0.0.1'))
+        self.assertTrue(self.buffer.record(self.users[1].pk, '10.0.0.2'))
+        self.assertFalse(self.buffer.record(self.users[2].pk, '10.0.0.3'))
+        self.assertIsNone(UserProfile.objects.get(pk=self.users[0].pk).ip)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(UserProfile.objects.get(pk=self.users[1].pk).ip, '10.0.0.2')
+        # unchanged address is not buffered again
+        self.assertFalse(self.buffer.record(self.users[0].pk, '10.0.0.1'))
+        self.assertEqual((self.buffer.buffered, self.buffer.flushed, self.buffer.dropped), (2, 2, 1))
+
+
+@override_settings(LOGIN_IP_FLUSH_INTERVAL=0)
+class AccountDeletionTestCase(TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp(prefix='waves_demo_test_')
+        self.settings = override_settings(
+            MEDIA_ROOT=self.data_dir,
+            WAVES_CORE=dict(getattr(settings, 'WAVES_CORE', {}), JOB_BASE_DIR=os.path.join(self.data_dir, 'jobs')))
+        self.settings.enable()
+        self.user = User.objects.create_user(email="deleted@example.com", password='password')
+        self.user.profile.registered_for_api = True
+        self.user.save()
+        self.jobs = [Job.objects.create(service='Test', title='Test job %i' % i, client=self.user) for i in range(3)]
+        self.other_job = Job.objects.create(service='Test', title='Other job')
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def test_deletion_in_background(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('profiles:edit_self'), {'delete_profile': 'on'})
+        deletion = AccountDeletion.objects.get(user=self.user)
+        status_url = reverse('profiles:deletion_status', kwargs={'slug': deletion.slug})
+        self.assertRedirects(response, status_url)
+        # account disabled at once, jobs deleted later
+        profile = UserProfile.objects.select_related('user').get(pk=self.user.pk)
+        self.assertFalse(profile.user.is_active)
+        self.assertIsNone(profile.api_key)
+        self.assertEqual((deletion.jobs_total, deletion.progress), (3, 0))
+        self.assertEqual(Job.objects.count(), 4)
+        self.assertEqual(self.client.get(status_url).status_code, 200)
+
+        deletion = run_deletion(deletion.pk, batch=2)
+        self.assertIsNotNone(deletion.finished)
+        self.assertEqual((deletion.jobs_deleted, deletion.progress), (3, 100))
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertEqual(list(Job.objects.all()), [self.other_job])
+        self.assertFalse(any(os.path.isdir(job.working_dir) for job in self.jobs))
+        self.assertTrue(os.path.isdir(self.other_job.working_dir))
+        self.assertContains(self.client.get(status_url), '100%')
+
+    def test_interrupted_deletion_finished(self):
+        deletion = request_deletion(self.user)
+        # run interrupted once user was deleted
+        self.user.delete()
+        out = StringIO()
+        call_command('process_deletions', stdout=out)
+        deletion.refresh_from_db()
+        self.assertIsNone(deletion.user)
+        self.assertIsNotNone(deletion.finished)
+        self.assertEqual(deletion.progress, 100)
+        self.assertFalse(pending_deletions().exists())
+        self.assertIn(str(deletion), out.getvalue())
@@ -0,0 +1,112 @@
+""" Users login IP addresses tracking
+
+IP addresses recorded upon login are kept in an in memory write-behind buffer, a background thread writes changed
+ones every LOGIN_IP_FLUSH_INTERVAL seconds (and at process exit) with one UPDATE per batch. With an interval set to 0,
+addresses are written synchronously.
+"""
+from __future__ import unicode_literals
+
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, connection, models
+from django.db.models import Case, Value, When
+
+from profiles.models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['LoginIPBuffer', 'login_ip_buffer']
+
+
+class LoginIPBuffer(object):
+    """ Write-behind buffer for profiles IP addresses, counts buffered, flushed and dropped writes """
+    #: Max profiles updated per UPDATE statement
+    batch_size = 500
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._pending = {}
+        self._written = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.buffered = self.flushed = self.dropped = 0
+
+    @property
+    def interval(self):
+        return getattr(settings, 'LOGIN_IP_FLUSH_INTERVAL', 10)
+
+    def record(self, user_id, ip):
+        """ Record ip for user profile, return False if write is unchanged or dropped (buffer full) """
+        if self.interval <= 0:
+            UserProfile.objects.filter(pk=user_id).update(ip=ip)
+            self.flushed += 1
+            return True
+        with self._lock:
+            if user_id not in self._pending:
+                if self._written.get(user_id) == ip:
+                    return False
+                if len(self._pending) >= self.max_size:
+                    self.dropped += 1
+                    return False
+            self._pending[user_id] = ip
+            self.buffered += 1
+        self.start()
+        return True
+
+    def flush(self):
+        """ Write pending addresses, return number of updated profiles """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        items = list(pending.items())
+        written = 0
+        for i in range(0, len(items), self.batch_size):
+            batch = dict(items[i:i + self.batch_size])
+            try:
+                UserProfile.objects.filter(pk__in=list(batch.keys())).update(
+                    ip=Case(*[When(pk=user_id, then=Value(ip)) for user_id, ip in batch.items()],
+                            output_field=models.GenericIPAddressField()))
+            except DatabaseError:
+                logger.exception('Unable to save %i login ip addresses', len(batch))
+                self.dropped += len(batch)
+                continue
+            written += len(batch)
+            with self._lock:
+                if len(self._written) > self.max_size:
+                    self._written.clear()
+                self._written.update(batch)
+        self.flushed += written
+        return written
+
+    def start(self):
+        """ Start background flush thread if not running """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='login-ip-buffer')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def stop(self):
+        """ Stop background thread and write pending addresses """
+        self._stop.set()
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            finally:
+                connection.close()
+
+    def __len__(self):
+        return len(self._pending)
+
+
+login_ip_buffer = LoginIPBuffer()
+atexit.register(login_ip_buffer.stop)
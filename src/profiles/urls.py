@@ -8,6 +8,8 @@ from . import views
 urlpatterns = [
     url(r'^me$', views.ShowProfile.as_view(), name='show_self'),
     url(r'^me/edit$', views.EditProfile.as_view(), name='edit_self'),
+    url(r'^deletion/(?P<slug>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})$',
+        views.DeletionStatus.as_view(), name='deletion_status'),
     url(r'^(?P<slug>[\w\-]+)$', views.ShowProfile.as_view(),
         name='show'),
 ]
@@ -7,6 +7,7 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.views import generic
 import models
 from forms import UserForm, FrontUserForm, FrontProfileForm, ProfileForm
+from deletion import request_deletion
 
 
 class ShowProfile(LoginRequiredMixin, generic.TemplateView):
@@ -43,11 +44,10 @@ class EditProfile(LoginRequiredMixin, generic.TemplateView):
 
     def post(self, request, *args, **kwargs):
         if request.POST.get('delete_profile'):
-            user = self.request.user
-            user.delete()
+            deletion = request_deletion(self.request.user)
             logout(request)
-            messages.success(request, 'Your profile has been deleted !')
-            return redirect('home')
+            messages.success(request, 'Your profile is being deleted !')
+            return redirect('profiles:deletion_status', slug=deletion.slug)
         user = self.request.user
         user_form = UserForm(request.POST, instance=user)
         profile_form = FrontProfileForm(request.POST,
@@ -68,3 +68,11 @@ class EditProfile(LoginRequiredMixin, generic.TemplateView):
         profile.save()
         messages.success(request, "Profile details saved!")
         return redirect("profiles:show_self")
+
+
+class DeletionStatus(generic.DetailView):
+    """ WAVES user account deletion progress page """
+    template_name = "profiles/deletion_status.html"
+    model = models.AccountDeletion
+    context_object_name = 'deletion'
+    http_method_names = ['get']
@@ -5,6 +5,21 @@ from waves_demo.settings.production import *
 LOGGING_CONFIG = None
 DEBUG = True
 
+# Demo daemon processes jobs operations in a worker pool (WAVES_DAEMON_WORKERS, 0 workers: sequential loop), only by
+# default on a database server: SQLite serializes writers, concurrent workers would mostly wait for its lock
+WAVES_DEMO = dict(WAVES_DEMO,
+                  WORKERS=env.int('WAVES_DAEMON_WORKERS',
+                                  0 if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3' else 8),
+                  WORKERS_PER_RUNNER=env.int('WAVES_DAEMON_WORKERS_PER_RUNNER', 2),
+                  OPERATION_TIMEOUT=env.int('WAVES_DAEMON_OPERATION_TIMEOUT', 300),
+                  # local jobs processed as soon as they end
+                  WATCH_JOB_DIRS=env.bool('WAVES_DAEMON_WATCH_JOB_DIRS', False),
+                  # several daemons (nodes) sharing the database
+                  LEASES=env.bool('WAVES_DAEMON_LEASES', False),
+                  LEASE_TTL=env.int('WAVES_DAEMON_LEASE_TTL', 60),
+                  LEASE_SHARDS=env.int('WAVES_DAEMON_LEASE_SHARDS', 0),
+                  LEASE_SHARD=env.int('WAVES_DAEMON_LEASE_SHARD', 0))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': True,
@@ -22,12 +22,21 @@ DEBUG = env.bool('DEBUG', False)
 DATABASES = {
     'default': env.db(default='sqlite:///' + BASE_DIR + '/waves.prod.sqlite3'),
 }
-# patch to use in memory database for testing
+# patch to use in memory database for testing, TEST_DATABASE_URL runs tests on another database (query plans checks
+# on a local PostgreSQL or MySQL)
 if 'test' in sys.argv:
-    DATABASES['default']['ENGINE'] = 'django.db.backends.sqlite3'
+    if env.str('TEST_DATABASE_URL', ''):
+        DATABASES['default'] = env.db('TEST_DATABASE_URL')
+    else:
+        DATABASES['default']['ENGINE'] = 'django.db.backends.sqlite3'
 
 REGISTRATION_SALT = env.str('REGISTRATION_SALT')
 
+# CACHE configuration, use a shared cache (memcache, redis...) when running several processes
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
 
 # Cache the templates in memory for speed-up
 loaders = [
@@ -136,6 +145,17 @@ WAVES_CORE = {
     ),
 }
 
+# WAVES DEMO (see demo.settings for available keys)
+# Login ip addresses are written in background every LOGIN_IP_FLUSH_INTERVAL seconds (0: synchronous writes)
+LOGIN_IP_FLUSH_INTERVAL = env.int('LOGIN_IP_FLUSH_INTERVAL', 10)
+# Deleted accounts jobs are deleted in background by batches of ACCOUNT_DELETION_BATCH jobs (see profiles.deletion)
+ACCOUNT_DELETION_BATCH = env.int('ACCOUNT_DELETION_BATCH', 100)
+
+WAVES_DEMO = {
+    'HISTORY_BUFFERED': env.bool('WAVES_HISTORY_BUFFERED', False),
+    'JOB_DIR_SHARD_DEPTH': env.int('WAVES_JOB_DIR_SHARD_DEPTH', 0),
+}
+
 REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'] = (
     'rest_framework.authentication.TokenAuthentication',
     'rest_framework.authentication.BasicAuthentication',